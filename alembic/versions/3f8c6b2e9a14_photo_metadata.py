@@ -0,0 +1,44 @@
+"""photo metadata
+
+Adds the columns filled from the image header on upload. Existing photos are
+filled in by scripts/backfill_photo_metadata.py.
+
+Revision ID: 3f8c6b2e9a14
+Revises: 7d2a4f9b1e58
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f8c6b2e9a14'
+down_revision: Union[str, None] = '7d2a4f9b1e58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('photos', sa.Column('mime_type', sqlmodel.sql.sqltypes.AutoString(length=32), nullable=True))
+    op.add_column('photos', sa.Column('width', sa.Integer(), nullable=True))
+    op.add_column('photos', sa.Column('height', sa.Integer(), nullable=True))
+    op.add_column('photos', sa.Column('time_taken', sa.DateTime(), nullable=True))
+    op.add_column('photos', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('photos', sa.Column('longitude', sa.Float(), nullable=True))
+    op.create_index('ix_photos_user_id_time_taken', 'photos', ['user_id', 'time_taken'], unique=False)
+    op.create_index('ix_photos_latitude_longitude', 'photos', ['latitude', 'longitude'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_photos_latitude_longitude', table_name='photos')
+    op.drop_index('ix_photos_user_id_time_taken', table_name='photos')
+    op.drop_column('photos', 'longitude')
+    op.drop_column('photos', 'latitude')
+    op.drop_column('photos', 'time_taken')
+    op.drop_column('photos', 'height')
+    op.drop_column('photos', 'width')
+    op.drop_column('photos', 'mime_type')
@@ -0,0 +1,42 @@
+"""add generation jobs
+
+Revision ID: 4a7e2c9d1b35
+Revises: b628c9e9e3d3
+Create Date: 2026-10-19 12:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4a7e2c9d1b35'
+down_revision: Union[str, None] = 'b628c9e9e3d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('generation_jobs',
+    sa.Column('job_id', sa.Uuid(), nullable=False),
+    sa.Column('user_id', sa.Uuid(), nullable=False),
+    sa.Column('status', sqlmodel.sql.sqltypes.AutoString(length=16), nullable=False),
+    sa.Column('photo_ids', sa.Text(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('journal_id', sa.Uuid(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('time_created', sa.DateTime(), nullable=False),
+    sa.Column('time_modified', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['journal_id'], ['journals.journal_id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('job_id')
+    )
+    op.create_index(op.f('ix_generation_jobs_user_id'), 'generation_jobs', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_generation_jobs_user_id'), table_name='generation_jobs')
+    op.drop_table('generation_jobs')
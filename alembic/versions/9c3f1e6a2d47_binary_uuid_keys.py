@@ -0,0 +1,82 @@
+"""binary uuid keys
+
+Converts every UUID primary and foreign key from CHAR(32) hex to BINARY(16)
+on MySQL, rewriting the stored values with UNHEX. Other databases keep
+CHAR(32) (see database.BinaryUUID) and are left untouched.
+
+Foreign keys are dropped for the conversion and recreated with their
+original names. Take a backup first: every table is rewritten.
+
+Revision ID: 9c3f1e6a2d47
+Revises: 4a7e2c9d1b35
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3f1e6a2d47'
+down_revision: Union[str, None] = '4a7e2c9d1b35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+UUID_COLUMNS = {
+    'users': ['user_id'],
+    'devices': ['device_id', 'user_id'],
+    'journals': ['journal_id', 'user_id'],
+    'photos': ['photo_id', 'user_id', 'journal_id', 'device_id'],
+    'entries': ['entry_id', 'user_id', 'journal_id', 'device_id'],
+    'generation_jobs': ['job_id', 'user_id', 'journal_id'],
+}
+
+
+def _drop_foreign_keys():
+    inspector = sa.inspect(op.get_bind())
+    dropped = []
+    for table in UUID_COLUMNS:
+        for fk in inspector.get_foreign_keys(table):
+            op.drop_constraint(fk['name'], table, type_='foreignkey')
+            dropped.append((table, fk))
+    return dropped
+
+
+def _create_foreign_keys(dropped):
+    for table, fk in dropped:
+        op.create_foreign_key(fk['name'], table, fk['referred_table'], fk['constrained_columns'],
+                              fk['referred_columns'])
+
+
+def _convert(column_type: str, staging_type: str, expression: str):
+    """MODIFY every uuid column to ``staging_type``, rewrite it with ``expression``, then MODIFY to ``column_type``."""
+    inspector = sa.inspect(op.get_bind())
+    for table, columns in UUID_COLUMNS.items():
+        nullable = {column['name']: column['nullable'] for column in inspector.get_columns(table)}
+
+        def modify(sql_type):
+            return ', '.join(f"MODIFY `{name}` {sql_type} {'NULL' if nullable[name] else 'NOT NULL'}" for name in columns)
+
+        op.execute(f"ALTER TABLE `{table}` {modify(staging_type)}")
+        op.execute(f"UPDATE `{table}` SET " + ', '.join(f"`{name}` = {expression.format(name=f'`{name}`')}"
+                                                         for name in columns))
+        op.execute(f"ALTER TABLE `{table}` {modify(column_type)}")
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    dropped = _drop_foreign_keys()
+    # VARBINARY holds both the ascii hex and the 16 raw bytes, so the rewrite happens in place
+    _convert('BINARY(16)', 'VARBINARY(36)', "UNHEX(REPLACE({name}, '-', ''))")
+    _create_foreign_keys(dropped)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    dropped = _drop_foreign_keys()
+    _convert('CHAR(32)', 'VARBINARY(32)', "LOWER(HEX({name}))")
+    _create_foreign_keys(dropped)
@@ -0,0 +1,27 @@
+"""photo phash
+
+Revision ID: b4e9c7a1d305
+Revises: 3f8c6b2e9a14
+Create Date: 2026-10-19 16:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4e9c7a1d305'
+down_revision: Union[str, None] = '3f8c6b2e9a14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('photos', sa.Column('phash', sqlmodel.sql.sqltypes.AutoString(length=16), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('photos', 'phash')
@@ -0,0 +1,44 @@
+"""add photo embeddings
+
+Revision ID: c7a3e1f5d924
+Revises: b4e9c7a1d305
+Create Date: 2026-10-19 17:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7a3e1f5d924'
+down_revision: Union[str, None] = 'b4e9c7a1d305'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# database.BinaryUUID
+UUID = sa.CHAR(32).with_variant(mysql.BINARY(16), 'mysql')
+
+
+def upgrade() -> None:
+    op.create_table('photo_embeddings',
+    sa.Column('photo_id', UUID, nullable=False),
+    sa.Column('user_id', UUID, nullable=False),
+    sa.Column('model', sqlmodel.sql.sqltypes.AutoString(length=64), nullable=False),
+    sa.Column('description_hash', sqlmodel.sql.sqltypes.AutoString(length=40), nullable=False),
+    sa.Column('vector', sa.LargeBinary(), nullable=False),
+    sa.Column('scale', sa.Float(), nullable=False),
+    sa.Column('time_embedded', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['photo_id'], ['photos.photo_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('photo_id')
+    )
+    op.create_index(op.f('ix_photo_embeddings_user_id'), 'photo_embeddings', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_photo_embeddings_user_id'), table_name='photo_embeddings')
+    op.drop_table('photo_embeddings')
@@ -0,0 +1,25 @@
+"""photo time_modified index
+
+Revision ID: d2f6a8c4b197
+Revises: c7a3e1f5d924
+Create Date: 2026-10-19 18:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2f6a8c4b197'
+down_revision: Union[str, None] = 'c7a3e1f5d924'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_photos_user_id_time_modified', 'photos', ['user_id', 'time_modified'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_photos_user_id_time_modified', table_name='photos')
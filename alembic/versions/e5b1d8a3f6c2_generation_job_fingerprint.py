@@ -0,0 +1,29 @@
+"""generation job fingerprint
+
+Revision ID: e5b1d8a3f6c2
+Revises: 9c3f1e6a2d47
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b1d8a3f6c2'
+down_revision: Union[str, None] = '9c3f1e6a2d47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('generation_jobs', sa.Column('fingerprint', sqlmodel.sql.sqltypes.AutoString(length=64), nullable=True))
+    op.create_index(op.f('ix_generation_jobs_fingerprint'), 'generation_jobs', ['fingerprint'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_generation_jobs_fingerprint'), table_name='generation_jobs')
+    op.drop_column('generation_jobs', 'fingerprint')
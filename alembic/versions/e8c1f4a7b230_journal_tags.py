@@ -0,0 +1,53 @@
+"""journal tags
+
+Adds journals.is_public and the tags / journal_tags tables.
+
+Revision ID: e8c1f4a7b230
+Revises: d2f6a8c4b197
+Create Date: 2026-10-19 19:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8c1f4a7b230'
+down_revision: Union[str, None] = 'd2f6a8c4b197'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# database.BinaryUUID
+UUID = sa.CHAR(32).with_variant(mysql.BINARY(16), 'mysql')
+
+
+def upgrade() -> None:
+    op.add_column('journals', sa.Column('is_public', sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.create_table('tags',
+    sa.Column('tag_id', UUID, nullable=False),
+    sa.Column('user_id', UUID, nullable=False),
+    sa.Column('name', sqlmodel.sql.sqltypes.AutoString(length=64), nullable=False),
+    sa.Column('journal_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('tag_id'),
+    sa.UniqueConstraint('user_id', 'name', name='uq_tags_user_id_name')
+    )
+    op.create_table('journal_tags',
+    sa.Column('journal_id', UUID, nullable=False),
+    sa.Column('tag_id', UUID, nullable=False),
+    sa.ForeignKeyConstraint(['journal_id'], ['journals.journal_id'], ),
+    sa.ForeignKeyConstraint(['tag_id'], ['tags.tag_id'], ),
+    sa.PrimaryKeyConstraint('journal_id', 'tag_id')
+    )
+    op.create_index('ix_journal_tags_tag_id_journal_id', 'journal_tags', ['tag_id', 'journal_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_journal_tags_tag_id_journal_id', table_name='journal_tags')
+    op.drop_table('journal_tags')
+    op.drop_table('tags')
+    op.drop_column('journals', 'is_public')
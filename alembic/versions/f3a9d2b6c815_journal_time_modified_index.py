@@ -0,0 +1,25 @@
+"""journal time_modified index
+
+Revision ID: f3a9d2b6c815
+Revises: e8c1f4a7b230
+Create Date: 2026-10-19 20:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a9d2b6c815'
+down_revision: Union[str, None] = 'e8c1f4a7b230'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_journals_user_id_time_modified', 'journals', ['user_id', 'time_modified'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_journals_user_id_time_modified', table_name='journals')
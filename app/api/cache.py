@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+from uuid import UUID
+
+from fastapi import Request, Response
+
+from database import on_user_write, use_write_store, wrote_recently
+
+CACHE_URL = os.getenv("CACHE_URL")
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "4096"))
+
+
+class LRUBackend:
+    """
+    In-process cache backend: a bounded LRU of bytes values with per-entry TTL.
+    Counters (user versions) are kept apart from the LRU so they are never evicted.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, clock=time.monotonic):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: int):
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+
+class RedisBackend:
+    """
+    Shared cache backend on top of a redis-py compatible client (redis.Redis,
+    fakeredis.FakeRedis). Lets several workers share cached pages and versions.
+    """
+
+    def __init__(self, client, prefix: str = "vmbook:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: int):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def get_counter(self, key: str) -> int:
+        value = self.client.get(self.prefix + key)
+        return int(value) if value is not None else 0
+
+    def incr(self, key: str) -> int:
+        return int(self.client.incr(self.prefix + key))
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + "*"):
+            self.client.delete(key)
+
+
+class ResponseCache:
+    """
+    Per-user response cache. Every key embeds the user's current version, so a
+    version bump after a write makes all of that user's cached pages unreachable
+    at once; stale entries simply age out of the backend.
+    """
+
+    def __init__(self, backend, ttl: int = CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+
+    def version(self, user_id: UUID) -> int:
+        return self.backend.get_counter(f"version:{user_id}")
+
+    def bump(self, user_ids: Iterable[UUID]):
+        for user_id in user_ids:
+            self.backend.incr(f"version:{user_id}")
+
+    def key(self, namespace: str, user_id: UUID, params: Dict[str, Any]) -> str:
+        return f"{namespace}:{user_id}:v{self.version(user_id)}:{normalize_params(params)}"
+
+    def get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        value = self.backend.get(key)
+        if value is None:
+            return None
+        etag, _, body = value.partition(b"\n")
+        return etag.decode(), body
+
+    def set(self, key: str, body: bytes) -> str:
+        etag = make_etag(body)
+        self.backend.set(key, etag.encode() + b"\n" + body, self.ttl)
+        return etag
+
+
+def normalize_params(params: Dict[str, Any]) -> str:
+    """
+    Digest of the query parameters with unset values dropped and keys sorted, so
+    that equivalent requests share a cache key.
+    """
+    normalized = {key: value for key, value in params.items() if value is not None}
+    raw = json.dumps(normalized, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # weak comparison, as required for If-None-Match
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def create_backend(url: Optional[str] = CACHE_URL):
+    if url:
+        import redis
+        return RedisBackend(redis.Redis.from_url(url))
+    return LRUBackend()
+
+
+response_cache = ResponseCache(create_backend())
+on_user_write(response_cache.bump)
+# read-after-write routing must see writes handled by the other workers
+use_write_store(response_cache.backend)
+
+
+def cached_response(request: Request, namespace: str, user_id: UUID, params: Dict[str, Any], render,
+                    headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Serve a per-user listing from the response cache.
+
+    Args:
+        request (Request): The incoming request, used for If-None-Match.
+        namespace (str): The name of the listing, e.g. "journals".
+        user_id (UUID): The owner of the listing.
+        params (Dict[str, Any]): The query parameters that shape the listing.
+        render (Callable[[], bytes]): Produces the JSON body on a cache miss.
+        headers (Optional[Dict[str, str]]): Extra headers to send, e.g. X-Total-Count.
+
+    Returns:
+        Response: The JSON body with an ETag, or an empty 304 if the client's copy is current.
+    """
+    key = response_cache.key(namespace, user_id, params)
+    cached = response_cache.get(key)
+    if cached is None:
+        body = render()
+        if getattr(request.state, "read_replica", False) and wrote_recently(user_id):
+            # written since the session picked the replica, which may not have the write yet
+            etag = make_etag(body)
+        else:
+            etag = response_cache.set(key, body)
+    else:
+        etag, body = cached
+
+    headers = {**(headers or {}), "ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,43 @@
+"""
+Device names of a user, for the ``device=`` filter of the photo listings.
+
+The name -> device ids map of each user is kept in the response cache backend,
+so workers sharing Redis share it, under a devices version of its own: only the
+device endpoints change it, through forget_device_names() after they commit,
+while photo uploads and other writes leave the map cached.
+"""
+import json
+from typing import Dict, List
+from uuid import UUID
+
+from sqlmodel import Session
+
+from database import Device as DeviceModel
+
+from .cache import response_cache
+
+
+def _key(user_id: UUID) -> str:
+    return f"device-names:{user_id}:v{response_cache.backend.get_counter(f'devices:{user_id}')}"
+
+
+def device_ids_by_name(session: Session, user_id: UUID) -> Dict[str, List[UUID]]:
+    """The ids of the user's devices by name; several devices may share a name."""
+    key = _key(user_id)
+    cached = response_cache.backend.get(key)
+    if cached is not None:
+        return {name: [UUID(device_id) for device_id in ids] for name, ids in json.loads(cached).items()}
+
+    names: Dict[str, List[UUID]] = {}
+    for device_id, name in session.query(DeviceModel.device_id, DeviceModel.device_name) \
+            .filter(DeviceModel.user_id == user_id).all():
+        if name is not None:
+            names.setdefault(name, []).append(device_id)
+    value = {name: [str(device_id) for device_id in ids] for name, ids in names.items()}
+    response_cache.backend.set(key, json.dumps(value).encode(), response_cache.ttl)
+    return names
+
+
+def forget_device_names(user_id: UUID):
+    """Drop the cached names of a user whose devices were created, renamed or deleted."""
+    response_cache.backend.incr(f"devices:{user_id}")
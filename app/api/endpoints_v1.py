@@ -1,12 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Form, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, UploadFile, File, Form, Query
 from fastapi.responses import FileResponse
 from fastapi.security import OAuth2PasswordBearer
 
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal, Tuple
 from sqlmodel import Session
-from database import get_db
-
-from .functions import hash_pwd, describe_image, generate_journal_func, get_title_from_journal
+from sqlalchemy import extract, func
+from sqlalchemy.orm import load_only, selectinload
+from database import get_db, get_read_db
+
+from .functions import hash_pwd, get_title_from_journal
+from .jobs import get_scheduler, describe_photo, QueueFull, SchedulerClosed
+from .cache import cached_response
+from .devices import device_ids_by_name, forget_device_names
+from .pagination import cached_total, count_rows, total_headers
+from .metrics import observe_external
+from .storage import get_bucket
+from .image_metadata import read_metadata
+from .phash import DuplicateIndex, MAX_DUPLICATE_DISTANCE, DUPLICATE_DISTANCE, dhash, keeper
+from .search import embed_saved, search_photos
+from .moments import MOMENT_MIN_PHOTOS, find_moments
+from .tags import parse_tags, set_journal_tags, tag_counts, tag_filter, untag_journals
+from .serialization import dumps
+from .serialization import FastJSONResponse, device_list, user_list, journal_list, photo_list
 from models import *
 from database import User as UserModel
 from database import Device as DeviceModel
@@ -14,21 +29,20 @@ from database import Journal as JournalModel
 from database import Photo as PhotoModel
 from database import Entry as EntryModel
 
-import shutil, json, os, sys
+import shutil, json, os, sys, asyncio
+from collections import Counter
 from uuid import UUID
 from pathlib import Path
-from dotenv import load_dotenv
 from jose import jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from uuid import uuid4
 
-load_dotenv()
-
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 STATIC_SERVER = os.getenv("STATIC_SERVER")
 STATIC_PATH = os.getenv("STATIC_PATH")
+GENERATION_TIMEOUT = float(os.getenv("GENERATION_TIMEOUT", "120"))
 
 router = APIRouter()
 
@@ -67,11 +81,20 @@ def save_upload_file(upload_file: UploadFile, destination: str):
         upload_file.file.close()
         return True
 
-import oss2
-from oss2.credentials import EnvironmentVariableCredentialsProvider
-auth = oss2.ProviderAuth(EnvironmentVariableCredentialsProvider())
 
-bucket = oss2.Bucket(auth, os.getenv('OSS_ENDPOINT'), os.getenv("OSS_BUCKET_NAME"))
+def parse_include(serializer, include: Optional[str]) -> List[str]:
+    """Validate an ``include=`` parameter against the relationships ``serializer`` can render."""
+    try:
+        return serializer.parse_include(include)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def eager_load(model, include: List[str]) -> list:
+    """
+    Loader options fetching each included relationship with one extra SELECT ... IN
+    query, however many rows the main query returns.
+    """
+    return [selectinload(getattr(model, relation)) for relation in include]
 
 """
 ------------------------------------------------------------------------------ 
@@ -120,18 +143,22 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
     return new_user
 
 # get user info by id
-@router.get("/users/{user_id}", response_model=UserResponse)
-def get_user(user_id: UUID, db: Session = Depends(get_db)):
-    user = db.query(UserModel).filter(UserModel.user_id == user_id).first()
+@router.get("/users/{user_id}", response_model=UserDetailResponse)
+def get_user(user_id: UUID, db: Session = Depends(get_read_db),
+             include: str = Query(None, description="Comma-separated relationships to include: devices")):
+    include = parse_include(user_list, include)
+    user = db.query(UserModel).options(*eager_load(UserModel, include)).filter(UserModel.user_id == user_id).first()
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return FastJSONResponse(user_list.to_dicts([user], include=include)[0])
 
 # get all users
-@router.get("/users/", response_model=List[UserResponse])
-def get_users(db: Session = Depends(get_db)):
-    users = db.query(UserModel).all()
-    return users
+@router.get("/users/", response_model=List[UserDetailResponse])
+def get_users(db: Session = Depends(get_read_db),
+              include: str = Query(None, description="Comma-separated relationships to include: devices")):
+    include = parse_include(user_list, include)
+    users = db.query(UserModel).options(*eager_load(UserModel, include)).all()
+    return FastJSONResponse(user_list.to_dicts(users, include=include))
 
 
 # delete user
@@ -166,7 +193,7 @@ def update_user(user_id: UUID, user_update: UserUpdate, db: Session = Depends(ge
 
 # get user activities
 @router.get("/users/{user_id}/activities", response_model=List[ActivityResponse])
-def get_user_activities(user_id: UUID, db: Session = Depends(get_db)):
+def get_user_activities(user_id: UUID, db: Session = Depends(get_read_db)):
     user = db.query(UserModel).filter(UserModel.user_id == user_id).first()
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
@@ -193,19 +220,20 @@ def get_user_activities(user_id: UUID, db: Session = Depends(get_db)):
 """
 # get all devices from user by id
 @router.get("/users/{user_id}/devices", response_model=List[DeviceResponse])
-def get_user_devices(user_id: UUID, db: Session = Depends(get_db)):
+def get_user_devices(user_id: UUID, db: Session = Depends(get_read_db)):
     user = db.query(UserModel).filter(UserModel.user_id == user_id).first()
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return user.devices
+    devices = db.query(DeviceModel).filter(DeviceModel.user_id == user_id).all()
+    return FastJSONResponse(device_list.to_dicts(devices))
 
 # get details from a specific device of a user by id
 @router.get("/users/{user_id}/devices/{device_id}", response_model=DeviceResponse)
-def get_user_device(user_id: UUID, device_id: UUID, db: Session = Depends(get_db)):
+def get_user_device(user_id: UUID, device_id: UUID, db: Session = Depends(get_read_db)):
     user = db.query(UserModel).filter(UserModel.user_id == user_id).first()
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    device = db.query(DeviceModel).filter(DeviceModel.device_id == device_id).first()
+    device = db.query(DeviceModel).filter(DeviceModel.device_id == device_id, DeviceModel.user_id == user_id).first()
     if device is None:
         raise HTTPException(status_code=404, detail="Device not found")
     return device
@@ -219,23 +247,24 @@ def create_user_device(user_id: UUID, device: DeviceCreate, db: Session = Depend
     new_device = DeviceModel(**device.dict(), user_id=user_id)
     db.add(new_device)
     db.commit()
+    forget_device_names(user_id)
     db.refresh(new_device)
     return new_device
 
 
 # update a device for a user by id
 @router.put("/users/{user_id}/devices/{device_id}", response_model=DeviceResponse)
-def update_user_device(user_id: UUID, device_id: UUID, device: DeviceUpdate, db: Session = Depends(get_db)):
+def update_user_device(user_id: UUID, device_id: UUID, device_update: DeviceUpdate, db: Session = Depends(get_db)):
     user = db.query(UserModel).filter(UserModel.user_id == user_id).first()
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    device = db.query(DeviceModel).filter(DeviceModel.device_id == device_id).first()
+    device = db.query(DeviceModel).filter(DeviceModel.device_id == device_id, DeviceModel.user_id == user_id).first()
     if device is None:
         raise HTTPException(status_code=404, detail="Device not found")
-    for key, value in device.dict().items():
-        if key in device.dict(exclude_unset=False):
-            setattr(device, key, value)
+    for key, value in device_update.dict(exclude_unset=True).items():
+        setattr(device, key, value)
     db.commit()
+    forget_device_names(user_id)
     db.refresh(device)
     
     return device
@@ -246,11 +275,12 @@ def delete_user_device(user_id: UUID, device_id: UUID, db: Session = Depends(get
     user = db.query(UserModel).filter(UserModel.user_id == user_id).first()
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    device = db.query(DeviceModel).filter(DeviceModel.device_id == device_id).first()
+    device = db.query(DeviceModel).filter(DeviceModel.device_id == device_id, DeviceModel.user_id == user_id).first()
     if device is None:
         raise HTTPException(status_code=404, detail="Device not found")
     db.delete(device)
     db.commit()
+    forget_device_names(user_id)
     return {"message": "Device deleted successfully"}
 
 """
@@ -258,8 +288,8 @@ def delete_user_device(user_id: UUID, device_id: UUID, db: Session = Depends(get
                                 Journal endpoints                               
 ------------------------------------------------------------------------------
 """
-@router.get("/users/{user_id}/journals", response_model=List[JournalResponse])
-def get_user_journals(user_id: UUID, db: Session = Depends(get_db), 
+@router.api_route("/users/{user_id}/journals", methods=["GET", "HEAD"], response_model=List[JournalDetailResponse])
+def get_user_journals(user_id: UUID, request: Request, db: Session = Depends(get_read_db), 
                       limit: int = Query(10, description="Limit the number of journals returned", ge=1, le=100),
                       offset: int = Query(0, description="Offset the number of journals returned", ge=0),
                       is_public: bool = Query(None, description="Filter journals by public status"),
@@ -267,9 +297,13 @@ def get_user_journals(user_id: UUID, db: Session = Depends(get_db),
                       fromDate: datetime = Query(None, description="Filter journals by date"),
                       toDate: datetime = Query(None, description="Filter journals by date"),
                       contains: str = Query(None, description="Filter journals by content"),
-                      tags: str = Query(None, description="Filter journals by tags"),
+                      tags: str = Query(None, description="Comma-separated tags to filter journals by"),
+                      tags_match: Literal["any", "all"] = Query("any", description="Journals with any of the tags, or all of them"),
                       sortby: str = Query("time_modified", description="Sort journals by time_created or time_modified"),
-                      order: str = Query("desc", description="Order journals in ascending or descending order")
+                      order: str = Query("desc", description="Order journals in ascending or descending order"),
+                      fields: str = Query(None, description="Comma-separated fields to return, or 'summary' for a listing without descriptions"),
+                      include: str = Query(None, description="Comma-separated relationships to include: photos, entries"),
+                      include_total: bool = Query(False, description="Send the number of matching journals in X-Total-Count")
                       ):
     """
     Retrieve journals for a specific user based on the provided filters.
@@ -284,48 +318,101 @@ def get_user_journals(user_id: UUID, db: Session = Depends(get_db),
     - fromDate (datetime): Filter journals by date. Default is None.
     - toDate (datetime): Filter journals by date. Default is None.
     - contains (str): Filter journals by content. Default is None.
-    - tags (str): Filter journals by tags. Default is None.
+    - tags (str): Comma-separated tags; only journals with any of them (or all of them, see tags_match) are
+      returned. Default is None.
+    - tags_match (str): "any" or "all" of the tags. Default is any.
     - sortby (str): Sort journals by time_created or time_modified. Default is time_modified.
     - order (str): Order journals in ascending or descending order. Default is desc.
+    - fields (str): Comma-separated fields to return, or "summary" (see JournalSummary). Only the selected
+      columns are loaded, so list views can skip the LONGTEXT description. Default is all fields.
+    - include (str): Comma-separated relationships to embed: photos, entries. Each is fetched with a
+      single extra query for the whole page. Default is None.
+    - include_total (bool): Send the number of journals matching the filters in X-Total-Count (see
+      api/pagination.py). A HEAD request sends it without the page. Default is False.
 
     Returns:
     - List[JournalResponse]: A list of journal objects that match the provided filters.
+      Responses are cached per user and carry an ETag; a matching If-None-Match yields 304.
     
     Examples: 
-    GET /users/12345678-1234-5678-1234-567812345678/journals?limit=5&offset=0&is_public=true&fromDate=2021-01-01&toDate=2021-12-31&contains=vacation&tags=travel
+    GET /users/12345678-1234-5678-1234-567812345678/journals?limit=5&offset=0&is_public=true&fromDate=2021-01-01&toDate=2021-12-31&contains=vacation&tags=travel,food&tags_match=all
     """
     
     user = db.query(UserModel).filter(UserModel.user_id == user_id).first()
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    journals_query = db.query(JournalModel).filter(JournalModel.user_id == user_id)
+    try:
+        fields = journal_list.parse_fields(fields, JournalSummary, "journal_id")
+        tags = parse_tags(tags) if tags else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    include = parse_include(journal_list, include)
     
+    filters = dict(is_public=is_public, starred=starred, fromDate=fromDate, toDate=toDate, contains=contains,
+                   tags=tags, tags_match=tags_match)
+    headers = None
+    if include_total or request.method == "HEAD":
+        headers = total_headers(*cached_total(request, "journals", user_id, filters,
+                                              lambda: _count_user_journals(db, user_id, **filters)))
+        if request.method == "HEAD":
+            return Response(headers=headers)
+
+    params = dict(limit=limit, offset=offset, sortby=sortby, order=order, fields=fields, include=include, **filters)
+    return cached_response(request, "journals", user_id, params,
+                           lambda: _query_user_journals(db, user_id, **params), headers=headers)
+
+
+def _journal_filters(user_id: UUID, is_public, starred, fromDate, toDate, contains, tags, tags_match) -> list:
+    """The conditions of the get_user_journals filters"""
+    filters = [JournalModel.user_id == user_id]
     if is_public is not None:
-        journals_query = journals_query.filter(JournalModel.is_public == is_public)
-    
+        filters.append(JournalModel.is_public == is_public)
     if starred:
-        journals_query = journals_query.filter(JournalModel.starred == True)
-
+        filters.append(JournalModel.starred == True)
     if fromDate:
-        journals_query = journals_query.filter(JournalModel.time_modified >= fromDate)
-
+        filters.append(JournalModel.time_modified >= fromDate)
     if toDate:
-        journals_query = journals_query.filter(JournalModel.time_modified <= toDate)
-
+        filters.append(JournalModel.time_modified <= toDate)
     if contains:
-        journals_query = journals_query.filter(JournalModel.description.contains(contains))
-
+        filters.append(JournalModel.description.contains(contains))
     if tags:
-        journals_query = journals_query.filter(JournalModel.tags.contains(tags))
-        
+        filters.append(tag_filter(user_id, tags, match_all=tags_match == "all"))
+    return filters
+
+
+def _count_user_journals(db: Session, user_id: UUID, contains, **filters) -> Tuple[int, bool]:
+    # contains reads every description, the other filters are indexed
+    return count_rows(db, JournalModel.time_modified, _journal_filters(user_id, contains=None, **filters),
+                      [JournalModel.description.contains(contains)] if contains else [])
+
+
+def _query_user_journals(db: Session, user_id: UUID, limit, offset, is_public, starred, fromDate, toDate,
+                         contains, tags, tags_match, sortby, order, fields, include) -> bytes:
+    columns = [getattr(JournalModel, name) for name in fields if name in JournalModel.__table__.columns]
+    journals_query = db.query(JournalModel).options(load_only(*columns), *eager_load(JournalModel, include)) \
+        .filter(*_journal_filters(user_id, is_public, starred, fromDate, toDate, contains, tags, tags_match))
+
     filtered_journals = journals_query.order_by(
         getattr(JournalModel, f"{sortby}").asc() if order == "asc" else getattr(JournalModel, f"{sortby}").desc()
     ).offset(offset).limit(limit).all()
         
-    return filtered_journals
+    return journal_list.dump(filtered_journals, fields=fields, include=include)
+
 
 
+# tags of a user's journals with their counts
+@router.get("/users/{user_id}/tags", response_model=List[TagResponse])
+def get_user_tags(user_id: UUID, request: Request, db: Session = Depends(get_read_db)):
+    """
+    The tags on the user's journals, most used first, with the number of journals for each: a facet
+    for the tags= filter of GET /users/{user_id}/journals. The counts are kept on the tags as journals
+    are tagged and deleted, so this reads one row per tag.
+    """
+    if db.query(UserModel).filter(UserModel.user_id == user_id).first() is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return cached_response(request, "tags", user_id, {}, lambda: dumps(tag_counts(db, user_id)))
+
 
 # get all journals from user by id
 # @router.get("/users/{user_id}/journals", response_model=List[JournalResponse])
@@ -337,26 +424,34 @@ def get_user_journals(user_id: UUID, db: Session = Depends(get_db),
 
 # create a journal for a user by id
 @router.post("/users/{user_id}/journals", response_model=JournalResponse)
-def create_user_journal(user_id: UUID, journal: JournalCreate, db: Session = Depends(get_db)):
+def create_user_journal(user_id: UUID, journal_create: JournalCreate, db: Session = Depends(get_db)):
     if db.query(UserModel).filter(UserModel.user_id == user_id).first() is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    journal = JournalModel(**journal.dict(), user_id=user_id)
+    journal = JournalModel(**journal_create.dict(exclude={"tags"}), user_id=user_id)
     db.add(journal)
+    if journal_create.tags:
+        try:
+            set_journal_tags(db, journal, journal_create.tags)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     db.commit()
     db.refresh(journal)
     return journal
 
 # get details from a specific journal of a user by id
-@router.get("/users/{user_id}/journals/{journal_id}", response_model=JournalResponse)
-def get_user_journal(user_id: UUID, journal_id: UUID, db: Session = Depends(get_db)):
+@router.get("/users/{user_id}/journals/{journal_id}", response_model=JournalDetailResponse)
+def get_user_journal(user_id: UUID, journal_id: UUID, db: Session = Depends(get_read_db),
+                     include: str = Query(None, description="Comma-separated relationships to include: photos, entries")):
+    include = parse_include(journal_list, include)
     user = db.query(UserModel).filter(UserModel.user_id == user_id).first()
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    journal = db.query(JournalModel).filter((JournalModel.journal_id == journal_id) and (JournalModel.user_id == user_id)).first()
+    journal = db.query(JournalModel).options(*eager_load(JournalModel, include)) \
+        .filter(JournalModel.journal_id == journal_id, JournalModel.user_id == user_id).first()
     if journal is None:
         raise HTTPException(status_code=404, detail="Journal not found")
-    return journal
+    return FastJSONResponse(journal_list.to_dicts([journal], include=include)[0])
 
 # update a journal for a user by id
 @router.put("/users/{user_id}/journals/{journal_id}", response_model=JournalResponse)
@@ -372,6 +467,12 @@ def update_user_journal(user_id: UUID, journal_id: UUID, journal_update: Journal
     
     update_data = journal_update.dict(exclude_unset=True)  # Get only the fields that were set
     
+    if "tags" in update_data:
+        try:
+            set_journal_tags(db, journal, update_data.pop("tags") or [])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     if "description" in update_data:
         # update title if description is updated
         update_data["title"], update_data["description"] = get_title_from_journal(update_data["description"])
@@ -392,11 +493,12 @@ def delete_user_journal(user_id: UUID, journal_id: UUID, db: Session = Depends(g
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    journal = db.query(JournalModel).filter((JournalModel.journal_id == journal_id) and (JournalModel.user_id == user_id)).first()
+    journal = db.query(JournalModel).filter(JournalModel.journal_id == journal_id, JournalModel.user_id == user_id).first()
     
     if journal is None:
         raise HTTPException(status_code=404, detail="Journal not found")
     
+    untag_journals(db, [journal.journal_id])
     db.delete(journal)
     db.commit()
     return {"message": "Journal deleted successfully"}
@@ -431,35 +533,57 @@ def delete_user_journals(user_id: UUID, journal_ids: List[UUID], db: Session = D
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    journals = db.query(JournalModel).filter((JournalModel.journal_id.in_(journal_ids)) and (JournalModel.user_id == user_id)).all()
+    journals = db.query(JournalModel).filter(JournalModel.journal_id.in_(journal_ids), JournalModel.user_id == user_id).all()
     
-    assert len(journals) == len(journal_ids), f"{len(journal_ids) - len(journals)} journals not found"
+    if len(journals) != len(journal_ids):
+        raise HTTPException(status_code=404, detail=f"{len(journal_ids) - len(journals)} journals not found")
     
     if not journals:
         raise HTTPException(status_code=404, detail="Journals not found")
     
+    untag_journals(db, [journal.journal_id for journal in journals])
     for journal in journals:
         db.delete(journal)
     db.commit()
     return {"message": f"{len(journals)} journals deleted successfully"}
 
 
+async def submit_generation(user_id: UUID, photo_ids: List[UUID], regenerate: bool = False,
+                            collapse_duplicates: bool = False):
+    try:
+        return await get_scheduler().submit(user_id, photo_ids, regenerate=regenerate,
+                                            collapse_duplicates=collapse_duplicates)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except SchedulerClosed as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
 # generate journal from selected entries
 @router.post("/users/{user_id}/journals/generate", response_model=JournalResponse)
-async def generate_journal(user_id: UUID, body: Dict[str, Any], db: Session = Depends(get_db)):
+async def generate_journal(user_id: UUID, body: Dict[str, Any], regenerate: bool = False, db: Session = Depends(get_db)):
     """
     Generate a journal for a user based on selected photos.
+    
+    The generation runs as a job on the rate-limited scheduler (see jobs.py) and this request waits
+    for it; use POST /users/{user_id}/journals/generate/jobs to get a job id back immediately instead.
+    Asking again for the same photos, unchanged, returns the journal generated the first time
+    (or joins the generation still in progress); pass regenerate=true for a new one.
 
     Args:
         user_id (UUID): The ID of the user for whom the journal is being generated.
         photo_ids (List[UUID]): The IDs of the selected photos.
+        collapse_duplicates (bool, optional): Use one photo per group of near-duplicates (see
+            GET /users/{user_id}/photos/duplicates), saving captioning calls and prompt tokens.
+        regenerate (bool, optional): Generate a new journal even if one was generated from the same input.
         db (Session, optional): The database session. Defaults to Depends(get_db).
 
     Returns:
         JournalModel: The generated journal.
 
     Raises:
-        HTTPException: If the user is not found or no photos are selected.
+        HTTPException: If the user is not found or no photos are selected (400), too many generation jobs
+            are queued (429), the generation failed (502) or did not finish in time (504).
         
     Example:
     POST /users/12345678-1234-5678-1234-567812345678/journals/generate
@@ -473,30 +597,72 @@ async def generate_journal(user_id: UUID, body: Dict[str, Any], db: Session = De
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
+    if not body.get("photo_ids"):
+        raise HTTPException(status_code=400, detail="No photos selected")
     try:
         photo_ids = [UUID(id_str) for id_str in body.get("photo_ids")]
-    except KeyError:
-        raise HTTPException(status_code=400, detail="No photos selected")
+    except (TypeError, ValueError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid photo ids")
     
-    photos = db.query(PhotoModel).filter(PhotoModel.photo_id.in_(photo_ids)).order_by(PhotoModel.time_created.asc()).all()
+    job = await submit_generation(user_id, photo_ids, regenerate, bool(body.get("collapse_duplicates")))
+    try:
+        job = await get_scheduler().wait(job.job_id, timeout=GENERATION_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Journal generation is still running as job {job.job_id}")
+    if job.status != "succeeded":
+        raise HTTPException(status_code=502, detail=f"Failed to generate journal: {job.error}")
+    
+    return db.query(JournalModel).filter(JournalModel.journal_id == job.journal_id).first()
 
-    entries = []
-    for photo in photos:
-        if not photo.description:
-            photo.description = describe_image(photo.url)
-        entry = dict(time_created=photo.time_created, type="image", content=photo.description, url=photo.url)
-        entries.append(entry)
-        
-    title, journal = await generate_journal_func(entries)
 
-    
-    # save the generated journal in the database
-    new_journal = JournalModel(description=journal, user_id=user_id, title=title)
-    db.add(new_journal)
-    db.commit()
-    db.refresh(new_journal)
-    
-    return new_journal
+# queue a journal generation job
+@router.post("/users/{user_id}/journals/generate/jobs", response_model=GenerationJobResponse, status_code=202)
+async def create_generation_job(user_id: UUID, job_create: GenerationJobCreate, regenerate: bool = False,
+                                db: Session = Depends(get_db)):
+    """
+    Queue a journal generation job for the selected photos and return it immediately.
+    Poll GET /users/{user_id}/journals/generate/jobs/{job_id} until its status is
+    "succeeded" (journal_id is set) or "failed" (error is set). An identical request
+    gets the existing job back, already succeeded or still running, unless regenerate=true.
+    """
+    if db.query(UserModel).filter(UserModel.user_id == user_id).first() is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if not job_create.photo_ids:
+        raise HTTPException(status_code=400, detail="No photos selected")
+    return await submit_generation(user_id, job_create.photo_ids, regenerate, job_create.collapse_duplicates)
+
+
+# get the status of a journal generation job
+@router.get("/users/{user_id}/journals/generate/jobs/{job_id}", response_model=GenerationJobResponse)
+def get_generation_job(user_id: UUID, job_id: UUID):
+    job = get_scheduler().get(job_id)
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+
+# candidate journals: the user's photos grouped by time and place
+@router.get("/users/{user_id}/moments", response_model=List[MomentResponse])
+def get_user_moments(user_id: UUID, request: Request, db: Session = Depends(get_read_db),
+                     limit: int = Query(20, description="Limit the number of moments returned", ge=1, le=100),
+                     offset: int = Query(0, description="Offset the number of moments returned", ge=0),
+                     min_photos: int = Query(MOMENT_MIN_PHOTOS, description="Leave out smaller moments", ge=1),
+                     fromDate: datetime = Query(None, description="Only moments ending from this date"),
+                     toDate: datetime = Query(None, description="Only moments starting until this date")):
+    """
+    The user's photos grouped into moments, newest first: a new moment starts after a gap of a few hours
+    or when the location label or GPS position changes (see moments.py). Pass a moment's photo_ids to
+    POST /users/{user_id}/journals/generate to write its journal.
+
+    Example:
+    GET /users/12345678-1234-5678-1234-567812345678/moments?limit=10&min_photos=5
+    """
+    if db.query(UserModel).filter(UserModel.user_id == user_id).first() is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    params = dict(limit=limit, offset=offset, min_photos=min_photos, fromDate=fromDate, toDate=toDate)
+    return cached_response(request, "moments", user_id, params,
+                           lambda: dumps(find_moments(db, user_id, min_photos, fromDate, toDate, offset, limit)))
         
     
 # fake endpoint that receives a list of strings
@@ -519,17 +685,21 @@ def fake_endpoint(strings: List[str]):
 
 # get all photos from user by id
 # Added query parameters to filter photos 
-@router.get("/users/{user_id}/photos", response_model=List[PhotoResponse])
-def get_user_photos(user_id: UUID, db: Session = Depends(get_db), 
+@router.api_route("/users/{user_id}/photos", methods=["GET", "HEAD"], response_model=List[PhotoDetailResponse])
+def get_user_photos(user_id: UUID, request: Request, db: Session = Depends(get_read_db), 
                     limit: int = Query(10, description="Limit the number of photos returned", ge=1, le=100),
                     offset: int = Query(0, description="Offset the number of photos returned", ge=0),
                     starred: bool = Query(False, description="Filter photos by starred status"),
                     fromDate: datetime = Query(None, description="Filter photos by date"),
                     toDate: datetime = Query(None, description="Filter photos by date"),
-                    device: str = Query(None, description="Filter photos by device"),
+                    device: str = Query(None, description="Filter photos by device name"),
+                    device_id: List[UUID] = Query(None, description="Filter photos by device, repeat for several"),
                     contains: str = Query(None, description="Filter photos by description"),
-                    sortby: str = Query("time_modified", description="Sort photos by time_created or time_modified"),
-                    order: str = Query("desc", description="Order photos in ascending or descending order")):
+                    sortby: str = Query("time_modified", description="Sort photos by time_created, time_modified or time_taken"),
+                    order: str = Query("desc", description="Order photos in ascending or descending order"),
+                    fields: str = Query(None, description="Comma-separated fields to return, or 'summary' for a listing without descriptions"),
+                    include: str = Query(None, description="Comma-separated relationships to include: device, journal"),
+                    include_total: bool = Query(False, description="Send the number of matching photos in X-Total-Count")):
     """
     Retrieve photos for a specific user based on the provided filters.
 
@@ -541,13 +711,22 @@ def get_user_photos(user_id: UUID, db: Session = Depends(get_db),
     - starred (bool): Filter photos by starred status. Default is False.
     - fromDate (datetime): Filter photos by date. Default is None.
     - toDate (datetime): Filter photos by date. Default is None.
-    - device (str): Filter photos by device. Default is None.
+    - device (str): Filter photos by the name of one of the user's devices. Default is None.
+    - device_id (List[UUID]): Only photos from these devices; repeat the parameter for several. Default is None.
     - contains (str): Filter photos by description. Default is None.
-    - sortby (str): Sort photos by time_created or time_modified. Default is time_modified.
+    - sortby (str): Sort photos by time_created, time_modified or time_taken (when the photo was taken, from
+      its EXIF data, else when it was uploaded). Default is time_modified.
     - order (str): Order photos in ascending or descending order. Default is desc.
+    - fields (str): Comma-separated fields to return, or "summary" (see PhotoSummary). Only the selected
+      columns are loaded, so list views can skip the LONGTEXT description. Default is all fields.
+    - include (str): Comma-separated relationships to embed: device, journal. Each is fetched with a
+      single extra query for the whole page. Default is None.
+    - include_total (bool): Send the number of photos matching the filters in X-Total-Count (see
+      api/pagination.py). A HEAD request sends it without the page. Default is False.
 
     Returns:
     - List[PhotoResponse]: A list of photo objects that match the provided filters.
+      Responses are cached per user and carry an ETag; a matching If-None-Match yields 304.
     
     Examples: 
     GET /users/12345678-1234-5678-1234-567812345678/photos?limit=5&offset=0&starred=true&fromDate=2021-01-01&toDate=2021-12-31&device=iphone&contains=dog&sortby=time_created&order=asc
@@ -557,35 +736,78 @@ def get_user_photos(user_id: UUID, db: Session = Depends(get_db),
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    photos_query = db.query(PhotoModel).filter(PhotoModel.user_id == user_id)
+    try:
+        fields = photo_list.parse_fields(fields, PhotoSummary, "photo_id")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    include = parse_include(photo_list, include)
     
-    if starred:
-        photos_query = photos_query.filter(PhotoModel.starred == starred)
+    filters = dict(starred=starred, fromDate=fromDate, toDate=toDate, device=device,
+                   device_id=sorted(set(device_id)) if device_id else None, contains=contains)
+    headers = None
+    if include_total or request.method == "HEAD":
+        headers = total_headers(*cached_total(request, "photos", user_id, filters,
+                                              lambda: _count_user_photos(db, user_id, **filters)))
+        if request.method == "HEAD":
+            return Response(headers=headers)
+
+    params = dict(limit=limit, offset=offset, sortby=sortby, order=order, fields=fields, include=include, **filters)
+    return cached_response(request, "photos", user_id, params,
+                           lambda: _query_user_photos(db, user_id, **params), headers=headers)
+
+
+def _query_user_photos(db: Session, user_id: UUID, limit, offset, starred, fromDate, toDate, device, device_id,
+                       contains, sortby, order, fields, include) -> bytes:
+    # included many-to-one relationships are resolved from their foreign key columns
+    columns = [getattr(PhotoModel, name) for name in fields + [f"{relation}_id" for relation in include]
+               if name in PhotoModel.__table__.columns]
+    photos_query = db.query(PhotoModel).options(load_only(*columns), *eager_load(PhotoModel, include)) \
+        .filter(*_photo_filters(db, user_id, starred, fromDate, toDate, device, device_id, contains))
+
+    # photos without an EXIF capture time sort by their upload time
+    sort_column = func.coalesce(PhotoModel.time_taken, PhotoModel.time_created) if sortby == "time_taken" \
+        else getattr(PhotoModel, f"{sortby}")
+    filtered_photos = photos_query.order_by(
+            sort_column.asc() if order == "asc" else sort_column.desc()
+        ).offset(offset).limit(limit).all()
+
+    return photo_list.dump(filtered_photos, fields=fields, include=include)
 
-    if fromDate:
-        photos_query = photos_query.filter(PhotoModel.time_modified >= fromDate)
 
+def _photo_filters(db: Session, user_id: UUID, starred, fromDate, toDate, device, device_id, contains) -> list:
+    """The conditions of the get_user_photos filters, shared with the facets"""
+    filters = [PhotoModel.user_id == user_id]
+    if starred:
+        filters.append(PhotoModel.starred == starred)
+    if fromDate:
+        filters.append(PhotoModel.time_modified >= fromDate)
     if toDate:
-        photos_query = photos_query.filter(PhotoModel.time_modified <= toDate)
+        filters.append(PhotoModel.time_modified <= toDate)
+    device_ids = _device_ids(db, user_id, device, device_id)
+    if device_ids is not None:
+        filters.append(PhotoModel.device_id.in_(device_ids))
+    if contains:
+        filters.append(PhotoModel.description.contains(contains))
+    return filters
 
-    if device:
-        # device to device id
-        device = db.query(DeviceModel).filter(DeviceModel.device_name == device).first()
-        if device:
-            photos_query = photos_query.filter(PhotoModel.device_id == device.device_id)
-        else:
-            raise HTTPException(status_code=404, detail="Device not found")
 
-    if contains:
-        photos_query = photos_query.filter(PhotoModel.description.contains(contains))
+def _count_user_photos(db: Session, user_id: UUID, contains, **filters) -> Tuple[int, bool]:
+    # contains reads every description, the other filters are indexed
+    return count_rows(db, PhotoModel.time_modified, _photo_filters(db, user_id, contains=None, **filters),
+                      [PhotoModel.description.contains(contains)] if contains else [])
 
 
-    filtered_photos = photos_query.order_by(
-            getattr(PhotoModel, f"{sortby}").asc() if order == "asc" else getattr(PhotoModel, f"{sortby}").desc()
-        ).offset(offset).limit(limit).all()
+def _device_ids(db: Session, user_id: UUID, device: Optional[str],
+                device_id: Optional[List[UUID]]) -> Optional[List[UUID]]:
+    """The devices the photos may come from, or None for any"""
+    if not device:
+        return device_id or None
+    named = device_ids_by_name(db, user_id).get(device)
+    if named is None:
+        raise HTTPException(status_code=404, detail="Device not found")
+    return [i for i in named if i in device_id] if device_id else named
+
 
-    return filtered_photos
-    
 # create a photo for a user by id
 @router.post("/users/{user_id}/photos", response_model=PhotoResponse)
 def create_user_photo(user_id: UUID, photo_create: str = Form(...), image: UploadFile = File(...), db: Session = Depends(get_db)):
@@ -608,8 +830,16 @@ def create_user_photo(user_id: UUID, photo_create: str = Form(...), image: Uploa
     savepath = os.path.join(savedir, unique_filename)
     
     if image.file:
+        # header bytes only, before the upload reads the file
+        metadata = read_metadata(image.file)
+        phash = dhash(image.file)
+        image.file.seek(0, os.SEEK_END)
+        file_size = image.file.tell()
+        image.file.seek(0)
         try:
-            bucket.put_object(unique_filename, image.file)
+            bucket = get_bucket()
+            with observe_external("put_object"):
+                bucket.put_object(unique_filename, image.file)
             url = bucket.sign_url('GET', unique_filename, 3600, slash_safe=True).split('?')[0]
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Error saving file: {e}")
@@ -618,40 +848,196 @@ def create_user_photo(user_id: UUID, photo_create: str = Form(...), image: Uploa
         raise HTTPException(status_code=400, detail="No file uploaded")
         
     photo = PhotoModel(**photo_create.dict(), user_id=user_id, url=url)
+    photo.file_name = photo.file_name or image.filename
+    photo.file_size = photo.file_size or file_size
+    photo.file_type = photo.file_type or metadata.mime_type
+    photo.mime_type = metadata.mime_type
+    photo.width, photo.height = metadata.width, metadata.height
+    photo.time_taken = metadata.time_taken
+    photo.latitude, photo.longitude = metadata.latitude, metadata.longitude
+    photo.phash = phash
     db.add(photo)
     db.commit()
     db.refresh(photo)
     return photo
 
 
+# count a user's photos per device, month and starred status (registered before /photos/{photo_id})
+@router.get("/users/{user_id}/photos/facets", response_model=PhotoFacets)
+def get_photo_facets(user_id: UUID, request: Request, db: Session = Depends(get_read_db),
+                     starred: bool = Query(False, description="Filter photos by starred status"),
+                     fromDate: datetime = Query(None, description="Filter photos by date"),
+                     toDate: datetime = Query(None, description="Filter photos by date"),
+                     device: str = Query(None, description="Filter photos by device name"),
+                     device_id: List[UUID] = Query(None, description="Filter photos by device, repeat for several"),
+                     contains: str = Query(None, description="Filter photos by description")):
+    """
+    The counts shown next to the photo grid, for the photos matching the filters of GET /users/{user_id}/photos:
+    the total, starred and unstarred, per device (most photos first) and per month taken (newest first).
+    As usual for a sidebar, the device counts ignore the device filter and the starred counts ignore the
+    starred filter, so the other choices keep their counts. All counts come from one grouped query.
+
+    Example:
+    GET /users/12345678-1234-5678-1234-567812345678/photos/facets?starred=true&fromDate=2021-01-01
+    """
+    if db.query(UserModel).filter(UserModel.user_id == user_id).first() is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    params = dict(starred=starred, fromDate=fromDate, toDate=toDate, device=device,
+                  device_id=sorted(set(device_id)) if device_id else None, contains=contains)
+    return cached_response(request, "facets", user_id, params,
+                           lambda: _query_photo_facets(db, user_id, **params))
+
+
+def _query_photo_facets(db: Session, user_id: UUID, starred, fromDate, toDate, device, device_id, contains) -> bytes:
+    device_ids = _device_ids(db, user_id, device, device_id)
+    taken = func.coalesce(PhotoModel.time_taken, PhotoModel.time_created)
+    year, month = extract("year", taken), extract("month", taken)
+    # device and starred are left out of the WHERE clause and applied per facet below
+    groups = db.query(PhotoModel.device_id, PhotoModel.starred, year, month, func.count()) \
+        .filter(*_photo_filters(db, user_id, False, fromDate, toDate, None, None, contains)) \
+        .group_by(PhotoModel.device_id, PhotoModel.starred, year, month).all()
+
+    total, by_starred, by_device, by_month = 0, Counter(), Counter(), Counter()
+    for group_device, group_starred, group_year, group_month, count in groups:
+        on_device = device_ids is None or group_device in device_ids
+        if on_device:
+            by_starred[bool(group_starred)] += count
+        if group_starred or not starred:
+            by_device[group_device] += count
+            if on_device:
+                total += count
+                by_month[f"{int(group_year):04d}-{int(group_month):02d}"] += count
+
+    names = dict(db.query(DeviceModel.device_id, DeviceModel.device_name)
+                 .filter(DeviceModel.device_id.in_(list(by_device))).all()) if by_device else {}
+    return dumps(dict(
+        total=total, starred=by_starred[True], unstarred=by_starred[False],
+        devices=[dict(device_id=key, device_name=names.get(key), count=count)
+                 for key, count in sorted(by_device.items(), key=lambda item: (-item[1], names.get(item[0]) or ""))],
+        months=[dict(month=key, count=count) for key, count in sorted(by_month.items(), reverse=True)],
+    ))
+
+
+# find near-duplicate photos of a user (registered before /photos/{photo_id})
+@router.get("/users/{user_id}/photos/duplicates", response_model=List[DuplicateGroup])
+def get_duplicate_photos(user_id: UUID, request: Request, db: Session = Depends(get_read_db),
+                         distance: int = Query(DUPLICATE_DISTANCE, ge=0, le=MAX_DUPLICATE_DISTANCE,
+                                               description="Largest number of differing perceptual hash bits"),
+                         fromDate: datetime = Query(None, description="Only photos taken from this date"),
+                         toDate: datetime = Query(None, description="Only photos taken until this date")):
+    """
+    Groups of near-identical photos (re-uploads, burst shots), by the perceptual hash computed at upload.
+    Each group lists its photos in the order they were taken, and suggests one to keep: one already
+    described, then the largest, then the earliest. Newest groups come first.
+
+    Example:
+    GET /users/12345678-1234-5678-1234-567812345678/photos/duplicates?distance=4
+    """
+    if db.query(UserModel).filter(UserModel.user_id == user_id).first() is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    params = dict(distance=distance, fromDate=fromDate, toDate=toDate)
+    return cached_response(request, "duplicates", user_id, params,
+                           lambda: _query_duplicate_photos(db, user_id, **params))
+
+
+def _query_duplicate_photos(db: Session, user_id: UUID, distance, fromDate, toDate) -> bytes:
+    # group on (id, hash) pairs; full rows are only loaded for photos that have duplicates
+    hashes_query = db.query(PhotoModel.photo_id, PhotoModel.phash) \
+        .filter(PhotoModel.user_id == user_id, PhotoModel.phash.isnot(None))
+    taken = func.coalesce(PhotoModel.time_taken, PhotoModel.time_created)
+    if fromDate:
+        hashes_query = hashes_query.filter(taken >= fromDate)
+    if toDate:
+        hashes_query = hashes_query.filter(taken <= toDate)
+
+    index = DuplicateIndex(distance)
+    for photo_id, phash in hashes_query.order_by(taken.asc()).all():
+        index.add(photo_id, phash)
+    groups = index.groups()
+
+    fields = list(PhotoSummary.model_fields)
+    # descriptions are only needed to pick the keeper
+    columns = [getattr(PhotoModel, name) for name in fields + ["description"]]
+    grouped = [photo_id for group in groups for photo_id in group]
+    photos = {}
+    for start in range(0, len(grouped), 1000):
+        for photo in db.query(PhotoModel).options(load_only(*columns)) \
+                .filter(PhotoModel.photo_id.in_(grouped[start:start + 1000])).all():
+            photos[photo.photo_id] = photo
+
+    body = []
+    for group in reversed(groups):
+        members = [photos[photo_id] for photo_id in group]
+        body.append(dict(keep=keeper(members).photo_id, photos=photo_list.to_dicts(members, fields=fields)))
+    return dumps(body)
+
+
+# search photos by what their descriptions mean (registered before /photos/{photo_id})
+@router.get("/users/{user_id}/photos/search", response_model=List[PhotoSearchResult])
+def search_user_photos(user_id: UUID, request: Request, db: Session = Depends(get_db),
+                       q: str = Query(..., min_length=1, max_length=500, description="What to look for"),
+                       limit: int = Query(10, description="Limit the number of photos returned", ge=1, le=100)):
+    """
+    The photos whose descriptions best match the query, best first, with their similarity score. Unlike
+    the ``contains`` filter of GET /users/{user_id}/photos, the words need not appear verbatim (see
+    api/search.py). Photos whose vectors are still missing are embedded first, hence the primary database.
+
+    Example:
+    GET /users/12345678-1234-5678-1234-567812345678/photos/search?q=dog%20on%20the%20beach&limit=20
+    """
+    if db.query(UserModel).filter(UserModel.user_id == user_id).first() is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    params = dict(q=q, limit=limit)
+    return cached_response(request, "search", user_id, params,
+                           lambda: _query_search_photos(db, user_id, **params))
+
+
+def _query_search_photos(db: Session, user_id: UUID, q, limit) -> bytes:
+    hits = search_photos(db, user_id, q, limit)
+    fields = list(PhotoSummary.model_fields)
+    photos = {photo.photo_id: photo for photo in db.query(PhotoModel)
+              .options(load_only(*[getattr(PhotoModel, name) for name in fields]))
+              .filter(PhotoModel.photo_id.in_([photo_id for photo_id, _ in hits])).all()}
+    found = [(photos[photo_id], score) for photo_id, score in hits if photo_id in photos]
+    items = photo_list.to_dicts([photo for photo, _ in found], fields=fields)
+    for item, (_, score) in zip(items, found):
+        item["score"] = round(score, 4)
+    return dumps(items)
+
+
 # get details from a specific photo of a user by id
-@router.get("/users/{user_id}/photos/{photo_id}", response_model=PhotoResponse)
-def get_user_photo(user_id: UUID, photo_id: UUID, db: Session = Depends(get_db)):
+@router.get("/users/{user_id}/photos/{photo_id}", response_model=PhotoDetailResponse)
+def get_user_photo(user_id: UUID, photo_id: UUID, db: Session = Depends(get_read_db),
+                   include: str = Query(None, description="Comma-separated relationships to include: device, journal")):
+    include = parse_include(photo_list, include)
     user = db.query(UserModel).filter(UserModel.user_id == user_id).first()
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    photo = db.query(PhotoModel).filter((PhotoModel.photo_id == photo_id) and (PhotoModel.user_id == user_id)).first()
+    photo = db.query(PhotoModel).options(*eager_load(PhotoModel, include)) \
+        .filter(PhotoModel.photo_id == photo_id, PhotoModel.user_id == user_id).first()
     if photo is None:
         raise HTTPException(status_code=404, detail="Photo not found")
-    return photo
+    return FastJSONResponse(photo_list.to_dicts([photo], include=include)[0])
 
 # update a photo for a user by id
 @router.put("/users/{user_id}/photos/{photo_id}", response_model=PhotoResponse)
-def update_user_photo(user_id: UUID, photo_id: UUID, photo: PhotoUpdate, db: Session = Depends(get_db)):
+def update_user_photo(user_id: UUID, photo_id: UUID, photo_update: PhotoUpdate, db: Session = Depends(get_db)):
     user = db.query(UserModel).filter(UserModel.user_id == user_id).first()
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    photo = db.query(PhotoModel).filter((PhotoModel.photo_id == photo_id) and (PhotoModel.user_id == user_id)).first()
+    photo = db.query(PhotoModel).filter(PhotoModel.photo_id == photo_id, PhotoModel.user_id == user_id).first()
     
     if photo is None:
         raise HTTPException(status_code=404, detail="Photo not found")
     
-    for key, value in photo.dict().items():
-        if key in photo.dict(exclude_unset=False):
-            setattr(photo, key, value)
-            
+    update_data = photo_update.dict(exclude_unset=True, exclude={"photo_id", "user_id"})
+    for key, value in update_data.items():
+        setattr(photo, key, value)
+
     db.commit()
+    if "description" in update_data:
+        embed_saved(db, user_id, [photo_id])
     db.refresh(photo)
     
     return photo
@@ -664,7 +1050,7 @@ def delete_user_photo(user_id: UUID, photo_id: UUID, db: Session = Depends(get_d
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    photo = db.query(PhotoModel).filter((PhotoModel.photo_id == photo_id) and (PhotoModel.user_id == user_id)).first()
+    photo = db.query(PhotoModel).filter(PhotoModel.photo_id == photo_id, PhotoModel.user_id == user_id).first()
     
     if photo is None:
         raise HTTPException(status_code=404, detail="Photo not found")
@@ -702,9 +1088,10 @@ def delete_user_photos(user_id: UUID, photo_ids: List[UUID], db: Session = Depen
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    photos = db.query(PhotoModel).filter((PhotoModel.photo_id.in_(photo_ids)) and (PhotoModel.user_id == user_id)).all()
+    photos = db.query(PhotoModel).filter(PhotoModel.photo_id.in_(photo_ids), PhotoModel.user_id == user_id).all()
     
-    assert len(photos) == len(photo_ids), f"{len(photo_ids) - len(photos)} photos not found"
+    if len(photos) != len(photo_ids):
+        raise HTTPException(status_code=404, detail=f"{len(photo_ids) - len(photos)} photos not found")
     
     if not photos:
         raise HTTPException(status_code=404, detail="Photos not found")
@@ -722,13 +1109,12 @@ async def analyze_photo(user_id: UUID, photo_id: UUID, db: Session = Depends(get
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    photo = db.query(PhotoModel).filter((PhotoModel.photo_id == photo_id) and (PhotoModel.user_id == user_id)).first()
+    photo = db.query(PhotoModel).filter(PhotoModel.photo_id == photo_id, PhotoModel.user_id == user_id).first()
     if photo is None:
         raise HTTPException(status_code=404, detail="Photo not found")
     
-    description = describe_image(photo.url) # this function is taking 7-8 seconds to return
-    
-    photo.description = description
+    # shares the model call with any job describing the same photo right now
+    photo.description = await describe_photo(photo.photo_id, photo.url)
     db.commit()
     db.refresh(photo)
     return photo
@@ -1,48 +1,32 @@
-from http import HTTPStatus
-import dashscope
+import asyncio
 import time
 import os
 from pathlib import Path
-from dotenv import load_dotenv
-import base64, uuid, io, json
+import base64, uuid, io, json, re
+from datetime import datetime
 from passlib.context import CryptContext
-import requests
-from typing import List, Dict, Any, Union
+from typing import List, Dict, Any, Optional, Tuple, Union
 
-load_dotenv()
+from .providers import get_provider
+from .metrics import timed_external
 
-dashscope.api_key = os.environ.get("QWEN_API_KEY")
 
-
-def describe_image(image_url):
+@timed_external("describe_image")
+def describe_image(image_url, provider=None):
     """
     Describes the content of an image using a multi-modal conversation model.
 
     Args:
         image_url (str): The URL of the image to be described.
+        provider: The model provider to call. Defaults to get_provider().
 
     Returns:
         str or None: The description of the image, or None if no description is available.
+        
+    Raises:
+        ProviderError: If the model call fails.
     """
-    messages = [
-        {
-            "role": "user",
-            "content": [
-                {"image": image_url},
-                {"text": "Please describe what you see in this image."},
-            ],
-        }
-    ]
-
-    response = dashscope.MultiModalConversation.call(
-        model="qwen-vl-plus", messages=messages
-    )
-    # Extracting the description
-    if response["output"]["choices"][0]["message"]["content"]:
-        description = response["output"]["choices"][0]["message"]["content"][0]["text"]
-        return description
-    else:
-        return "Failed to describe image."
+    return (provider or get_provider()).describe_image(image_url)
 
 def hash_pwd(password: str) -> str:
     """
@@ -58,35 +42,18 @@ def hash_pwd(password: str) -> str:
     return pwd_context.hash(password)
 
 
-# TODO: Future feature: customizable system prompts
-async def generate_journal_func(entries: List[Dict[str, Any]]) -> Union[str, str]:
-    """
-    Generates a journal based on a list of entries.
+GENERATION_PROMPT_BUDGET = int(os.getenv("GENERATION_PROMPT_BUDGET", "6000"))  # estimated tokens per model call
+GENERATION_CHUNK_CONCURRENCY = int(os.getenv("GENERATION_CHUNK_CONCURRENCY", "4"))
 
-    Args:
-        entries (List[Dict[str, Any]]): A list of journal entries, sorted by creation date.
-        entries[0] (Dict[str, Any]): A journal entry.
-        entries[0]["time_created"] (str): The creation time of the entry.
-        entries[0]["type"] (str): The type of the entry: "text" or "image".
-        entries[0]["content"] (str): The content of the entry: text or image description.
-        entries[0]["url"] (str): The url of the image.
-    Returns:
-        Union[str, str]: The generated title and content of the journal, or an error message.
-    """
-
-    message = {
-        "role": "user",
-        "content": [
-            {
-                "type": "text",
-                "text": f"""
+# TODO: Future feature: customizable system prompts
+JOURNAL_PROMPT = """
                 I'm a 24-year-old girl who loves to write journals and diaries. I have prepared a draft of journal that I would like to rewrite. Please follow the rules below to generate the journal.
 
                 The journal:
                 - Answers some of the following questions "What happened today?", "What did I experience today?", "What did I feel today?", "What did I learn today?", "What did I think today?"
                 - Start from title directly, DON'T append any additional introduction
                 - Should be formatted in markdown, every detail in the draft should be referenced
-                - All images should be included in the journal, in form of '![](url)'
+                - All images should be included in the journal, in form of '![](img1)' using the image's reference
                 - Should connect all the entries in a coherent way, can be separated into less than 3 paragraphs
                 - Should be written in first person and in high school level English
                 - Should be at least 100 words long
@@ -95,22 +62,169 @@ async def generate_journal_func(entries: List[Dict[str, Any]]) -> Union[str, str
                 - Is allowed to use emojis and other expressive elements if needed
                 - Should include a title that is creative and relevant to the content
 
-                Here are the entries:
-
-                {entries}""",
-                            }
-                        ],
-                    }
-    messages = [message]
-    response = dashscope.Generation.call(model="qwen-plus", messages=messages, temperature=0.5, top_p=0.95, top_k=50)
-    if response["output"]:
-        journal = response["output"]["text"]
-        title, journal = get_title_from_journal(journal)
-        return title, journal
-    else:
-        return "Failed Entry", "Failed to generate journal."
-    
-    
+                Here are the entries, one per line as "time [image reference] content":
+
+                {entries}"""
+
+SUMMARY_PROMPT = """
+                I'm writing a journal about a long stretch of moments and need notes on one part of it first.
+                Summarize the entries below as short first-person notes in chronological order:
+                - Keep every concrete detail, feeling and the time of day
+                - Keep every image reference such as [img1] next to the moment it shows
+                - No title, no introduction, at most {words} words
+
+                Here are the entries, one per line as "time [image reference] content":
+
+                {entries}"""
+
+_IMAGE_REF = re.compile(r"\((img\d+)\)|\[(img\d+)\](?!\()")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count for budgeting prompts: about 4 characters per token for
+    Latin text and one token per character for CJK and other non-ASCII text.
+    """
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    return (len(text) - non_ascii) // 4 + non_ascii + 1
+
+
+def compact_entries(entries: List[Dict[str, Any]]) -> Tuple[List[str], List[Optional[datetime]], Dict[str, str]]:
+    """
+    One short line per entry instead of the repr of the entry dicts: the date
+    only when it changes, HH:MM times, and images referenced as [imgN] rather
+    than by their full URL.
+
+    Returns:
+        Tuple[List[str], List[Optional[datetime]], Dict[str, str]]: The lines, the time of each
+        line (None for date headings), and the image references mapped to their URLs.
+    """
+    lines, times, urls, day = [], [], {}, None
+    for entry in entries:
+        created = entry.get("time_created")
+        if isinstance(created, str):
+            try:
+                created = datetime.fromisoformat(created)
+            except ValueError:
+                created = None
+        stamp = ""
+        if isinstance(created, datetime):
+            if created.date() != day:
+                day = created.date()
+                lines.append(f"{day:%A %Y-%m-%d}")
+                times.append(None)
+            stamp = f"{created:%H:%M} "
+        ref = ""
+        if entry.get("type") == "image" and entry.get("url"):
+            ref = f"img{len(urls) + 1}"
+            urls[ref] = entry["url"]
+            ref = f"[{ref}] "
+        content = " ".join(str(entry.get("content") or "").split())
+        lines.append(f"{stamp}{ref}{content}")
+        times.append(created if isinstance(created, datetime) else None)
+    return lines, times, urls
+
+
+def expand_image_refs(journal: str, urls: Dict[str, str]) -> str:
+    """Put the image URLs back in place of the [imgN] references the model wrote."""
+    def replace(match):
+        linked, bare = match.groups()
+        url = urls.get(linked or bare)
+        if url is None:
+            return match.group(0)
+        # '![](img1)' -> '![](url)'; a bare [img1] becomes an image too
+        return f"({url})" if linked else f"![]({url})"
+    return _IMAGE_REF.sub(replace, journal)
+
+
+def chunk_lines(lines: List[str], budget: int, times: List[Optional[datetime]] = None) -> List[List[str]]:
+    """
+    Split lines into consecutive chunks of at most ``budget`` estimated tokens.
+    Given the ``times`` of the lines, a chunk past half the budget also ends
+    at the next gap of an hour or more, so chunks follow the breaks of the day.
+    """
+    following = [None] * len(lines)  # time of the next timed line
+    if times:
+        upcoming = None
+        for i in range(len(lines) - 1, -1, -1):
+            following[i] = upcoming
+            upcoming = times[i] or upcoming
+
+    chunks, current, size = [], [], 0
+    for i, line in enumerate(lines):
+        tokens = estimate_tokens(line)
+        if current and size + tokens > budget:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(line)
+        size += tokens
+        pause = (following[i] - times[i]).total_seconds() if times and times[i] and following[i] else 0
+        if size > budget / 2 and pause >= 3600:
+            chunks.append(current)
+            current, size = [], 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def _complete_all(provider, prompts: List[str]) -> List[str]:
+    limit = asyncio.Semaphore(GENERATION_CHUNK_CONCURRENCY)
+
+    async def complete(prompt):
+        async with limit:
+            # the dashscope client blocks, keep it off the event loop
+            return await asyncio.to_thread(provider.complete, prompt)
+
+    return await asyncio.gather(*(complete(prompt) for prompt in prompts))
+
+
+@timed_external("generate_journal")
+async def generate_journal_func(entries: List[Dict[str, Any]], provider=None, budget: int = None) -> Union[str, str]:
+    """
+    Generates a journal based on a list of entries.
+
+    Small selections are written in a single model call. When the prompt would
+    exceed ``budget`` estimated tokens, the entries are split into chunks by
+    time, each chunk is summarized into notes in parallel, and the journal is
+    written from the notes (map-reduce), summarizing the notes again if needed.
+
+    Args:
+        entries (List[Dict[str, Any]]): A list of journal entries, sorted by creation date.
+        entries[0] (Dict[str, Any]): A journal entry.
+        entries[0]["time_created"] (str): The creation time of the entry.
+        entries[0]["type"] (str): The type of the entry: "text" or "image".
+        entries[0]["content"] (str): The content of the entry: text or image description.
+        entries[0]["url"] (str): The url of the image.
+        provider: The model provider to call. Defaults to get_provider().
+        budget (int): Estimated prompt tokens per model call. Defaults to GENERATION_PROMPT_BUDGET.
+    Returns:
+        Union[str, str]: The generated title and content of the journal.
+        
+    Raises:
+        ProviderError: If the model call fails.
+    """
+    provider = provider or get_provider()
+    budget = budget or GENERATION_PROMPT_BUDGET
+
+    lines, times, urls = compact_entries(entries)
+    overhead = estimate_tokens(JOURNAL_PROMPT)
+    for _ in range(3):  # notes are summarized again at most twice
+        if estimate_tokens("\n".join(lines)) + overhead <= budget or len(lines) == 1:
+            break
+        chunks = chunk_lines(lines, budget - estimate_tokens(SUMMARY_PROMPT), times)
+        if len(chunks) == 1:
+            # a single over-long entry; summarizing it alone would not make it shorter
+            break
+        # the notes of all chunks together have to fit into the next prompt
+        words = max(50, (budget - overhead) * 3 // 4 // len(chunks))
+        notes = await _complete_all(provider, [SUMMARY_PROMPT.format(words=words, entries="\n".join(chunk))
+                                               for chunk in chunks])
+        lines, times = [" ".join(note.split()) for note in notes], None
+
+    journal = await asyncio.to_thread(provider.complete, JOURNAL_PROMPT.format(entries="\n".join(lines)))
+    return get_title_from_journal(expand_image_refs(journal, urls))
+
+
 def get_title_from_journal(journal: str) -> Union[str, str]:
     title = ""
     idx = journal.find("#")
@@ -0,0 +1,184 @@
+"""
+Image metadata read from the header of an upload.
+
+Only the bytes in front of the pixel data are read: the format signature,
+the frame header with the dimensions and, for JPEG, the EXIF segment with the
+capture time and GPS position. Everything else is skipped by seeking, so this
+costs a few reads per image whatever its size, and needs no imaging library.
+
+HEIC/AVIF are recognised by their signature but their dimensions and EXIF
+are not read.
+"""
+import struct
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+HEADER_LIMIT = 1 << 20  # give up looking for a JPEG frame header after this many bytes
+
+# JPEG markers starting a frame (SOF0-SOF15, without DHT, JPG and DAC)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# EXIF tags
+_ORIENTATION = 0x0112
+_DATETIME = 0x0132
+_EXIF_IFD = 0x8769
+_GPS_IFD = 0x8825
+_DATETIME_ORIGINAL = 0x9003
+_DATETIME_DIGITIZED = 0x9004
+_OFFSET_TIME = 0x9010
+_OFFSET_TIME_ORIGINAL = 0x9011
+_GPS_LATITUDE_REF, _GPS_LATITUDE, _GPS_LONGITUDE_REF, _GPS_LONGITUDE = 1, 2, 3, 4
+
+# TIFF field type -> (struct format, size)
+_TIFF_TYPES = {1: ("B", 1), 2: ("s", 1), 3: ("H", 2), 4: ("I", 4), 5: ("II", 8), 7: ("s", 1), 9: ("i", 4), 10: ("ii", 8)}
+
+_HEIF_BRANDS = {b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx", b"mif1", b"msf1"}
+
+
+@dataclass
+class ImageMetadata:
+    mime_type: Optional[str] = None
+    width: Optional[int] = None  # as displayed, i.e. after the EXIF orientation is applied
+    height: Optional[int] = None
+    time_taken: Optional[datetime] = None  # UTC if the camera recorded its offset, camera local time otherwise
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+
+def read_metadata(file: BinaryIO) -> ImageMetadata:
+    """
+    Read the metadata of an image from a seekable file, leaving its position
+    unchanged. Unknown formats and truncated or malformed headers are not
+    errors: whatever could be read is returned, possibly nothing.
+    """
+    meta = ImageMetadata()
+    start = file.tell()
+    try:
+        head = file.read(32)
+        if head.startswith(b"\xff\xd8\xff"):
+            meta.mime_type = "image/jpeg"
+            _read_jpeg(file, start, meta)
+        elif head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+            meta.mime_type = "image/png"
+            meta.width, meta.height = struct.unpack(">II", head[16:24])
+        elif head[:6] in (b"GIF87a", b"GIF89a"):
+            meta.mime_type = "image/gif"
+            meta.width, meta.height = struct.unpack("<HH", head[6:10])
+        elif head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            meta.mime_type = "image/webp"
+            meta.width, meta.height = _webp_size(head)
+        elif head[:2] == b"BM":
+            meta.mime_type = "image/bmp"
+            width, height = struct.unpack("<ii", head[18:26])
+            meta.width, meta.height = width, abs(height)
+        elif head[4:8] == b"ftyp":
+            meta.mime_type = "image/avif" if head[8:12] == b"avif" else \
+                "image/heic" if head[8:12] in _HEIF_BRANDS else None
+    except (struct.error, ValueError, IndexError):
+        pass
+    finally:
+        file.seek(start)
+    return meta
+
+
+def _webp_size(head: bytes) -> Tuple[int, int]:
+    chunk = head[12:16]
+    if chunk == b"VP8X":
+        return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+    if chunk == b"VP8L":
+        bits = int.from_bytes(head[21:25], "little")
+        return (bits & 0x3FFF) + 1, (bits >> 14 & 0x3FFF) + 1
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    raise ValueError("Unknown WebP chunk")
+
+
+def _read_jpeg(file: BinaryIO, start: int, meta: ImageMetadata):
+    # walk the segments up to the frame header, reading only APP1 (EXIF) and SOF
+    orientation = 1
+    file.seek(start + 2)
+    while file.tell() - start < HEADER_LIMIT:
+        marker = file.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            break
+        code = marker[1]
+        while code == 0xFF:  # fill bytes
+            code = file.read(1)[0]
+        if code == 0x01 or 0xD0 <= code <= 0xD8:  # markers without a length
+            continue
+        if code in (0xD9, 0xDA):  # end of image, start of scan: no more headers
+            break
+        length = struct.unpack(">H", file.read(2))[0] - 2
+        if code == 0xE1 and file.read(6) == b"Exif\x00\x00":
+            orientation = _read_exif(file.read(length - 6), meta) or orientation
+        elif code == 0xE1:  # XMP or another APP1 payload
+            file.seek(length - 6, 1)
+        elif code in _SOF_MARKERS:
+            meta.height, meta.width = struct.unpack(">xHH", file.read(5))
+            break
+        else:
+            file.seek(length, 1)
+    if orientation in (5, 6, 7, 8) and meta.width is not None:
+        meta.width, meta.height = meta.height, meta.width
+
+
+def _read_exif(tiff: bytes, meta: ImageMetadata) -> Optional[int]:
+    """Fill in the capture time and position from a TIFF structure; returns the orientation."""
+    order = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if order is None:
+        return None
+    ifd0 = _read_ifd(tiff, struct.unpack(order + "I", tiff[4:8])[0], order, {_ORIENTATION, _DATETIME, _EXIF_IFD, _GPS_IFD})
+    exif = _read_ifd(tiff, ifd0[_EXIF_IFD], order, {_DATETIME_ORIGINAL, _DATETIME_DIGITIZED, _OFFSET_TIME_ORIGINAL,
+                                                     _OFFSET_TIME}) if _EXIF_IFD in ifd0 else {}
+    meta.time_taken = _exif_time(exif.get(_DATETIME_ORIGINAL) or exif.get(_DATETIME_DIGITIZED) or ifd0.get(_DATETIME),
+                                 exif.get(_OFFSET_TIME_ORIGINAL) or exif.get(_OFFSET_TIME))
+    if _GPS_IFD in ifd0:
+        gps = _read_ifd(tiff, ifd0[_GPS_IFD], order,
+                        {_GPS_LATITUDE_REF, _GPS_LATITUDE, _GPS_LONGITUDE_REF, _GPS_LONGITUDE})
+        latitude = _degrees(gps.get(_GPS_LATITUDE), gps.get(_GPS_LATITUDE_REF), "S")
+        longitude = _degrees(gps.get(_GPS_LONGITUDE), gps.get(_GPS_LONGITUDE_REF), "W")
+        if latitude is not None and longitude is not None and -90 <= latitude <= 90 and -180 <= longitude <= 180 \
+                and (latitude, longitude) != (0, 0):
+            meta.latitude, meta.longitude = latitude, longitude
+    return ifd0.get(_ORIENTATION)
+
+
+def _read_ifd(tiff: bytes, offset: int, order: str, tags: set) -> Dict[int, Any]:
+    values = {}
+    count = struct.unpack_from(order + "H", tiff, offset)[0]
+    for entry in range(offset + 2, offset + 2 + 12 * count, 12):
+        tag, kind, n = struct.unpack_from(order + "HHI", tiff, entry)
+        if tag not in tags or kind not in _TIFF_TYPES:
+            continue
+        fmt, size = _TIFF_TYPES[kind]
+        where = entry + 8 if size * n <= 4 else struct.unpack_from(order + "I", tiff, entry + 8)[0]
+        if fmt == "s":
+            values[tag] = tiff[where:where + n].split(b"\x00")[0].decode("ascii", "replace")
+            continue
+        numbers = struct.unpack_from(order + fmt * n, tiff, where)
+        if len(fmt) == 2:  # rationals
+            numbers = tuple(a / b if b else 0.0 for a, b in zip(numbers[::2], numbers[1::2]))
+        values[tag] = numbers[0] if n == 1 else numbers
+    return values
+
+
+def _exif_time(value: Optional[str], offset: Optional[str]) -> Optional[datetime]:
+    try:
+        taken = datetime.strptime(value.strip(), "%Y:%m:%d %H:%M:%S")
+    except (AttributeError, ValueError):  # missing, or blanked out as "0000:00:00 00:00:00"
+        return None
+    try:
+        sign = -1 if offset[0] == "-" else 1
+        hours, minutes = offset[1:].split(":")
+        return taken - sign * timedelta(hours=int(hours), minutes=int(minutes))
+    except (TypeError, ValueError, IndexError):
+        return taken
+
+
+def _degrees(value, ref: Optional[str], negative: str) -> Optional[float]:
+    if not isinstance(value, tuple) or len(value) != 3:
+        return None
+    degrees = value[0] + value[1] / 60 + value[2] / 3600
+    return -degrees if ref == negative else degrees
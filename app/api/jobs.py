@@ -0,0 +1,525 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy import func
+from sqlmodel import Session
+
+from database import get_engine
+from database import GenerationJob as GenerationJobModel
+from database import Journal as JournalModel
+from database import Photo as PhotoModel
+
+from .functions import GENERATION_PROMPT_BUDGET, JOURNAL_PROMPT, SUMMARY_PROMPT, describe_image, generate_journal_func
+from .phash import collapse_duplicates as collapse
+from .providers import ProviderError, get_provider
+from .search import embed_saved
+from .singleflight import DatabaseLease, SingleFlight
+
+logger = logging.getLogger(__name__)
+
+GENERATION_RATE = float(os.getenv("GENERATION_RATE", "2"))  # model calls per second, across all jobs
+GENERATION_BURST = int(os.getenv("GENERATION_BURST", "5"))
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "4"))
+GENERATION_MAX_ATTEMPTS = int(os.getenv("GENERATION_MAX_ATTEMPTS", "3"))
+GENERATION_MAX_PENDING = int(os.getenv("GENERATION_MAX_PENDING", "5"))  # queued jobs per user
+GENERATION_CACHE_TTL = int(os.getenv("GENERATION_CACHE_TTL", "86400"))  # seconds a generated journal is reused, 0 disables
+
+DESCRIBE_LEASES = os.getenv("DESCRIBE_LEASES", "false").lower() == "true"  # single-flight across workers too
+
+MODEL_PARAMETERS = ("vision_model", "text_model", "temperature", "top_p", "top_k")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class SchedulerClosed(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: ``rate`` tokens per second, holding at most
+    ``capacity``. Model calls run in worker threads, so ``acquire`` blocks.
+    """
+
+    def __init__(self, rate: float, capacity: int, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """Take a token if one is available. Returns 0, or the seconds until the next token."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            self._sleep(wait)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    TokenBucket kept in Redis (a redis-py compatible client), so that all
+    workers together stay within ``rate``. The bucket is stored as the time at
+    which it will next be full (GCRA) and updated under WATCH, so two workers
+    cannot both take the last token.
+    """
+
+    def __init__(self, client, key: str, rate: float, capacity: int, clock=time.time, sleep=time.sleep):
+        self.client = client
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+
+    def try_acquire(self) -> float:
+        interval = 1 / self.rate
+        burst = (self.capacity - 1) * interval
+        wait = 0.0
+
+        def take(pipe):
+            nonlocal wait
+            now = self._clock()
+            stored = pipe.get(self.key)
+            full_at = max(float(stored), now) if stored is not None else now
+            wait = max(0.0, full_at - now - burst)
+            if not wait:
+                pipe.multi()
+                pipe.set(self.key, repr(full_at + interval), px=int((full_at + interval - now) * 1000) + 1000)
+
+        self.client.transaction(take, self.key)
+        return wait
+
+
+def default_bucket() -> TokenBucket:
+    """The GENERATION_RATE bucket, shared by all workers when the response cache is in Redis."""
+    from .cache import RedisBackend, response_cache
+
+    backend = response_cache.backend
+    if isinstance(backend, RedisBackend):
+        return SharedTokenBucket(backend.client, backend.prefix + "generation-rate", GENERATION_RATE, GENERATION_BURST)
+    return TokenBucket(GENERATION_RATE, GENERATION_BURST)
+
+
+class RateLimitedProvider:
+    """Wraps a model provider so that every call first takes a token from ``bucket``."""
+
+    def __init__(self, provider, bucket: TokenBucket):
+        self.provider = provider
+        self.bucket = bucket
+
+    def describe_image(self, image_url: str) -> str:
+        self.bucket.acquire()
+        return self.provider.describe_image(image_url)
+
+    def complete(self, prompt: str) -> str:
+        self.bucket.acquire()
+        return self.provider.complete(prompt)
+
+    def __getattr__(self, name):
+        return getattr(self.provider, name)
+
+
+def generation_fingerprint(photos: Sequence[PhotoModel], provider) -> str:
+    """
+    Identifies a generation by what goes into it: the photos in order, with
+    their descriptions and timestamps, the model parameters and the prompts.
+    Two requests with the same fingerprint would send the model the same input.
+    """
+    payload = dict(
+        photos=[(str(photo.photo_id), photo.description, taken_at(photo).isoformat()) for photo in photos],
+        model={name: getattr(provider, name, None) for name in MODEL_PARAMETERS},
+        budget=GENERATION_PROMPT_BUDGET,
+        prompts=hashlib.sha256((JOURNAL_PROMPT + SUMMARY_PROMPT).encode()).hexdigest(),
+    )
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+_describing = SingleFlight()
+
+
+def default_session() -> Session:
+    return Session(get_engine())
+
+
+async def describe_photo(photo_id: UUID, image_url: str, provider=None,
+                         session_factory: Callable[[], Session] = default_session) -> str:
+    """
+    Describe a photo and save the description. Concurrent calls for the same
+    photo (say, analyze_photo while a generation job covers it) share one model
+    call; with DESCRIBE_LEASES, so do calls in other workers.
+
+    Returns:
+        str: The new description.
+    """
+    return await _describing.do(photo_id, lambda: _describe_and_save(photo_id, image_url, provider, session_factory))
+
+
+async def _describe_and_save(photo_id: UUID, image_url: str, provider, session_factory: Callable[[], Session]) -> str:
+    lease = DatabaseLease(session_factory) if DESCRIBE_LEASES else None
+    name, owner = f"describe:{photo_id}", uuid.uuid4().hex
+    while lease is not None and not await asyncio.to_thread(lease.acquire, name, owner):
+        # another worker is describing this photo: use its description once it is saved
+        await lease.wait(name)
+        description = await asyncio.to_thread(_read_description, photo_id, session_factory)
+        if description:
+            return description
+    try:
+        # the model call takes 7-8 seconds, keep it off the event loop
+        description = await asyncio.to_thread(describe_image, image_url, provider)
+        await asyncio.to_thread(_save_description, photo_id, description, session_factory)
+        return description
+    finally:
+        if lease is not None:
+            await asyncio.to_thread(lease.release, name, owner)
+
+
+def _read_description(photo_id: UUID, session_factory: Callable[[], Session]) -> Optional[str]:
+    with session_factory() as session:
+        return session.get(PhotoModel, photo_id).description
+
+
+def _save_description(photo_id: UUID, description: str, session_factory: Callable[[], Session]):
+    with session_factory() as session:
+        photo = session.get(PhotoModel, photo_id)
+        photo.description = description
+        session.commit()
+        embed_saved(session, photo.user_id, [photo_id])
+
+
+def taken_at(photo: PhotoModel) -> datetime:
+    """When the photo was taken; photos not yet backfilled only have their upload time."""
+    return photo.time_taken or photo.time_created
+
+
+def load_photos(session: Session, user_id: UUID, photo_ids: List[UUID]) -> List[PhotoModel]:
+    """The selected photos of a user, in the order they were taken."""
+    return session.query(PhotoModel).filter(PhotoModel.photo_id.in_(photo_ids), PhotoModel.user_id == user_id) \
+        .order_by(func.coalesce(PhotoModel.time_taken, PhotoModel.time_created).asc()).all()
+
+
+async def generate_journal_for_job(job_id: UUID, provider, session_factory: Callable[[], Session]) -> UUID:
+    """
+    Describe the job's photos where needed, generate the journal and save it.
+    The database is read and written in short sessions in worker threads, none
+    of them open while the model is called.
+
+    Returns:
+        UUID: The id of the new journal.
+    """
+    user_id, photos = await asyncio.to_thread(_load_job, job_id, session_factory)
+    if not photos:
+        raise ValueError("No photos found")
+
+    entries = []
+    for photo in photos:
+        if not photo.description:
+            # saved by describe_photo, so it is kept even if generation fails below
+            photo.description = await describe_photo(photo.photo_id, photo.url, provider, session_factory)
+        entries.append(dict(time_created=taken_at(photo), type="image", content=photo.description, url=photo.url))
+    # with the descriptions filled in, so that the next request for these photos finds this result
+    await asyncio.to_thread(_save_fingerprint, job_id, generation_fingerprint(photos, provider), session_factory)
+
+    title, journal = await generate_journal_func(entries, provider)
+    return await asyncio.to_thread(_save_journal, user_id, title, journal, session_factory)
+
+
+def _load_job(job_id: UUID, session_factory: Callable[[], Session]) -> Tuple[UUID, List[PhotoModel]]:
+    """The user of a job and its photos, detached from the session."""
+    with session_factory() as session:
+        job = session.get(GenerationJobModel, job_id)
+        return job.user_id, load_photos(session, job.user_id, [UUID(photo_id) for photo_id in json.loads(job.photo_ids)])
+
+
+def _save_fingerprint(job_id: UUID, fingerprint: str, session_factory: Callable[[], Session]):
+    with session_factory() as session:
+        session.get(GenerationJobModel, job_id).fingerprint = fingerprint
+        session.commit()
+
+
+def _save_journal(user_id: UUID, title: str, journal: str, session_factory: Callable[[], Session]) -> UUID:
+    with session_factory() as session:
+        new_journal = JournalModel(description=journal, user_id=user_id, title=title)
+        session.add(new_journal)
+        session.commit()
+        return new_journal.journal_id
+
+
+class JobScheduler:
+    """
+    Runs journal generation jobs in the background of the event loop.
+
+    Jobs are persisted as GenerationJob rows, so their status can be read from
+    any worker. Each user has their own queue and workers take jobs from the
+    users round-robin, so one user submitting many jobs cannot starve the
+    others. All model calls share one token bucket (across workers with
+    CACHE_URL, see default_bucket), and jobs failing with a
+    retryable provider error are retried with exponential backoff and jitter.
+
+    Identical requests (same generation_fingerprint) are not generated twice:
+    a request arriving while such a job is queued or running gets that job
+    (single-flight), and one arriving later gets the job that already
+    succeeded, for ``cache_ttl`` seconds. ``regenerate`` bypasses both.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = default_session,
+                 provider_factory: Callable = get_provider, handler=generate_journal_for_job,
+                 bucket: Optional[TokenBucket] = None, concurrency: int = GENERATION_CONCURRENCY,
+                 max_attempts: int = GENERATION_MAX_ATTEMPTS, max_pending: int = GENERATION_MAX_PENDING,
+                 backoff: float = 2.0, max_backoff: float = 60.0, cache_ttl: int = GENERATION_CACHE_TTL):
+        self.session_factory = session_factory
+        self.provider_factory = provider_factory
+        self.handler = handler
+        self.bucket = bucket or default_bucket()
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.max_pending = max_pending
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.cache_ttl = cache_ttl
+
+        self._queues: Dict[UUID, Deque[UUID]] = {}
+        self._ready: Deque[UUID] = deque()  # users with queued jobs, in round-robin order
+        self._finished: Dict[UUID, asyncio.Event] = {}
+        self._inflight: Dict[Tuple[UUID, str], UUID] = {}  # (user, fingerprint) of queued and running jobs
+        self._loop = None
+        self._has_work = None
+        self._submitting = None
+        self._workers: List[asyncio.Task] = []
+        self._closed = False
+
+    def _bind_loop(self):
+        # workers live on the loop of the first submit (a new loop, e.g. in tests, gets new workers)
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        self._loop = loop
+        self._closed = False
+        self._has_work = asyncio.Event()
+        self._submitting = asyncio.Lock()
+        self._finished = {job_id: asyncio.Event() for job_id in self._finished}
+        self._workers = [loop.create_task(self._worker()) for _ in range(self.concurrency)]
+        if self._ready:
+            self._has_work.set()
+
+    def start(self):
+        """Start the workers on the running loop (otherwise the first submit does)."""
+        self._bind_loop()
+
+    async def shutdown(self, timeout: float):
+        """
+        Stop taking jobs, give queued and running jobs ``timeout`` seconds to
+        finish, then cancel the rest and mark them failed, so that clients
+        polling them are not left waiting on a job no process will run.
+        """
+        self._closed = True
+        if self._loop is not asyncio.get_running_loop():
+            return
+        waiting = [asyncio.ensure_future(finished.wait()) for finished in self._finished.values()]
+        if waiting:
+            await asyncio.wait(waiting, timeout=timeout)
+            for waiter in waiting:
+                waiter.cancel()
+        unfinished = list(self._finished)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queues.clear()
+        self._ready.clear()
+        self._inflight.clear()
+        for job_id in unfinished:
+            logger.warning(f"Generation job {job_id} interrupted by shutdown")
+            await asyncio.to_thread(self._update, job_id, status="failed", error="Interrupted by server shutdown")
+        # release anyone still waiting on a queued job
+        for finished in self._finished.values():
+            finished.set()
+        self._finished.clear()
+
+    def pending(self, user_id: UUID) -> int:
+        return len(self._queues.get(user_id, ()))
+
+    async def submit(self, user_id: UUID, photo_ids: List[UUID], regenerate: bool = False,
+                     collapse_duplicates: bool = False) -> GenerationJobModel:
+        """
+        Queue a generation job and return its row immediately. If the same
+        generation is already queued, running or recently succeeded, that
+        job is returned instead, unless ``regenerate`` is set. With
+        ``collapse_duplicates`` only one photo per group of near-duplicates
+        is used.
+
+        Raises:
+            QueueFull: If the user already has ``max_pending`` queued jobs.
+            SchedulerClosed: If the server is shutting down.
+        """
+        self._bind_loop()
+        if self._closed:
+            raise SchedulerClosed("The server is shutting down, try again shortly")
+
+        # the database work runs in threads; submits still take turns, so that
+        # two identical requests cannot both miss the in-flight job and create one each
+        async with self._submitting:
+            photo_ids, fingerprint = await asyncio.to_thread(self._fingerprint, user_id, photo_ids, collapse_duplicates)
+            key = (user_id, fingerprint)
+            if not regenerate:
+                if key in self._inflight:
+                    return await asyncio.to_thread(self.get, self._inflight[key])
+                cached = await asyncio.to_thread(self._cached, user_id, fingerprint)
+                if cached is not None:
+                    return cached
+            if self.pending(user_id) >= self.max_pending:
+                raise QueueFull(f"{self.max_pending} generation jobs are already queued")
+            job = await asyncio.to_thread(self._create, user_id, photo_ids, fingerprint)
+            if self._closed:
+                # shut down while the row was written: no worker is left to run it
+                await asyncio.to_thread(self._update, job.job_id, status="failed", error="Interrupted by server shutdown")
+                raise SchedulerClosed("The server is shutting down, try again shortly")
+
+            self._inflight[key] = job.job_id
+            self._finished[job.job_id] = asyncio.Event()
+            queue = self._queues.setdefault(user_id, deque())
+            if not queue:
+                self._ready.append(user_id)
+            queue.append(job.job_id)
+            self._has_work.set()
+        return job
+
+    def _fingerprint(self, user_id: UUID, photo_ids: List[UUID], collapse_duplicates: bool) -> Tuple[List[UUID], str]:
+        """The photos a job for these photos covers, and its generation_fingerprint."""
+        with self.session_factory() as session:
+            photos = load_photos(session, user_id, photo_ids)
+            if collapse_duplicates:
+                photos = collapse(photos)
+                photo_ids = [photo.photo_id for photo in photos]
+            return photo_ids, generation_fingerprint(photos, self.provider_factory())
+
+    def _create(self, user_id: UUID, photo_ids: List[UUID], fingerprint: str) -> GenerationJobModel:
+        with self.session_factory() as session:
+            job = GenerationJobModel(user_id=user_id, photo_ids=json.dumps([str(photo_id) for photo_id in photo_ids]),
+                                     fingerprint=fingerprint)
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+            return job
+
+    def _cached(self, user_id: UUID, fingerprint: str) -> Optional[GenerationJobModel]:
+        """The latest job that generated this fingerprint within ``cache_ttl``, if its journal still exists."""
+        if self.cache_ttl <= 0:
+            return None
+        with self.session_factory() as session:
+            job = session.query(GenerationJobModel) \
+                .filter(GenerationJobModel.user_id == user_id, GenerationJobModel.fingerprint == fingerprint,
+                        GenerationJobModel.status == "succeeded",
+                        GenerationJobModel.time_created >= datetime.utcnow() - timedelta(seconds=self.cache_ttl)) \
+                .order_by(GenerationJobModel.time_created.desc()).first()
+            if job is None or session.get(JournalModel, job.journal_id) is None:
+                return None
+            return job
+
+    def get(self, job_id: UUID) -> Optional[GenerationJobModel]:
+        with self.session_factory() as session:
+            return session.get(GenerationJobModel, job_id)
+
+    async def wait(self, job_id: UUID, timeout: Optional[float] = None) -> GenerationJobModel:
+        """
+        Wait until the job has finished and return its row.
+
+        Raises:
+            asyncio.TimeoutError: If the job is still queued or running after ``timeout`` seconds.
+        """
+        finished = self._finished.get(job_id)
+        if finished is not None:
+            await asyncio.wait_for(finished.wait(), timeout)
+        return await asyncio.to_thread(self.get, job_id)
+
+    def _next_job(self) -> Optional[UUID]:
+        if not self._ready:
+            return None
+        user_id = self._ready.popleft()
+        queue = self._queues[user_id]
+        job_id = queue.popleft()
+        if queue:
+            self._ready.append(user_id)
+        else:
+            del self._queues[user_id]
+        return job_id
+
+    async def _worker(self):
+        while True:
+            job_id = self._next_job()
+            if job_id is None:
+                self._has_work.clear()
+                await self._has_work.wait()
+                continue
+            try:
+                await self._run(job_id)
+            finally:
+                for key in [key for key, inflight in self._inflight.items() if inflight == job_id]:
+                    del self._inflight[key]
+                finished = self._finished.pop(job_id, None)
+                if finished is not None:
+                    finished.set()
+
+    def _update(self, job_id: UUID, **values):
+        with self.session_factory() as session:
+            job = session.get(GenerationJobModel, job_id)
+            for key, value in values.items():
+                setattr(job, key, value)
+            session.commit()
+
+    def _delay(self, attempt: int) -> float:
+        return min(self.max_backoff, self.backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+    async def _run(self, job_id: UUID):
+        provider = RateLimitedProvider(self.provider_factory(), self.bucket)
+        for attempt in range(1, self.max_attempts + 1):
+            await asyncio.to_thread(self._update, job_id, status="running", attempts=attempt)
+            try:
+                journal_id = await self.handler(job_id, provider, self.session_factory)
+            except ProviderError as e:
+                if e.retryable and attempt < self.max_attempts:
+                    logger.warning(f"Generation job {job_id} attempt {attempt} failed, retrying: {e}")
+                    await asyncio.sleep(self._delay(attempt))
+                    continue
+                await asyncio.to_thread(self._update, job_id, status="failed", error=str(e))
+            except Exception as e:
+                logger.exception(f"Generation job {job_id} failed")
+                await asyncio.to_thread(self._update, job_id, status="failed", error=str(e))
+            else:
+                await asyncio.to_thread(self._update, job_id, status="succeeded", journal_id=journal_id)
+            return
+
+
+_scheduler = None
+
+def get_scheduler() -> JobScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = JobScheduler()
+    return _scheduler
@@ -0,0 +1,234 @@
+"""
+Moments: a user's photos grouped into candidate journals.
+
+Photos are ordered by when they were taken (time_taken, else the upload time)
+and a new moment starts at a photo that
+- comes more than MOMENT_GAP_HOURS after the previous photo,
+- has a location label other than that of the last labelled photo before it, or
+- was taken more than MOMENT_DISTANCE_KM from the last photo with GPS before it.
+Photos without a label or position never start a moment on their own.
+
+Clustering works on NumPy arrays of the user's photos, so it takes a few
+milliseconds even for 100k photos. The arrays are kept in memory between
+requests and brought up to date from the rows modified since they were loaded
+(photos arriving, descriptions being saved); only deletions reload them.
+time_modified is set when a change is flushed, not when it commits, so the
+rows of the last COMMIT_LAG_SECONDS are read again until a load happens that
+long after the newest one.
+"""
+import os
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import func, select, type_coerce
+from sqlalchemy.types import NullType
+from sqlmodel import Session
+
+from database import Photo as PhotoModel
+
+MOMENT_GAP_HOURS = float(os.getenv("MOMENT_GAP_HOURS", "3"))
+MOMENT_DISTANCE_KM = float(os.getenv("MOMENT_DISTANCE_KM", "25"))
+MOMENT_MIN_PHOTOS = int(os.getenv("MOMENT_MIN_PHOTOS", "3"))  # smaller groups are not offered as candidates
+MOMENT_CACHE_USERS = int(os.getenv("MOMENT_CACHE_USERS", "64"))  # users whose photo arrays stay in memory
+
+EARTH_RADIUS_KM = 6371.0
+COMMIT_LAG_SECONDS = 10  # how long after its time_modified a change may still commit
+
+
+def haversine_km(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    lat1, lon1, lat2, lon2 = (np.radians(a) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+def _last_before(mask: np.ndarray) -> np.ndarray:
+    """For each position, the last position before it where ``mask`` is set, or -1."""
+    last = np.maximum.accumulate(np.where(mask, np.arange(len(mask)), -1))
+    return np.concatenate([[-1], last[:-1]])
+
+
+def moment_starts(times: np.ndarray, locations: np.ndarray, latitudes: np.ndarray, longitudes: np.ndarray,
+                  gap_hours: float = MOMENT_GAP_HOURS, distance_km: float = MOMENT_DISTANCE_KM) -> np.ndarray:
+    """
+    The positions at which moments start, for photos already in time order.
+    ``locations`` are label codes (-1 for none), missing coordinates are NaN.
+    """
+    starts = np.zeros(len(times), bool)
+    if not len(times):
+        return np.flatnonzero(starts)
+    starts[0] = True
+    starts[1:] = np.diff(times) > np.timedelta64(int(gap_hours * 3600), "s")
+
+    previous = _last_before(locations >= 0)
+    moved = (locations >= 0) & (previous >= 0)
+    starts[moved] |= locations[moved] != locations[previous[moved]]
+
+    previous = _last_before(~np.isnan(latitudes))
+    moved = ~np.isnan(latitudes) & (previous >= 0)
+    starts[moved] |= haversine_km(latitudes[previous[moved]], longitudes[previous[moved]],
+                                  latitudes[moved], longitudes[moved]) > distance_km
+    return np.flatnonzero(starts)
+
+
+class PhotoColumns:
+    """
+    What clustering needs of a user's photos, one array per column. Never
+    modified in place: with_rows() returns an updated copy, so requests in
+    other threads keep a consistent snapshot.
+    """
+
+    def __init__(self):
+        self.ids: List[Any] = []  # as stored, see _read_rows
+        self.positions: Dict[Any, int] = {}
+        self.labels: List[str] = []  # location label by code
+        self.codes: Dict[str, int] = {}
+        self.times = np.empty(0, "datetime64[s]")
+        self.locations = np.empty(0, np.int32)
+        self.latitudes = np.empty(0, np.float64)
+        self.longitudes = np.empty(0, np.float64)
+        self._moments: Dict[Tuple[float, float], Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def with_rows(self, rows: Sequence[tuple]) -> "PhotoColumns":
+        """A copy with (photo_id, taken, location, latitude, longitude) rows added or replaced."""
+        columns = PhotoColumns()
+        columns.ids, columns.positions = list(self.ids), dict(self.positions)
+        columns.labels, columns.codes = list(self.labels), dict(self.codes)
+        if not rows:
+            columns.times, columns.locations = self.times, self.locations
+            columns.latitudes, columns.longitudes = self.latitudes, self.longitudes
+            return columns
+        ids, taken, locations, latitudes, longitudes = zip(*rows)
+        for photo_id in ids:
+            if photo_id not in columns.positions:
+                columns.positions[photo_id] = len(columns.ids)
+                columns.ids.append(photo_id)
+
+        added = len(columns.ids) - len(self.ids)
+        columns.times = np.concatenate([self.times, np.empty(added, "datetime64[s]")])
+        columns.locations = np.concatenate([self.locations, np.empty(added, np.int32)])
+        columns.latitudes = np.concatenate([self.latitudes, np.empty(added)])
+        columns.longitudes = np.concatenate([self.longitudes, np.empty(added)])
+        positions = np.array([columns.positions[photo_id] for photo_id in ids])
+        columns.times[positions] = np.array(taken, "datetime64[s]")
+        columns.locations[positions] = [columns._code(location) for location in locations]
+        latitudes, longitudes = np.array(latitudes, np.float64), np.array(longitudes, np.float64)  # None is NaN
+        missing = np.isnan(latitudes) | np.isnan(longitudes)
+        latitudes[missing] = longitudes[missing] = np.nan
+        columns.latitudes[positions], columns.longitudes[positions] = latitudes, longitudes
+        return columns
+
+    def _code(self, location: Optional[str]) -> int:
+        location = (location or "").strip()
+        if not location:
+            return -1
+        if location not in self.codes:
+            self.codes[location] = len(self.labels)
+            self.labels.append(location)
+        return self.codes[location]
+
+    def moments(self, gap_hours: float = MOMENT_GAP_HOURS, distance_km: float = MOMENT_DISTANCE_KM
+                ) -> Tuple[np.ndarray, np.ndarray]:
+        """The photo positions in time order, and the indices into it at which moments start."""
+        key = (gap_hours, distance_km)
+        if key not in self._moments:
+            order = np.argsort(self.times, kind="stable")
+            self._moments[key] = order, moment_starts(self.times[order], self.locations[order], self.latitudes[order],
+                                                      self.longitudes[order], gap_hours, distance_km)
+        return self._moments[key]
+
+
+class _CachedColumns(NamedTuple):
+    columns: PhotoColumns
+    count: int
+    latest: Optional[datetime]  # newest time_modified loaded
+    loaded: datetime
+
+
+_columns: "OrderedDict[UUID, _CachedColumns]" = OrderedDict()
+_columns_lock = threading.Lock()
+
+
+def _read_rows(session: Session, condition) -> List[tuple]:
+    photos = PhotoModel.__table__
+    # ids stay in their stored form; only the moments returned are converted to UUIDs
+    raw_id = type_coerce(photos.c.photo_id, NullType())
+    taken = func.coalesce(photos.c.time_taken, photos.c.time_created)
+    query = select(raw_id, taken, photos.c.location, photos.c.latitude, photos.c.longitude).where(condition)
+    return session.execute(query).all()
+
+
+def load_columns(session: Session, user_id: UUID) -> PhotoColumns:
+    """
+    The arrays of a user's photos. Only the rows modified since they were last
+    loaded (and COMMIT_LAG_SECONDS before) are read, unless photos were deleted
+    in the meantime.
+    """
+    photos = PhotoModel.__table__
+    mine = photos.c.user_id == user_id
+    lag = timedelta(seconds=COMMIT_LAG_SECONDS)
+    loaded = datetime.utcnow()
+    count, latest = session.execute(select(func.count(), func.max(photos.c.time_modified)).where(mine)).one()
+
+    with _columns_lock:
+        cached = _columns.get(user_id)
+        if cached is not None:
+            _columns.move_to_end(user_id)
+    if cached is not None and (cached.count, cached.latest) == (count, latest) \
+            and (latest is None or cached.loaded >= latest + lag):
+        return cached.columns
+
+    columns = None
+    if cached is not None and cached.latest is not None:
+        columns = cached.columns.with_rows(_read_rows(session, mine & (photos.c.time_modified >= cached.latest - lag)))
+    if columns is None or len(columns) != count:
+        columns = PhotoColumns().with_rows(_read_rows(session, mine))
+    with _columns_lock:
+        _columns[user_id] = _CachedColumns(columns, count, latest, loaded)
+        while len(_columns) > MOMENT_CACHE_USERS:
+            _columns.popitem(last=False)
+    return columns
+
+
+def find_moments(session: Session, user_id: UUID, min_photos: int = MOMENT_MIN_PHOTOS,
+                 from_date: Optional[datetime] = None, to_date: Optional[datetime] = None,
+                 offset: int = 0, limit: Optional[int] = None) -> List[dict]:
+    """
+    The moments of a user with at least ``min_photos`` photos, newest first,
+    optionally only those overlapping [from_date, to_date]. Only the requested
+    page is turned into dicts: start, end, photo_count, the most common
+    location label, the mean position of located photos, and the photo ids in
+    the order they were taken, ready for journal generation.
+    """
+    to_uuid = PhotoModel.__table__.c.photo_id.type.process_result_value
+    columns = load_columns(session, user_id)
+    order, starts = columns.moments()
+    ends = np.concatenate([starts[1:], [len(order)]])
+    keep = ends - starts >= min_photos
+    times = columns.times[order]
+    if from_date is not None:
+        keep &= times[ends - 1] >= np.datetime64(from_date, "s")
+    if to_date is not None:
+        keep &= times[starts] <= np.datetime64(to_date, "s")
+    starts, ends = starts[keep][::-1], ends[keep][::-1]
+    page = slice(offset, None if limit is None else offset + limit)
+
+    moments = []
+    for start, end in zip(starts[page], ends[page]):
+        members = order[start:end]
+        labels = [code for code in columns.locations[members] if code >= 0]
+        located = members[~np.isnan(columns.latitudes[members])]
+        moments.append(dict(
+            start=times[start].astype(datetime), end=times[end - 1].astype(datetime), photo_count=int(end - start),
+            location=columns.labels[Counter(labels).most_common(1)[0][0]] if labels else None,
+            latitude=round(float(columns.latitudes[located].mean()), 6) if len(located) else None,
+            longitude=round(float(columns.longitudes[located].mean()), 6) if len(located) else None,
+            photo_ids=[to_uuid(columns.ids[position], None) for position in members],
+        ))
+    return moments
@@ -0,0 +1,74 @@
+"""
+Totals for the paginated listings, sent as X-Total-Count.
+
+A total is an exact COUNT(*) while every filter can be answered from an index
+(the owner, dates, flags, tags). Filters that have to read each row, like
+``contains`` on the LONGTEXT descriptions, are only evaluated on the newest
+TOTAL_COUNT_SCAN rows matching the others; when more rows match those, the
+total is extrapolated from that sample and X-Total-Count-Estimated is set.
+
+Totals are cached per user version next to the pages, without the paging
+parameters, so all pages of a listing share one count until the user writes.
+"""
+import json
+import os
+from typing import Any, Callable, Dict, Sequence, Tuple
+from uuid import UUID
+
+from fastapi import Request
+from sqlalchemy import and_, case, func, select
+from sqlmodel import Session
+
+from database import wrote_recently
+
+from .cache import response_cache
+
+TOTAL_COUNT_SCAN = int(os.getenv("TOTAL_COUNT_SCAN", "10000"))  # rows a scanning filter is evaluated on
+
+
+def count_rows(session: Session, order_column, filters: Sequence, scanned: Sequence = (),
+               limit: int = TOTAL_COUNT_SCAN) -> Tuple[int, bool]:
+    """
+    Count the rows of the table of ``order_column`` matching ``filters`` and
+    ``scanned``, the conditions that need a row scan.
+
+    Returns:
+        Tuple[int, bool]: The total, and whether it is exact.
+    """
+    table = order_column.table
+    total = session.scalar(select(func.count()).select_from(table).where(*filters))
+    if not scanned or not total:
+        return total, True
+    if total <= limit:
+        return session.scalar(select(func.count()).select_from(table).where(*filters, *scanned)), True
+
+    # the newest rows, as they come off the (user_id, order_column) index
+    sample = select(case((and_(*scanned), 1), else_=0).label("hit")).where(*filters) \
+        .order_by(order_column.desc()).limit(limit).subquery()
+    sampled, hits = session.execute(select(func.count(), func.sum(sample.c.hit))).one()
+    return round(total * (hits or 0) / sampled), False
+
+
+def cached_total(request: Request, namespace: str, user_id: UUID, params: Dict[str, Any],
+                 count: Callable[[], Tuple[int, bool]]) -> Tuple[int, bool]:
+    """
+    The count() of a listing with these filters, cached until the user's next
+    write. Like cached_response, a count read from the replica by a user who
+    has just written is not cached: it may not include the write yet.
+    """
+    key = response_cache.key(f"{namespace}-total", user_id, params)
+    cached = response_cache.get(key)
+    if cached is not None:
+        total, exact = json.loads(cached[1])
+        return total, exact
+    total, exact = count()
+    if not (getattr(request.state, "read_replica", False) and wrote_recently(user_id)):
+        response_cache.set(key, json.dumps([total, exact]).encode())
+    return total, exact
+
+
+def total_headers(total: int, exact: bool) -> Dict[str, str]:
+    headers = {"X-Total-Count": str(total)}
+    if not exact:
+        headers["X-Total-Count-Estimated"] = "true"
+    return headers
@@ -0,0 +1,167 @@
+"""
+Perceptual hashes for finding near-duplicate photos.
+
+dhash() shrinks an image to 9x8 grey pixels and records whether brightness
+increases from each pixel to its right neighbour. The 64 bits barely change
+when an image is re-encoded, resized or slightly re-exposed: re-uploads and
+burst shots of one scene end up a few bits apart, while unrelated photos
+differ in about half of the bits.
+
+Pillow is optional. Without it no hashes are computed, and photos without a
+hash are never reported as duplicates.
+"""
+import itertools
+import os
+from typing import BinaryIO, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional, uploads are then stored without a hash
+    Image = None
+
+DUPLICATE_DISTANCE = int(os.getenv("DUPLICATE_DISTANCE", "6"))  # differing bits out of 64
+MAX_DUPLICATE_DISTANCE = 16
+
+HASH_BITS = 64
+
+
+def dhash(file: BinaryIO) -> Optional[str]:
+    """
+    The difference hash of an image as 16 hex digits, leaving the file position
+    unchanged. None if Pillow is not installed or cannot read the image.
+    """
+    if Image is None:
+        return None
+    start = file.tell()
+    try:
+        with Image.open(file) as image:
+            # JPEG decodes straight to 1/8 scale, so full-size pixels are never produced
+            image.draft("L", (64, 64))
+            pixels = ImageOps.exif_transpose(image).convert("L").resize((9, 8), Image.BOX).tobytes()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    finally:
+        file.seek(start)
+    bits = 0
+    for row in range(0, 72, 9):
+        for col in range(row, row + 8):
+            bits = bits << 1 | (pixels[col] < pixels[col + 1])
+    return f"{bits:016x}"
+
+
+def popcount(value: int) -> int:
+    return bin(value).count("1")
+
+
+if hasattr(int, "bit_count"):  # Python 3.10+
+    popcount = int.bit_count
+
+
+def hamming(a: str, b: str) -> int:
+    return popcount(int(a, 16) ^ int(b, 16))
+
+
+class DuplicateIndex:
+    """
+    Finds groups of hashes within ``max_distance`` bits of each other by
+    multi-index hashing. The 64 bits are cut into ``max_distance + 2`` blocks:
+    two hashes differing in at most ``max_distance`` bits agree on at least
+    two whole blocks. For every pair of blocks the hashes are sorted on that
+    pair (16 bits at the default distance), and only hashes next to each other
+    with the same pair are compared, so the work stays close to linear in the
+    number of photos instead of comparing every photo with every other.
+    """
+
+    def __init__(self, max_distance: int = DUPLICATE_DISTANCE):
+        if not 0 <= max_distance <= MAX_DUPLICATE_DISTANCE:
+            raise ValueError(f"max_distance must be between 0 and {MAX_DUPLICATE_DISTANCE}")
+        self.max_distance = max_distance
+        count = max_distance + 2
+        edges = [HASH_BITS * i // count for i in range(count + 1)]
+        self._blocks = [(start, (1 << end - start) - 1) for start, end in zip(edges, edges[1:])]
+        self._items: List[Hashable] = []
+        self._values: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, item: Hashable, phash: str):
+        self._items.append(item)
+        self._values.append(int(phash, 16))
+
+    def near(self, phash: str) -> List[Tuple[int, Hashable]]:
+        """The items within ``max_distance`` of ``phash`` as (distance, item), closest first."""
+        value = int(phash, 16)
+        distances = [popcount(value ^ other) for other in self._values]
+        matches = [(distance, position) for position, distance in enumerate(distances) if distance <= self.max_distance]
+        return [(distance, self._items[position]) for distance, position in sorted(matches)]
+
+    def _candidate_runs(self) -> Iterator[List[int]]:
+        """Runs of positions whose hashes agree on some pair of blocks."""
+        values = self._values
+        bits = max(1, len(values).bit_length())
+        for (shift_a, mask_a), (shift_b, mask_b) in itertools.combinations(self._blocks, 2):
+            # key and position packed in one int, so that a plain integer sort groups the keys
+            keyed = sorted(((value >> shift_a & mask_a) << 32 | (value >> shift_b & mask_b)) << bits | position
+                           for position, value in enumerate(values))
+            mask = (1 << bits) - 1
+            run_key, run = None, []
+            for packed in keyed:
+                key = packed >> bits
+                if key != run_key:
+                    if len(run) > 1:
+                        yield run
+                    run_key, run = key, []
+                run.append(packed & mask)
+            if len(run) > 1:
+                yield run
+
+    def groups(self) -> List[List[Hashable]]:
+        """
+        Items linked by chains of near-duplicates, in the order they were added;
+        only groups of two or more.
+        """
+        parent = list(range(len(self._items)))
+
+        def root(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        values = self._values
+        for run in self._candidate_runs():
+            for i in range(len(run) - 1):
+                value = values[run[i]]
+                for other in run[i + 1:]:
+                    if popcount(value ^ values[other]) <= self.max_distance:
+                        a, b = root(run[i]), root(other)
+                        if a != b:
+                            parent[max(a, b)] = min(a, b)
+
+        members: Dict[int, List[Hashable]] = {}
+        for position, item in enumerate(self._items):
+            members.setdefault(root(position), []).append(item)
+        return [group for group in members.values() if len(group) > 1]
+
+
+def keeper(photos: Sequence) -> object:
+    """
+    The photo to keep out of a group of near-duplicates: one that already has a
+    description (no captioning call needed), then the largest, then the earliest.
+    """
+    return min(photos, key=lambda photo: (not photo.description, -((photo.width or 0) * (photo.height or 0))))
+
+
+def collapse_duplicates(photos: Iterable, max_distance: int = DUPLICATE_DISTANCE) -> list:
+    """``photos`` without near-duplicates, keeping one photo per group and the original order."""
+    photos = list(photos)
+    index = DuplicateIndex(max_distance)
+    for position, photo in enumerate(photos):
+        if photo.phash:
+            index.add(position, photo.phash)
+    dropped = set()
+    for group in index.groups():
+        kept = keeper([photos[position] for position in group])
+        dropped.update(position for position in group if photos[position] is not kept)
+    return [photo for position, photo in enumerate(photos) if position not in dropped]
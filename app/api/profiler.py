@@ -0,0 +1,153 @@
+"""
+Per-request SQL profiler.
+
+Every statement executed while handling a request is recorded with its
+duration and, for INSERT, UPDATE and DELETE, the rows it changed; drivers
+only count the rows of a SELECT as they are fetched, after the statement is
+recorded, so those are left unknown. Statements slower than SLOW_QUERY_MS go
+to the "vmbook.slow_query" log, and a statement shape (the SQL with literals
+and IN lists collapsed) running more than N_PLUS_ONE_THRESHOLD times in one
+request is logged as a likely N+1 query. Only shapes are logged, never the
+bound values, which hold password hashes, API keys and descriptions.
+
+With PROFILER_HEADER=true, a request sending ``X-Debug-Profile: 1`` gets the
+breakdown back in a ``Server-Timing`` header, which browsers show in the
+network panel.
+"""
+import logging
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+PROFILER_HEADER = os.getenv("PROFILER_HEADER", "false").lower() in ("1", "true", "yes")
+DEBUG_HEADER = "X-Debug-Profile"
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("vmbook.slow_query")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|:\w+|\?")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """The statement with literals and placeholders replaced by ?, so repeats of one query compare equal."""
+    shape = _STRING.sub("?", statement)
+    shape = _PLACEHOLDER.sub("?", shape)
+    shape = _NUMBER.sub("?", shape)
+    shape = _IN_LIST.sub("IN (?)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+@dataclass
+class QueryRecord:
+    statement: str
+    duration: float  # seconds
+    rowcount: Optional[int] = None  # rows changed by INSERT/UPDATE/DELETE; None when unknown, as for reads
+
+    @property
+    def shape(self) -> str:
+        return statement_shape(self.statement)
+
+
+@dataclass
+class RequestProfile:
+    queries: List[QueryRecord] = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def db_time(self) -> float:
+        return sum(query.duration for query in self.queries)
+
+    def by_shape(self) -> Dict[str, Tuple[int, float]]:
+        """shape -> (executions, total seconds)"""
+        totals = defaultdict(lambda: [0, 0.0])
+        for query in self.queries:
+            total = totals[query.shape]
+            total[0] += 1
+            total[1] += query.duration
+        return {shape: (count, seconds) for shape, (count, seconds) in totals.items()}
+
+    def repeated(self, threshold: int = None) -> Dict[str, int]:
+        """Statement shapes executed more than ``threshold`` times: likely N+1 queries."""
+        threshold = N_PLUS_ONE_THRESHOLD if threshold is None else threshold
+        counts = Counter(query.shape for query in self.queries)
+        return {shape: count for shape, count in counts.items() if count > threshold}
+
+    def server_timing(self, top: int = 5) -> str:
+        """The profile as a Server-Timing header value: app and db totals, then the costliest statements."""
+        def description(text):
+            return text[:100].replace("\\", "\\\\").replace('"', '\\"')
+
+        total = (time.perf_counter() - self.started) * 1000
+        metrics = [f'app;dur={total:.1f}', f'db;dur={self.db_time * 1000:.1f};desc="{len(self.queries)} queries"']
+        shapes = sorted(self.by_shape().items(), key=lambda item: item[1][1], reverse=True)[:top]
+        for i, (shape, (count, seconds)) in enumerate(shapes, 1):
+            metrics.append(f'q{i};dur={seconds * 1000:.1f};desc="{count}x {description(shape)}"')
+        for i, (shape, count) in enumerate(self.repeated().items(), 1):
+            metrics.append(f'nplusone{i};desc="{count}x {description(shape)}"')
+        return ", ".join(metrics)
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+@contextmanager
+def profile(label: str = ""):
+    """Record the statements executed inside the block (and the threads it hands work to)."""
+    request_profile = RequestProfile()
+    token = _current.set(request_profile)
+    try:
+        yield request_profile
+    finally:
+        _current.reset(token)
+        for shape, count in request_profile.repeated().items():
+            logger.warning(f"Possible N+1 query in {label or 'block'}: {count} executions of {shape[:200]}")
+
+
+def instrument_engine(engine):
+    """Record every statement executed through ``engine`` in the current request's profile."""
+    if getattr(engine, "_vmbook_profiler", False):
+        return
+    engine._vmbook_profiler = True
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._profiler_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context._profiler_start
+        rowcount = None
+        if context.isinsert or context.isupdate or context.isdelete:
+            rowcount = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+        if duration * 1000 >= SLOW_QUERY_MS:
+            rows = f", {rowcount} rows" if rowcount is not None else ""
+            slow_query_logger.warning(f"Slow query ({duration * 1000:.1f} ms{rows}): {statement_shape(statement)}")
+        request_profile = _current.get()
+        if request_profile is not None:
+            request_profile.queries.append(QueryRecord(statement, duration, rowcount))
+
+
+async def profiler_middleware(request: Request, call_next):
+    with profile(f"{request.method} {request.url.path}") as request_profile:
+        response = await call_next(request)
+    if PROFILER_HEADER and request.headers.get(DEBUG_HEADER, "").lower() in ("1", "true"):
+        response.headers["Server-Timing"] = request_profile.server_timing()
+    return response
@@ -0,0 +1,118 @@
+from http import HTTPStatus
+import hashlib
+import os
+import threading
+import time
+
+class ProviderError(Exception):
+    """
+    A failed model call. ``retryable`` is set for rate limiting and server
+    errors, which are worth retrying after a backoff.
+    """
+
+    def __init__(self, message: str, status_code: int = None, retryable: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+
+
+def check_response(response):
+    """Raise ProviderError for a failed dashscope response, retryable for 429 and 5xx."""
+    if response.status_code != HTTPStatus.OK:
+        retryable = response.status_code == HTTPStatus.TOO_MANY_REQUESTS or response.status_code >= 500
+        raise ProviderError(f"{response.code}: {response.message}", response.status_code, retryable)
+
+
+class DashscopeProvider:
+    """
+    Qwen models through dashscope: qwen-vl-plus for image captions and
+    qwen-plus for text generation. The dashscope SDK is slow to import, so it
+    is only loaded when the first provider is created.
+    """
+
+    def __init__(self, vision_model: str = "qwen-vl-plus", text_model: str = "qwen-plus",
+                 temperature: float = 0.5, top_p: float = 0.95, top_k: int = 50):
+        import dashscope
+        dashscope.api_key = os.environ.get("QWEN_API_KEY")
+        self._dashscope = dashscope
+        self.vision_model = vision_model
+        self.text_model = text_model
+        self.temperature = temperature
+        self.top_p = top_p
+        self.top_k = top_k
+
+    def describe_image(self, image_url: str) -> str:
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {"image": image_url},
+                    {"text": "Please describe what you see in this image."},
+                ],
+            }
+        ]
+        response = self._dashscope.MultiModalConversation.call(model=self.vision_model, messages=messages)
+        check_response(response)
+        # Extracting the description
+        if response["output"]["choices"][0]["message"]["content"]:
+            return response["output"]["choices"][0]["message"]["content"][0]["text"]
+        return "Failed to describe image."
+
+    def complete(self, prompt: str) -> str:
+        messages = [{"role": "user", "content": [{"type": "text", "text": prompt}]}]
+        response = self._dashscope.Generation.call(model=self.text_model, messages=messages,
+                                                   temperature=self.temperature, top_p=self.top_p, top_k=self.top_k)
+        check_response(response)
+        if not response["output"]:
+            raise ProviderError("Empty response from model", response.status_code)
+        return response["output"]["text"]
+
+
+class StubProvider:
+    """
+    Deterministic local provider for tests and benchmarks. Answers instantly
+    (or after ``latency`` seconds), and can fail its first ``fail_times`` calls
+    with a retryable error to simulate provider rate limiting.
+    """
+
+    vision_model = "stub-vision"
+    text_model = "stub-text"
+
+    def __init__(self, latency: float = 0.0, fail_times: int = 0):
+        self.latency = latency
+        self.fail_times = fail_times
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _call(self, kind: str, argument: str):
+        with self._lock:
+            self.calls.append((kind, argument))
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                raise ProviderError("Throttling.RateQuota: stub rate limit", HTTPStatus.TOO_MANY_REQUESTS, True)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def describe_image(self, image_url: str) -> str:
+        self._call("describe_image", image_url)
+        return f"A photo ({hashlib.sha1(image_url.encode()).hexdigest()[:8]})"
+
+    def complete(self, prompt: str) -> str:
+        self._call("complete", prompt)
+        digest = hashlib.sha1(prompt.encode()).hexdigest()[:8]
+        return f"# Stub journal {digest}\n\nToday I looked back at {prompt.count('image')} moments."
+
+
+_provider = None
+
+def get_provider():
+    """The model provider used by the API, created on first use."""
+    global _provider
+    if _provider is None:
+        _provider = DashscopeProvider()
+    return _provider
+
+def set_provider(provider):
+    """Replace the model provider, e.g. with a StubProvider in tests."""
+    global _provider
+    _provider = provider
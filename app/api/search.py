@@ -0,0 +1,338 @@
+"""
+Semantic search over photo descriptions.
+
+An embedder turns descriptions into unit vectors, stored per photo in
+photo_embeddings as int8 components and a scale, a quarter of their float32
+size. A search embeds the query and ranks the user's photos by cosine
+similarity with one NumPy matrix-vector product over all of their vectors,
+kept in memory between searches. Brute force needs no training or tuning and
+stays in the low milliseconds up to about a hundred thousand photos per user.
+
+Descriptions are embedded when they are saved (embed_saved), by
+describe_photo and the photo update endpoint. Before each search, photos
+whose vector is still missing or stale (the description changed after
+time_embedded, the embedding failed, or another embedder made it) are caught
+up, at most SEARCH_SYNC_LIMIT per search, and the in-memory index only reads
+the rows written since it was loaded. Rows are stamped when they are written,
+after the (possibly slow) model calls, so they commit within moments of their
+time_embedded; the index reads COMMIT_LAG_SECONDS back to catch rows that
+committed after a newer one.
+
+The default embedder is dashscope's text embedding model, which finds
+"seaside" for "beach". EMBEDDER=hashing picks HashingEmbedder, local and
+deterministic but only lexical: it matches shared words and word stems
+("beaches" finds "beach"), not synonyms.
+"""
+import functools
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+
+from database import Photo as PhotoModel
+from database import PhotoEmbedding as EmbeddingModel
+from .providers import check_response
+
+logger = logging.getLogger(__name__)
+
+EMBEDDER = os.getenv("EMBEDDER", "dashscope")  # dashscope or hashing
+SEARCH_SYNC_LIMIT = int(os.getenv("SEARCH_SYNC_LIMIT", "50"))  # photos caught up per search at most
+SEARCH_INDEX_USERS = int(os.getenv("SEARCH_INDEX_USERS", "64"))  # users whose vectors stay in memory
+
+CHUNK_ROWS = 16384  # rows scored at a time, bounds the float32 temporary
+COMMIT_LAG_SECONDS = 10  # how long after its time_embedded a row may still commit
+
+STOPWORDS = frozenset("a an and are as at be by for from in is it of on or that the this to with".split())
+_WORD = re.compile(r"\w+")
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return (matrix / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+
+def quantize(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Rows of ``matrix`` as int8 components and a float32 scale per row."""
+    scales = (np.abs(matrix).max(axis=1) / 127).astype(np.float32)
+    scales[scales == 0] = 1
+    return np.round(matrix / scales[:, None]).astype(np.int8), scales
+
+
+def description_hash(description: str) -> str:
+    return hashlib.sha1(description.encode()).hexdigest()
+
+
+class HashingEmbedder:
+    """
+    Deterministic local embedder for tests, benchmarks and deployments without
+    an embedding model: every word and its character trigrams are hashed into
+    one of ``dimension`` components with a random sign.
+    """
+
+    def __init__(self, dimension: int = 256):
+        self.dimension = dimension
+        self.name = f"hashing-{dimension}"
+        self._word_features = functools.lru_cache(maxsize=65536)(self._features)
+
+    def _features(self, word: str) -> Tuple[np.ndarray, np.ndarray]:
+        padded = f"<{word}>"
+        grams = [f"w:{word}"] + [f"g:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+        # the trigrams of a word together weigh as much as the word itself
+        weights = [1.0] + [1.0 / np.sqrt(len(grams) - 1)] * (len(grams) - 1)
+        indices, signed = [], []
+        for gram, weight in zip(grams, weights):
+            digest = int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), "little")
+            indices.append(digest % self.dimension)
+            signed.append(weight if digest >> 63 else -weight)
+        return np.array(indices), np.array(signed, np.float32)
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimension), np.float32)
+        for row, text in enumerate(texts):
+            features = [self._word_features(word) for word in _WORD.findall(text.lower()) if word not in STOPWORDS]
+            if features:
+                np.add.at(matrix[row], np.concatenate([indices for indices, _ in features]),
+                          np.concatenate([weights for _, weights in features]))
+        return normalize(matrix)
+
+
+class DashscopeEmbedder:
+    """
+    dashscope's text-embedding-v3, which places "seaside" next to "beach". Like
+    DashscopeProvider, the SDK is only imported when the embedder is created.
+    """
+
+    batch_size = 10  # texts per call, the API's limit
+
+    def __init__(self, model: str = "text-embedding-v3", dimension: int = 512):
+        import dashscope
+        dashscope.api_key = os.environ.get("QWEN_API_KEY")
+        self._dashscope = dashscope
+        self.model = model
+        self.dimension = dimension
+        self.name = f"{model}-{dimension}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        rows = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self._dashscope.TextEmbedding.call(model=self.model, input=list(texts[start:start + self.batch_size]),
+                                                          dimension=self.dimension)
+            check_response(response)
+            embeddings = sorted(response["output"]["embeddings"], key=lambda item: item["text_index"])
+            rows.extend(item["embedding"] for item in embeddings)
+        return normalize(np.array(rows, np.float32).reshape(len(texts), self.dimension))
+
+
+_embedder = None
+
+def get_embedder():
+    """The embedder used by the API, created on first use."""
+    global _embedder
+    if _embedder is None:
+        _embedder = HashingEmbedder() if EMBEDDER == "hashing" else DashscopeEmbedder()
+    return _embedder
+
+def set_embedder(embedder):
+    """Replace the embedder; vectors of the previous one are recomputed as photos are searched."""
+    global _embedder
+    _embedder = embedder
+
+
+def sync_embeddings(session: Session, user_id: UUID, embedder=None, limit: Optional[int] = SEARCH_SYNC_LIMIT,
+                    photo_ids: Optional[Sequence[UUID]] = None) -> int:
+    """
+    Embed the photos of a user (only ``photo_ids``, if given) whose description
+    is new or changed since it was embedded, or was embedded by another
+    embedder, and drop the vectors of photos whose description was removed.
+    Photos modified otherwise (say, starred) keep their vector.
+
+    Returns:
+        int: The number of photos looked at; less than ``limit`` when the user is up to date.
+    """
+    embedder = embedder or get_embedder()
+    photos, embeddings = PhotoModel.__table__, EmbeddingModel.__table__
+    started = datetime.utcnow()  # descriptions are read as of now
+    has_description = and_(photos.c.description.isnot(None), photos.c.description != "")
+    query = select(photos.c.photo_id, photos.c.description, embeddings.c.model, embeddings.c.description_hash) \
+        .select_from(photos.outerjoin(embeddings, embeddings.c.photo_id == photos.c.photo_id)) \
+        .where(photos.c.user_id == user_id,
+               or_(and_(embeddings.c.photo_id.is_(None), has_description),
+                   and_(embeddings.c.photo_id.isnot(None),
+                        or_(embeddings.c.model != embedder.name, photos.c.time_modified > embeddings.c.time_embedded))))
+    if photo_ids is not None:
+        query = query.where(photos.c.photo_id.in_(photo_ids))
+    rows = session.execute(query.limit(limit) if limit else query).all()
+    if not rows:
+        return 0
+
+    removed, unchanged, changed = [], [], []
+    for photo_id, description, model, embedded_hash in rows:
+        if not description:
+            removed.append(photo_id)
+        elif model == embedder.name and embedded_hash == description_hash(description):
+            unchanged.append(photo_id)
+        else:
+            changed.append((photo_id, description))
+
+    vectors, scales = quantize(embedder.embed([description for _, description in changed])) if changed else ((), ())
+
+    # stamp with the time of writing, not of reading: the model calls may have taken a while
+    written = datetime.utcnow()
+    # photos edited while they were embedded are left for the next sync, which sees time_modified > time_embedded
+    looked_at = unchanged + [photo_id for photo_id, _ in changed]
+    edited = set()
+    for start in range(0, len(looked_at), 1000):
+        edited.update(session.execute(select(photos.c.photo_id).where(photos.c.photo_id.in_(looked_at[start:start + 1000]),
+                                                                      photos.c.time_modified > started)).scalars())
+    unchanged = [photo_id for photo_id in unchanged if photo_id not in edited]
+    values = [dict(photo_id=photo_id, user_id=user_id, model=embedder.name, description_hash=description_hash(description),
+                   vector=vector.tobytes(), scale=float(scale), time_embedded=written)
+              for (photo_id, description), vector, scale in zip(changed, vectors, scales) if photo_id not in edited]
+    try:
+        replaced = removed + [value["photo_id"] for value in values]
+        for start in range(0, len(replaced), 1000):
+            session.execute(delete(embeddings).where(embeddings.c.photo_id.in_(replaced[start:start + 1000])))
+        for start in range(0, len(unchanged), 1000):
+            session.execute(update(embeddings).where(embeddings.c.photo_id.in_(unchanged[start:start + 1000]))
+                            .values(time_embedded=written))
+        if values:
+            session.execute(insert(embeddings), values)
+        session.commit()
+    except IntegrityError:
+        # another request synced the same photos first
+        session.rollback()
+    return len(rows)
+
+
+def embed_saved(session: Session, user_id: UUID, photo_ids: Sequence[UUID], embedder=None):
+    """
+    Embed photos whose description was just saved, so that searches find them
+    without embedding them first. The description is saved either way: if the
+    embedder fails, the photos are left to the catch-up of the next searches.
+    """
+    try:
+        sync_embeddings(session, user_id, embedder, limit=None, photo_ids=photo_ids)
+    except Exception:
+        session.rollback()
+        logger.warning(f"Embedding photos {[str(photo_id) for photo_id in photo_ids]} failed, left for search", exc_info=True)
+
+
+class VectorIndex:
+    """
+    The vectors of one user's photos, searched by brute force. Never modified
+    in place: with_rows() returns a new index, so searches running in other
+    threads see a consistent snapshot.
+    """
+
+    def __init__(self, dimension: int, ids: Optional[List[UUID]] = None, matrix: Optional[np.ndarray] = None,
+                 scales: Optional[np.ndarray] = None):
+        self.dimension = dimension
+        self.ids = ids or []
+        self._positions: Dict[UUID, int] = {photo_id: position for position, photo_id in enumerate(self.ids)}
+        self._matrix = matrix if matrix is not None else np.zeros((0, dimension), np.int8)
+        self._scales = scales if scales is not None else np.zeros(0, np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def with_rows(self, ids: Sequence[UUID], matrix: np.ndarray, scales: np.ndarray) -> "VectorIndex":
+        """A copy with the given rows added, or replaced for photos already in the index."""
+        new_matrix, new_scales = self._matrix.copy(), self._scales.copy()
+        added = []
+        for row, photo_id in enumerate(ids):
+            position = self._positions.get(photo_id)
+            if position is None:
+                added.append(row)
+            else:
+                new_matrix[position], new_scales[position] = matrix[row], scales[row]
+        return VectorIndex(self.dimension, self.ids + [ids[row] for row in added],
+                           np.concatenate([new_matrix, matrix[added]]), np.concatenate([new_scales, scales[added]]))
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[UUID, float]]:
+        """The ``k`` photos most similar to the unit vector ``query`` as (photo_id, cosine similarity), best first."""
+        if not self.ids:
+            return []
+        scores = np.empty(len(self.ids), np.float32)
+        for start in range(0, len(scores), CHUNK_ROWS):
+            scores[start:start + CHUNK_ROWS] = self._matrix[start:start + CHUNK_ROWS] @ query
+        scores *= self._scales
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[position], float(scores[position])) for position in top]
+
+
+class _CachedIndex(NamedTuple):
+    index: VectorIndex
+    count: int
+    latest: Optional[datetime]  # newest time_embedded loaded
+    loaded: datetime
+
+
+_indexes: "OrderedDict[Tuple[UUID, str], _CachedIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _read_rows(session: Session, condition, dimension: int) -> Tuple[List[UUID], np.ndarray, np.ndarray]:
+    embeddings = EmbeddingModel.__table__
+    rows = session.execute(select(embeddings.c.photo_id, embeddings.c.vector, embeddings.c.scale).where(condition)).all()
+    matrix = np.frombuffer(b"".join(row.vector for row in rows), np.int8).reshape(len(rows), dimension)
+    return [row.photo_id for row in rows], matrix, np.array([row.scale for row in rows], np.float32)
+
+
+def load_index(session: Session, user_id: UUID, embedder=None) -> VectorIndex:
+    """
+    The in-memory index of a user's vectors. Only vectors written since it was
+    last loaded are read, unless photos were deleted in the meantime. Until a
+    load happens COMMIT_LAG_SECONDS after the newest row, the rows of the last
+    COMMIT_LAG_SECONDS are read again, for writes that committed late.
+    """
+    embedder = embedder or get_embedder()
+    embeddings = EmbeddingModel.__table__
+    mine = and_(embeddings.c.user_id == user_id, embeddings.c.model == embedder.name)
+    lag = timedelta(seconds=COMMIT_LAG_SECONDS)
+    loaded = datetime.utcnow()
+    count, latest = session.execute(select(func.count(), func.max(embeddings.c.time_embedded)).where(mine)).one()
+
+    key = (user_id, embedder.name)
+    with _indexes_lock:
+        cached = _indexes.get(key)
+        if cached is not None:
+            _indexes.move_to_end(key)
+    if cached is not None and (cached.count, cached.latest) == (count, latest) \
+            and (latest is None or cached.loaded >= latest + lag):
+        return cached.index
+
+    index = None
+    if cached is not None and cached.latest is not None:
+        index = cached.index.with_rows(*_read_rows(session, and_(mine, embeddings.c.time_embedded >= cached.latest - lag),
+                                                   embedder.dimension))
+    if index is None or len(index) != count:
+        index = VectorIndex(embedder.dimension, *_read_rows(session, mine, embedder.dimension))
+    with _indexes_lock:
+        _indexes[key] = _CachedIndex(index, count, latest, loaded)
+        while len(_indexes) > SEARCH_INDEX_USERS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def search_photos(session: Session, user_id: UUID, text: str, limit: int = 10, embedder=None) -> List[Tuple[UUID, float]]:
+    """
+    The photos of a user whose descriptions best match ``text``, as (photo_id,
+    score) pairs, best first. Photos sharing nothing with the query are left out.
+    """
+    embedder = embedder or get_embedder()
+    sync_embeddings(session, user_id, embedder)
+    query = embedder.embed([text])[0]
+    return [(photo_id, score) for photo_id, score in load_index(session, user_id, embedder).search(query, limit)
+            if score > 0]
@@ -0,0 +1,131 @@
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from models import DeviceResponse, EntryResponse, JournalResponse, PhotoResponse, UserResponse
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib encoder
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(jsonable_encoder(content)).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Default response class: encodes with orjson when it is installed, and with
+    the stdlib json module otherwise.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class ListSerializer:
+    """
+    Serializes lists of ORM rows as a list of ``model``.
+
+    Rows loaded from our own database are trusted, so by default they skip
+    pydantic validation: the model's fields are read straight off each row and
+    encoded in one go. ``validate=True`` runs the rows through the pre-built
+    TypeAdapter instead, which is what ``response_model=List[model]`` does.
+
+    ``relations`` maps relationship names to the serializers of the related
+    rows; a relationship is only read when it is explicitly included, so that
+    serializing never triggers a lazy load.
+    """
+
+    def __init__(self, model, relations: Optional[Dict[str, "ListSerializer"]] = None):
+        self.model = model
+        self.adapter = TypeAdapter(List[model])
+        self.defaults = {
+            name: None if field.is_required() else field.default
+            for name, field in model.model_fields.items()
+        }
+        self.relations = relations or {}
+
+    def to_dicts(self, rows: Iterable[Any], fields: Optional[List[str]] = None,
+                 include: Optional[List[str]] = None) -> List[dict]:
+        rows = list(rows)
+        defaults = self.defaults
+        if fields is not None:
+            defaults = {name: defaults[name] for name in fields}
+        items = [{name: getattr(row, name, default) for name, default in defaults.items()} for row in rows]
+        for relation in include or []:
+            serializer = self.relations[relation]
+            for item, row in zip(items, rows):
+                related = getattr(row, relation)
+                if related is None:
+                    item[relation] = None
+                elif isinstance(related, list):
+                    item[relation] = serializer.to_dicts(related)
+                else:
+                    item[relation] = serializer.to_dicts([related])[0]
+        return items
+
+    def dump(self, rows: Iterable[Any], validate: bool = False, fields: Optional[List[str]] = None,
+             include: Optional[List[str]] = None) -> bytes:
+        """
+        Encode ``rows`` as a JSON list. ``fields`` restricts the output to a subset
+        of the model's fields, so that rows loaded with ``load_only`` are never
+        asked for their unloaded columns; projections are always encoded on the
+        trusted path. ``include`` adds the named relationships.
+        """
+        rows = list(rows)
+        if validate and fields is None and not include:
+            return self.adapter.dump_json(self.adapter.validate_python(rows, from_attributes=True))
+        data = self.to_dicts(rows, fields, include)
+        if orjson is not None or fields is not None or include:
+            return dumps(data)
+        return self.adapter.dump_json([self.model.model_construct(**item) for item in data])
+
+    def parse_fields(self, fields: Optional[str], summary, key: str) -> List[str]:
+        """
+        Resolve a ``fields=`` query parameter: None selects every field of the
+        model, "summary" selects the fields of the ``summary`` model (a subset
+        of the model's fields), and a
+        comma-separated list selects those fields plus the primary ``key``.
+
+        Raises:
+            ValueError: If a requested field is not part of the model.
+        """
+        if not fields:
+            return list(self.defaults)
+        if fields == "summary":
+            return list(summary.model_fields)
+        requested = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in requested if name not in self.defaults]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return [key] + [name for name in requested if name != key]
+
+    def parse_include(self, include: Optional[str]) -> List[str]:
+        """
+        Resolve an ``include=`` query parameter into relationship names.
+
+        Raises:
+            ValueError: If a requested relationship cannot be included.
+        """
+        if not include:
+            return []
+        requested = list(dict.fromkeys(name.strip() for name in include.split(",") if name.strip()))
+        unknown = [name for name in requested if name not in self.relations]
+        if unknown:
+            raise ValueError(f"Cannot include: {', '.join(unknown)}")
+        return requested
+
+
+device_list = ListSerializer(DeviceResponse)
+entry_list = ListSerializer(EntryResponse)
+user_list = ListSerializer(UserResponse, relations={"devices": device_list})
+journal_list = ListSerializer(JournalResponse)
+photo_list = ListSerializer(PhotoResponse, relations={"device": device_list, "journal": journal_list})
+journal_list.relations.update(photos=photo_list, entries=entry_list)
@@ -0,0 +1,108 @@
+"""
+Single-flight coordination: concurrent requests for the same piece of work
+share one execution and its result instead of repeating it.
+
+SingleFlight does this within a process. DatabaseLease extends it across
+workers: whoever holds the lease row for a key does the work, the others wait
+for the lease to be released (or to expire, if its holder died) and then read
+the result from the database.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+
+from database import Lease as LeaseModel
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = float(os.getenv("LEASE_SECONDS", "60"))  # longer than the slowest model call
+LEASE_POLL_SECONDS = float(os.getenv("LEASE_POLL_SECONDS", "0.25"))
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers arriving while a call for
+    their key is in flight await that call's result (or exception). The call
+    runs as its own task, so a caller going away does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def inflight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None or call.get_loop() is not asyncio.get_running_loop():
+            call = asyncio.ensure_future(fn())
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(call)
+
+    def _finish(self, key: Hashable, call: asyncio.Future):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # every caller may have been cancelled; don't let the exception go unretrieved
+        if not call.cancelled():
+            call.exception()
+
+
+class DatabaseLease:
+    """
+    A named, expiring lock in the ``leases`` table, shared by every worker
+    using the database. Only the owner can release a lease; a lease whose
+    holder did not release it within ``ttl`` seconds can be taken over.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], ttl: float = LEASE_SECONDS,
+                 poll: float = LEASE_POLL_SECONDS):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.poll = poll
+
+    def acquire(self, name: str, owner: str) -> bool:
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl)
+        with self.session_factory() as session:
+            try:
+                session.execute(insert(LeaseModel).values(name=name, owner=owner, expires_at=expires_at))
+                session.commit()
+                return True
+            except IntegrityError:
+                session.rollback()
+            # held: take it over only if it has expired
+            taken = session.execute(update(LeaseModel)
+                                    .where(LeaseModel.name == name, LeaseModel.expires_at < now)
+                                    .values(owner=owner, expires_at=expires_at))
+            session.commit()
+            if taken.rowcount:
+                logger.warning(f"Took over expired lease {name}")
+            return taken.rowcount == 1
+
+    def release(self, name: str, owner: str):
+        with self.session_factory() as session:
+            session.execute(delete(LeaseModel).where(LeaseModel.name == name, LeaseModel.owner == owner))
+            session.commit()
+
+    def held(self, name: str) -> bool:
+        with self.session_factory() as session:
+            expires_at = session.execute(select(LeaseModel.expires_at).where(LeaseModel.name == name)).scalar()
+        return expires_at is not None and expires_at >= datetime.utcnow()
+
+    async def wait(self, name: str, timeout: Optional[float] = None):
+        """Wait until nobody holds the lease (it was released or has expired), or ``timeout`` seconds."""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while await asyncio.to_thread(self.held, name):
+            if deadline is not None and loop.time() >= deadline:
+                return
+            await asyncio.sleep(self.poll)
@@ -0,0 +1,26 @@
+import os
+import threading
+
+_bucket = None
+_lock = threading.Lock()
+
+
+def get_bucket():
+    """
+    The OSS bucket photos are uploaded to, created on first use. oss2 is slow
+    to import and needs credentials, so neither happens when the app starts.
+    """
+    global _bucket
+    if _bucket is None:
+        with _lock:
+            if _bucket is None:
+                import oss2
+                from oss2.credentials import EnvironmentVariableCredentialsProvider
+                auth = oss2.ProviderAuth(EnvironmentVariableCredentialsProvider())
+                _bucket = oss2.Bucket(auth, os.getenv('OSS_ENDPOINT'), os.getenv("OSS_BUCKET_NAME"))
+    return _bucket
+
+def set_bucket(bucket):
+    """Replace the bucket, e.g. with a local stub in tests and benchmarks."""
+    global _bucket
+    _bucket = bucket
@@ -0,0 +1,116 @@
+"""
+Journal tags: a tags table per user, linked to journals through journal_tags.
+
+Every tag carries the number of journals it is on (journal_count), so the tag
+facet of a user is read from a handful of rows instead of counting links. The
+count is only changed here, in the same transaction as the links and with
+``journal_count = journal_count + n`` in SQL, so concurrent requests cannot
+lose an update. Tags are always written through set_journal_tags() and journals
+deleted after untag_journals().
+"""
+import re
+from typing import Iterable, List, Sequence
+from uuid import UUID
+
+from sqlalchemy import and_, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+
+from database import Journal as JournalModel
+from database import JournalTag as JournalTagModel
+from database import Tag as TagModel
+
+MAX_TAG_LENGTH = 64
+MAX_TAGS = 20  # per journal
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_tags(names: Iterable[str]) -> List[str]:
+    """
+    Tags as stored: trimmed, lowercase, inner whitespace collapsed, empty and
+    repeated tags dropped, in their original order.
+
+    Raises:
+        ValueError: If a tag is too long or there are too many.
+    """
+    tags = list(dict.fromkeys(_SPACES.sub(" ", name).strip().lower() for name in names if name and name.strip()))
+    too_long = [tag for tag in tags if len(tag) > MAX_TAG_LENGTH]
+    if too_long:
+        raise ValueError(f"Tags are limited to {MAX_TAG_LENGTH} characters: {', '.join(too_long)}")
+    if len(tags) > MAX_TAGS:
+        raise ValueError(f"A journal has at most {MAX_TAGS} tags")
+    return tags
+
+
+def parse_tags(tags: str) -> List[str]:
+    """A comma-separated ``tags=`` query parameter as normalized tags."""
+    return normalize_tags(tags.split(","))
+
+
+def _get_or_create(session: Session, user_id: UUID, names: Sequence[str]) -> List[TagModel]:
+    existing = {tag.name: tag for tag in session.query(TagModel)
+                .filter(TagModel.user_id == user_id, TagModel.name.in_(names)).all()}
+    for name in names:
+        if name not in existing:
+            try:
+                with session.begin_nested():
+                    existing[name] = TagModel(user_id=user_id, name=name)
+                    session.add(existing[name])
+            except IntegrityError:
+                # created by a concurrent request
+                existing[name] = session.query(TagModel).filter(TagModel.user_id == user_id, TagModel.name == name).one()
+    return [existing[name] for name in names]
+
+
+def _add_to_counts(session: Session, tag_ids: Sequence[UUID], delta: int):
+    if tag_ids:
+        session.execute(update(TagModel).where(TagModel.tag_id.in_(tag_ids))
+                        .values(journal_count=TagModel.journal_count + delta))
+
+
+def set_journal_tags(session: Session, journal: JournalModel, names: Iterable[str]):
+    """
+    Replace the tags of ``journal`` (normalized, see normalize_tags) and adjust
+    the tag counts. The caller commits.
+    """
+    tags = _get_or_create(session, journal.user_id, normalize_tags(names))
+    current = {tag.tag_id for tag in journal.tag_rows}
+    wanted = {tag.tag_id for tag in tags}
+    journal.tag_rows = tags
+    session.flush()
+    _add_to_counts(session, list(wanted - current), 1)
+    _add_to_counts(session, list(current - wanted), -1)
+
+
+def untag_journals(session: Session, journal_ids: Sequence[UUID]):
+    """
+    Take journals about to be deleted off the tag counts; deleting them removes
+    their journal_tags rows. The caller deletes the journals and commits.
+    """
+    links = JournalTagModel.__table__
+    for start in range(0, len(journal_ids), 1000):
+        counts = session.execute(select(links.c.tag_id, func.count()).where(links.c.journal_id.in_(journal_ids[start:start + 1000]))
+                                 .group_by(links.c.tag_id)).all()
+        for tag_id, count in counts:
+            _add_to_counts(session, [tag_id], -count)
+
+
+def tag_filter(user_id: UUID, names: Sequence[str], match_all: bool):
+    """
+    A condition on JournalModel.journal_id selecting journals with any of the
+    tags ``names``, or with all of them.
+    """
+    tagged = select(JournalTagModel.journal_id).join(TagModel, TagModel.tag_id == JournalTagModel.tag_id) \
+        .where(and_(TagModel.user_id == user_id, TagModel.name.in_(names)))
+    if match_all:
+        tagged = tagged.group_by(JournalTagModel.journal_id).having(func.count() == len(names))
+    return JournalModel.journal_id.in_(tagged)
+
+
+def tag_counts(session: Session, user_id: UUID) -> List[dict]:
+    """The tags of a user in use, most used first, with the number of journals for each."""
+    rows = session.query(TagModel.name, TagModel.journal_count) \
+        .filter(TagModel.user_id == user_id, TagModel.journal_count > 0) \
+        .order_by(TagModel.journal_count.desc(), TagModel.name.asc()).all()
+    return [dict(name=name, journal_count=count) for name, count in rows]
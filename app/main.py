@@ -3,17 +3,38 @@ import os
 from pathlib import Path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# the one place .env is read; everything below reads os.environ
+import dotenv
+dotenv.load_dotenv()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
-from database import get_db
+from database import get_db, get_engine, dispose_engine, on_engine_created
 from api import router
-import dotenv
+from api.serialization import FastJSONResponse
+from api import metrics, profiler
+from api.jobs import get_scheduler
 
-dotenv.load_dotenv()
 
-app = FastAPI()
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "25"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # create the engine (and its pool) in each worker, after any fork
+    get_engine()
+    get_scheduler().start()
+    yield
+    # the server has stopped accepting requests and finished the in-flight ones;
+    # let queued generation jobs finish before the pool goes away
+    await get_scheduler().shutdown(SHUTDOWN_DRAIN_TIMEOUT)
+    dispose_engine()
+
+
+app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
 
 
 app.add_middleware(
@@ -22,11 +43,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # totals of the paginated listings, see api/pagination.py
+    expose_headers=["ETag", "X-Total-Count", "X-Total-Count-Estimated"],
 )
 
 # Your FastAPI app setup code here
 app.include_router(router)
 
+on_engine_created(metrics.instrument_engine)
+on_engine_created(profiler.instrument_engine)
+app.middleware("http")(profiler.profiler_middleware)
+app.middleware("http")(metrics.metrics_middleware)
+app.add_api_route("/metrics", metrics.metrics_endpoint, methods=["GET"], include_in_schema=False)
+
 
 # Example of using the get_db function
 @app.get("/")
@@ -36,7 +65,7 @@ async def root():
     return {"message": "Welcome to VMBook!"}
 
 import logging
-from requests import Request
+from fastapi import Request
 
 @app.middleware("http") 
 async def log_requests(request: Request, call_next): 
@@ -54,4 +83,5 @@ if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
     # or run with `uvicorn main:app --reload --host 0.0.0.0` in the terminal
+    # in production, run `python server.py` for one worker process per CPU
     
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""
+Production entry point: several worker processes behind one port.
+
+    python server.py                 # one worker, or one per CPU with CACHE_URL set
+    CACHE_URL=redis://cache:6379/0 WEB_CONCURRENCY=8 python server.py --port 8000
+
+Uses gunicorn with uvicorn workers where gunicorn is installed (it restarts
+crashed workers and recycles them after MAX_REQUESTS), otherwise
+``uvicorn --workers``. uvloop and httptools are used when installed. Each
+worker imports the app itself and creates its own engine in the lifespan
+hook, so no connections are shared across processes. On SIGTERM workers
+stop accepting connections, finish in-flight requests, drain queued
+generation jobs (SHUTDOWN_DRAIN_TIMEOUT) and close their pools within
+GRACEFUL_TIMEOUT seconds.
+
+Workers share nothing in memory, so running more than one needs CACHE_URL,
+the Redis that holds the state all workers must agree on: the response cache
+and user versions (api/cache.py), the last write of each user that keeps their
+reads on the primary (database.wrote_recently), the device name versions
+(api/devices.py) and the GENERATION_RATE token bucket (api/jobs.py). Without
+it, one worker's writes leave the others serving stale pages and each worker
+would call the model at the full rate. What stays per worker: the generation
+queues, so round-robin fairness and the single-flight of identical queued
+jobs hold within a worker (finished jobs are still reused across workers,
+from the database), plus the moments and search indexes, which revalidate
+against the database on every request.
+"""
+import argparse
+import importlib.util
+import logging
+import os
+
+logger = logging.getLogger("vmbook.server")
+
+APP = "main:app"
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (respects taskset/cpuset limits, unlike os.cpu_count)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def default_workers() -> int:
+    # requests spend most of their time waiting on MySQL, OSS or the model, and the
+    # sync endpoints run in each worker's thread pool, so one worker per core is enough
+    # empty counts as unset: docker-compose passes WEB_CONCURRENCY through even when the host has none
+    return int(os.getenv("WEB_CONCURRENCY") or (available_cpus() if os.getenv("CACHE_URL") else 1))
+
+
+def installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def run_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": f"{args.host}:{args.port}",
+                "workers": args.workers,
+                "worker_class": "uvicorn.workers.UvicornWorker",
+                "graceful_timeout": args.graceful_timeout,
+                "timeout": args.timeout,
+                "keepalive": args.keepalive,
+                "max_requests": args.max_requests,
+                "max_requests_jitter": args.max_requests // 10,
+                # import the app in each worker, not in the master, so nothing is created before the fork
+                "preload_app": False,
+                "accesslog": "-" if args.access_log else None,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from main import app
+            return app
+
+    Application().run()
+
+
+def run_uvicorn(args):
+    import uvicorn
+
+    uvicorn.run(APP, host=args.host, port=args.port, workers=args.workers, loop="auto", http="auto",
+                timeout_keep_alive=args.keepalive, timeout_graceful_shutdown=args.graceful_timeout,
+                access_log=args.access_log, proxy_headers=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", "30")))
+    # journal generation waits on the model for up to GENERATION_TIMEOUT, don't kill workers before that
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("WORKER_TIMEOUT", "180")))
+    parser.add_argument("--keepalive", type=int, default=int(os.getenv("KEEPALIVE", "5")))
+    parser.add_argument("--max-requests", type=int, default=int(os.getenv("MAX_REQUESTS", "10000")))
+    parser.add_argument("--access-log", action="store_true")
+    parser.add_argument("--server", choices=["auto", "gunicorn", "uvicorn"], default=os.getenv("SERVER", "auto"))
+    args = parser.parse_args()
+    if args.workers > 1 and not os.getenv("CACHE_URL"):
+        parser.error(f"{args.workers} workers need CACHE_URL: caches, rate limits and read-after-write "
+                     "routing would otherwise differ per worker")
+
+    logging.basicConfig(level=logging.INFO)
+    server = args.server
+    if server == "auto":
+        server = "gunicorn" if installed("gunicorn") else "uvicorn"
+    logger.info(f"Starting {args.workers} {server} workers on {args.host}:{args.port} "
+                f"(loop: {'uvloop' if installed('uvloop') else 'asyncio'}, "
+                f"http: {'httptools' if installed('httptools') else 'h11'})")
+    if server == "gunicorn":
+        run_gunicorn(args)
+    else:
+        run_uvicorn(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Microbenchmark: list response serialization.
+
+Compares the old path (validate every ORM row through the response model, then
+encode with jsonable_encoder + json.dumps) with the fast path in
+api/serialization.py (trusted rows, pre-built TypeAdapter / orjson).
+
+    python benchmarks/bench_serialization.py --items 100 --description-size 4000
+"""
+import sys
+import os
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "app")]
+# importing the api package builds the engine and OSS bucket; nothing is contacted
+os.environ.setdefault("DB_URL", "sqlite://")
+os.environ.setdefault("OSS_ENDPOINT", "http://oss.invalid")
+os.environ.setdefault("OSS_BUCKET_NAME", "vmbook-bench")
+
+import argparse
+import json
+import timeit
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from fastapi.encoders import jsonable_encoder
+
+from models import PhotoResponse
+from api.serialization import photo_list
+
+
+def make_rows(items: int, description_size: int):
+    now = datetime.utcnow()
+    user_id, device_id = uuid.uuid4(), uuid.uuid4()
+    return [
+        SimpleNamespace(
+            photo_id=uuid.uuid4(), user_id=user_id, device_id=device_id, journal_id=None,
+            time_created=now - timedelta(minutes=i), time_modified=now - timedelta(minutes=i),
+            url=f"https://bucket.example.com/{uuid.uuid4()}_photo.jpg",
+            description=("A quiet street in the early morning light. " * (description_size // 43 + 1))[:description_size],
+            file_name=f"IMG_{i:04d}.jpg",
+        )
+        for i in range(items)
+    ]
+
+
+def old_path(rows):
+    return json.dumps(jsonable_encoder([PhotoResponse.model_validate(row) for row in rows])).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--description-size", type=int, default=4000)
+    parser.add_argument("--number", type=int, default=50)
+    args = parser.parse_args()
+
+    rows = make_rows(args.items, args.description_size)
+    assert json.loads(old_path(rows)) == json.loads(photo_list.dump(rows))
+
+    cases = {
+        "old (model_validate + jsonable_encoder)": lambda: old_path(rows),
+        "new, validated (TypeAdapter)": lambda: photo_list.dump(rows, validate=True),
+        "new, trusted rows": lambda: photo_list.dump(rows),
+    }
+    baseline = None
+    for name, fn in cases.items():
+        best = min(timeit.repeat(fn, number=args.number, repeat=5)) / args.number * 1000
+        baseline = baseline or best
+        print(f"{name:45s} {best:8.3f} ms/page  {baseline / best:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
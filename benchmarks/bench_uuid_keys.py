@@ -0,0 +1,131 @@
+"""
+Microbenchmark: UUID key storage and insert locality.
+
+Builds a photos-like table (uuid primary key plus three indexed uuid foreign
+key columns) with CHAR(32) hex keys, the old MySQL layout, or BINARY(16) keys
+(database.BinaryUUID), and fills it with random uuid4 or time-ordered uuid7
+primary keys (database/ids.py). Reports insert throughput overall and for the
+last tenth of the rows, where random keys pay for a clustered index that no
+longer fits in cache, plus table and index sizes.
+
+    python benchmarks/bench_uuid_keys.py --rows 2000000
+    python benchmarks/bench_uuid_keys.py --db-url mysql+mysqlconnector://root:pw@localhost:3306/vmbook_bench
+"""
+import sys
+import os
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import argparse
+import random
+import tempfile
+import time
+import uuid
+from typing import Dict
+
+from database.ids import uuid7
+
+from sqlalchemy import CHAR, Column, Index, MetaData, Table, create_engine, insert, text
+from sqlalchemy.dialects.mysql import BINARY
+from sqlalchemy.types import UserDefinedType
+
+
+class Blob(UserDefinedType):
+    """A plain BLOB column, without LargeBinary's per-value wrapping (SQLite has no BINARY(16))."""
+    cache_ok = True
+
+    def get_col_spec(self, **kw):
+        return "BLOB"
+
+
+def binary_type(engine):
+    return BINARY(16) if engine.dialect.name == "mysql" else Blob()
+
+
+def make_table(metadata: MetaData, name: str, key_type) -> Table:
+    return Table(
+        name, metadata,
+        Column("photo_id", key_type, primary_key=True),
+        Column("user_id", key_type, nullable=False),
+        Column("device_id", key_type, nullable=False),
+        Column("journal_id", key_type),
+        Column("url", CHAR(64), nullable=False),
+        Index(f"ix_{name}_user_id", "user_id"),
+        Index(f"ix_{name}_device_id", "device_id"),
+        Index(f"ix_{name}_journal_id", "journal_id"),
+    )
+
+
+def sizes(engine, table: str) -> Dict[str, int]:
+    """Bytes used by the table's rows and by its secondary indexes."""
+    with engine.connect() as conn:
+        if engine.dialect.name == "mysql":
+            conn.execute(text(f"ANALYZE TABLE `{table}`"))
+            data, index = conn.execute(text(
+                "SELECT data_length, index_length FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_name = :table"), {"table": table}).one()
+            return {"data": int(data), "indexes": int(index)}
+        # SQLite: sum the pages of the table and of each of its indexes
+        rows = conn.execute(text("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")).all()
+        used = dict(rows)
+        indexes = sum(size for name, size in used.items() if name.startswith(f"ix_{table}_"))
+        data = used.get(table, 0) + used.get(f"sqlite_autoindex_{table}_1", 0)
+        return {"data": data, "indexes": indexes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db-url", default=None, help="a scratch database; defaults to a temporary SQLite file")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--variants", default="char32-uuid4,binary16-uuid4,binary16-uuid7")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    url = args.db_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "vmbook-uuid.db")
+    engine = create_engine(url)
+    layouts = {
+        "char32": (CHAR(32), lambda value: value.hex),
+        "binary16": (binary_type(engine), lambda value: value.bytes),
+    }
+    id_factories = {"uuid4": uuid.uuid4, "uuid7": uuid7}
+
+    print(f"{args.rows} rows ({engine.dialect.name})")
+    print(f"{'variant':16s} {'rows/s':>9s} {'last 10%':>9s} {'data MB':>9s} {'index MB':>9s}")
+    for variant in args.variants.split(","):
+        layout, ids = variant.split("-")
+        key_type, encode = layouts[layout]
+        new_id = id_factories[ids]
+        rng = random.Random(args.seed)
+        users = [encode(uuid.UUID(int=rng.getrandbits(128))) for _ in range(max(1, args.rows // 2000))]
+        devices = [encode(uuid.UUID(int=rng.getrandbits(128))) for _ in range(len(users) * 2)]
+        journals = [encode(uuid.UUID(int=rng.getrandbits(128))) for _ in range(max(1, args.rows // 20))]
+
+        metadata = MetaData()
+        table = make_table(metadata, f"bench_uuid_{layout}_{ids}", key_type)
+        metadata.drop_all(engine)
+        metadata.create_all(engine)
+
+        timings = []
+        for start in range(0, args.rows, args.batch_size):
+            # rows are built outside the timed section, ids are made at insert time as in the app
+            batch = [dict(photo_id=None, user_id=rng.choice(users), device_id=rng.choice(devices),
+                          journal_id=rng.choice(journals) if rng.random() < 0.3 else None, url="x" * 64)
+                     for _ in range(min(args.batch_size, args.rows - start))]
+            began = time.perf_counter()
+            for row in batch:
+                row["photo_id"] = encode(new_id())
+            with engine.begin() as conn:
+                conn.execute(insert(table), batch)
+            timings.append((len(batch), time.perf_counter() - began))
+
+        total = sum(seconds for _, seconds in timings)
+        tail = timings[-max(1, len(timings) // 10):]
+        used = sizes(engine, table.name)
+        print(f"{variant:16s} {args.rows / total:9.0f} {sum(n for n, _ in tail) / sum(t for _, t in tail):9.0f} "
+              f"{used['data'] / 2 ** 20:9.1f} {used['indexes'] / 2 ** 20:9.1f}")
+        metadata.drop_all(engine)
+
+
+if __name__ == "__main__":
+    main()
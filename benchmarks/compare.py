@@ -0,0 +1,43 @@
+"""
+Diff two benchmark result files written by run_benchmarks.py.
+
+    python benchmarks/compare.py base.json head.json
+"""
+import argparse
+import json
+
+METRICS = ["p50_ms", "p95_ms", "p99_ms", "throughput_rps"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change flagged as a regression")
+    args = parser.parse_args()
+
+    base, head = (json.load(open(path)) for path in (args.base, args.head))
+    print(f"base: {base['environment'].get('commit')}  head: {head['environment'].get('commit')}")
+    print(f"{'scenario':24s} " + " ".join(f"{metric:>22s}" for metric in METRICS))
+
+    regressions = 0
+    for name, result in head["results"].items():
+        if name not in base["results"]:
+            continue
+        cells = []
+        for metric in METRICS:
+            old, new = base["results"][name][metric], result[metric]
+            change = (new - old) / old * 100 if old else 0.0
+            # latency going up or throughput going down is a regression
+            worse = change > args.threshold if metric.endswith("_ms") else change < -args.threshold
+            regressions += worse
+            cells.append(f"{old:8.2f} -> {new:8.2f} {change:+5.0f}%{'!' if worse else ' '}")
+        print(f"{name:24s} " + " ".join(f"{cell:>22s}" for cell in cells))
+
+    if regressions:
+        print(f"{regressions} metric(s) regressed by more than {args.threshold:.0f}%")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,142 @@
+"""
+In-process benchmark harness.
+
+Boots the FastAPI app inside the benchmark process against a disposable
+database (a fresh SQLite file by default, or BENCH_DB_URL, e.g. a throwaway
+MySQL schema), with OSS and dashscope replaced by local stubs, and times
+requests through the ASGI test client. Nothing leaves the machine.
+"""
+import sys
+import os
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "app")]
+
+import tempfile
+
+BENCH_DB_URL = os.getenv("BENCH_DB_URL") or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "vmbook-bench.db")
+# must be set before the app creates the engine
+os.environ["DB_URL"] = BENCH_DB_URL
+os.environ["EMBEDDER"] = "hashing"  # search is measured without dashscope's latency
+
+import math
+import platform
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from fastapi.testclient import TestClient
+from sqlmodel import SQLModel
+
+
+class StubBucket:
+    """Stands in for oss2.Bucket: accepts uploads and signs URLs without any network."""
+
+    def __init__(self):
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def put_object(self, key, data):
+        body = data.read() if hasattr(data, "read") else data
+        with self._lock:
+            self.objects[key] = len(body)
+
+    def sign_url(self, method, key, expires, slash_safe=False):
+        return f"https://vmbook-bench.oss.invalid/{key}?Expires={expires}"
+
+
+def boot(provider_latency: float = 0.0):
+    """
+    Import the app against the benchmark database, create the tables and swap
+    in the stub bucket and model provider.
+
+    Returns:
+        TestClient: A client calling the app in-process.
+    """
+    from main import app
+    from database import engine
+    from api.storage import set_bucket
+    from api.providers import StubProvider, set_provider
+    from api.jobs import get_scheduler, TokenBucket
+
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    set_bucket(StubBucket())
+    set_provider(StubProvider(latency=provider_latency))
+    # measure our own overhead, not the provider rate limit
+    get_scheduler().bucket = TokenBucket(rate=1e9, capacity=10 ** 9)
+    return TestClient(app)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def run_scenario(request: Callable[[int], object], requests: int, concurrency: int = 1,
+                 setup: Callable[[], None] = None) -> Dict[str, float]:
+    """
+    Time ``requests`` calls of ``request(i)``, spread over ``concurrency`` threads.
+    ``setup`` runs untimed before every call (e.g. to clear caches).
+
+    Returns:
+        Dict[str, float]: Latency percentiles in milliseconds and throughput in requests per second.
+    """
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def call(i):
+        nonlocal errors
+        if setup:
+            setup()
+        start = time.perf_counter()
+        response = request(i)
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        for i in range(requests):
+            call(i)
+    else:
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(call, range(requests)))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "concurrency": concurrency,
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(latencies[-1], 3),
+        "throughput_rps": round(requests / wall, 1),
+    }
+
+
+def environment() -> Dict[str, str]:
+    """Where the numbers come from, so result files can be compared meaningfully."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": BENCH_DB_URL.split("://")[0],
+    }
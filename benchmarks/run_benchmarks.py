@@ -0,0 +1,142 @@
+"""
+API load test and benchmark suite.
+
+Seeds a disposable database with realistic volumes, then measures latency
+percentiles and throughput of the main endpoints in-process (see harness.py).
+Results are written as JSON so runs on different commits can be diffed with
+benchmarks/compare.py.
+
+    python benchmarks/run_benchmarks.py --photos-per-user 50000 --output bench.json
+    BENCH_DB_URL=mysql+mysqlconnector://root:pw@localhost:3306/vmbook_bench python benchmarks/run_benchmarks.py
+"""
+import harness  # sets up paths and the benchmark database before anything imports the app
+
+import argparse
+import json
+import os
+import random
+from datetime import datetime
+
+
+def seed(engine, users: int, photos_per_user: int, journals_per_user: int, entries_per_user: int, seed: int = 0):
+    """
+    Fill the database with scripts/generate_data.py.
+
+    Returns:
+        list: (user_id, photo_ids) for every seeded user.
+    """
+    from sqlmodel import Session, select
+    from database import User, Photo
+    from scripts.generate_data import DataGenerator, GeneratorConfig
+
+    config = GeneratorConfig(users=users, devices_per_user=1, photos_per_user=photos_per_user,
+                             journals_per_user=journals_per_user, entries_per_user=entries_per_user, seed=seed)
+    DataGenerator(config).generate(engine, log=None)
+    with Session(engine) as session:
+        return [(user_id, session.exec(select(Photo.photo_id).where(Photo.user_id == user_id)).all())
+                for user_id in session.exec(select(User.user_id)).all()]
+
+
+SEARCH_TERMS = ["sunny beach", "coffee with a friend", "dog in the park", "quiet evening", "mountain trail"]
+
+
+def scenarios(client, users, rng):
+    """The benchmarked requests: name -> (request(i), untimed setup or None)."""
+    from api.cache import response_cache
+
+    image = open(os.path.join(harness.ROOT, "tests", "testimage.jpg"), "rb").read()
+    device_ids = {user_id: client.get(f"/users/{user_id}/devices").json()[0]["device_id"] for user_id, _ in users}
+    clear_cache = response_cache.backend.clear
+
+    def pick_user():
+        return rng.choice(users)
+
+    def list_photos(i, extra=""):
+        user_id, photo_ids = pick_user()
+        offset = rng.randrange(0, max(1, len(photo_ids) - 100))
+        return client.get(f"/users/{user_id}/photos?limit=100&offset={offset}&sortby=time_created{extra}")
+
+    def upload_photo(i):
+        user_id, _ = pick_user()
+        photo_create = json.dumps({"device_id": device_ids[user_id], "file_name": "testimage.jpg"})
+        return client.post(f"/users/{user_id}/photos", data={"photo_create": photo_create},
+                           files={"image": ("testimage.jpg", image, "image/jpeg")})
+
+    def generate_journal(i):
+        user_id, photo_ids = pick_user()
+        selected = [str(photo_id) for photo_id in rng.sample(photo_ids, min(10, len(photo_ids)))]
+        return client.post(f"/users/{user_id}/journals/generate", json={"photo_ids": selected})
+
+    return {
+        "list_photos": (list_photos, clear_cache),
+        "list_photos_summary": (lambda i: list_photos(i, "&fields=summary"), clear_cache),
+        "list_photos_total": (lambda i: list_photos(i, "&include_total=true"), clear_cache),
+        "count_photos_contains": (lambda i: client.head(f"/users/{pick_user()[0]}/photos?contains=the"), clear_cache),
+        "list_photos_cached": (lambda i: client.get(f"/users/{users[0][0]}/photos?limit=100"), None),
+        "photo_facets": (lambda i: client.get(f"/users/{pick_user()[0]}/photos/facets"), clear_cache),
+        "photo_duplicates": (lambda i: client.get(f"/users/{pick_user()[0]}/photos/duplicates"), clear_cache),
+        "photo_search": (lambda i: client.get(f"/users/{pick_user()[0]}/photos/search?q={rng.choice(SEARCH_TERMS)}"),
+                         clear_cache),
+        "moments": (lambda i: client.get(f"/users/{pick_user()[0]}/moments"), clear_cache),
+        "list_journals": (lambda i: client.get(f"/users/{pick_user()[0]}/journals?limit=100"), clear_cache),
+        "list_journals_by_tag": (lambda i: client.get(f"/users/{pick_user()[0]}/journals?limit=100&tags=travel,food"),
+                                 clear_cache),
+        "tags": (lambda i: client.get(f"/users/{pick_user()[0]}/tags"), clear_cache),
+        "activities": (lambda i: client.get(f"/users/{pick_user()[0]}/activities"), None),
+        "upload_photo": (upload_photo, None),
+        "generate_journal": (generate_journal, None),
+        # the same selection every time: answered from the previous generation
+        "generate_journal_repeat": (lambda i: client.post(f"/users/{users[0][0]}/journals/generate",
+                                                          json={"photo_ids": [str(p) for p in users[0][1][:10]]}), None),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=2)
+    parser.add_argument("--photos-per-user", type=int, default=50000)
+    parser.add_argument("--journals-per-user", type=int, default=500)
+    parser.add_argument("--entries-per-user", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--scenarios", default=None, help="comma-separated subset of scenarios to run")
+    parser.add_argument("--provider-latency", type=float, default=0.0, help="seconds per stubbed model call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="JSON results file")
+    args = parser.parse_args()
+
+    client = harness.boot(provider_latency=args.provider_latency)
+    from database import engine
+
+    started = datetime.utcnow()
+    users = seed(engine, args.users, args.photos_per_user, args.journals_per_user, args.entries_per_user, args.seed)
+    seed_seconds = (datetime.utcnow() - started).total_seconds()
+    print(f"Seeded {args.users} users x {args.photos_per_user} photos in {seed_seconds:.1f}s ({harness.BENCH_DB_URL})")
+
+    rng = random.Random(args.seed)
+    available = scenarios(client, users, rng)
+    selected = args.scenarios.split(",") if args.scenarios else list(available)
+
+    results = {}
+    print(f"{'scenario':24s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'req/s':>9s} {'errors':>7s}")
+    for name in selected:
+        request, setup = available[name]
+        request(-1)  # warm up imports and connection pools
+        results[name] = harness.run_scenario(request, args.requests, args.concurrency, setup)
+        r = results[name]
+        print(f"{name:24s} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['p99_ms']:9.2f} {r['throughput_rps']:9.1f} {r['errors']:7d}")
+
+    report = {
+        "environment": harness.environment(),
+        "parameters": vars(args),
+        "seed_seconds": round(seed_seconds, 2),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
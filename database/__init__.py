@@ -1,2 +1,9 @@
-from .database import engine, get_db, create_db_and_tables, User, Device, Journal, Photo, Entry
-__all__ = ['engine', 'get_db', 'create_db_and_tables', 'User', 'Device', 'Journal', 'Photo', 'Entry']
\ No newline at end of file
+from .database import get_engine, get_read_engine, on_engine_created, dispose_engine, get_db, get_read_db, create_db_and_tables, on_user_write, use_write_store, wrote_recently, User, Device, Journal, JournalTag, Tag, Photo, Entry, GenerationJob, Lease, PhotoEmbedding
+from . import database as _database
+__all__ = ['engine', 'get_engine', 'get_read_engine', 'on_engine_created', 'dispose_engine', 'get_db', 'get_read_db', 'create_db_and_tables', 'on_user_write', 'use_write_store', 'wrote_recently', 'User', 'Device', 'Journal', 'JournalTag', 'Tag', 'Photo', 'Entry', 'GenerationJob', 'Lease', 'PhotoEmbedding']
+
+def __getattr__(name):
+    # the engine is created lazily, see get_engine()
+    if name == "engine":
+        return _database.get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -1,37 +1,232 @@
 # database.py
 import uuid
+import itertools
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Callable, Dict, Iterable
+from fastapi import Request
 from sqlmodel import SQLModel, Field, Relationship, create_engine, Session
-from sqlalchemy import Column
-from sqlalchemy.dialects.mysql import LONGTEXT
+from sqlalchemy import Column, Text, CHAR, ForeignKey, Index, LargeBinary, UniqueConstraint, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.mysql import BINARY, LONGTEXT
+from sqlalchemy.types import TypeDecorator
+from .ids import new_id
+import math
 import os
-from dotenv import load_dotenv
+import threading
+import time
 
-load_dotenv()
+# LONGTEXT on MySQL, plain TEXT elsewhere (SQLite for tests and benchmarks)
+LongText = Text().with_variant(LONGTEXT(), "mysql")
 
-# Get the database URL from the environment
-DB_URL = os.getenv('DB_URL')
-print(DB_URL)
+class BinaryUUID(TypeDecorator):
+    """
+    UUIDs stored as BINARY(16) on MySQL: half the size of the CHAR(32) hex
+    default, in the primary key and in every foreign key and index that repeats
+    it. Other databases keep CHAR(32) hex, as before.
+    """
+    impl = CHAR(32)
+    cache_ok = True
 
-engine = create_engine(DB_URL)
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "mysql":
+            return dialect.type_descriptor(BINARY(16))
+        return dialect.type_descriptor(CHAR(32))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            value = uuid.UUID(bytes=value) if isinstance(value, bytes) else uuid.UUID(str(value))
+        return value.bytes if dialect.name == "mysql" else value.hex
+
+    def literal_processor(self, dialect):
+        # for literal_binds (offline migrations, logging); bypasses the impl's string quoting
+        def process(value):
+            value = self.process_bind_param(value, dialect)
+            return f"x'{value.hex()}'" if dialect.name == "mysql" else f"'{value}'"
+        return process
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        if isinstance(value, (bytes, bytearray)):
+            return uuid.UUID(bytes=bytes(value))
+        return uuid.UUID(value)
+
+_engines: Dict[str, Engine] = {}  # environment variable -> engine
+_engine_lock = threading.Lock()
+_engine_listeners: List[Callable] = []
+
+def _engine_for(variable: str) -> Engine:
+    engine = _engines.get(variable)
+    if engine is None:
+        with _engine_lock:
+            engine = _engines.get(variable)
+            if engine is None:
+                if variable not in os.environ:
+                    from dotenv import load_dotenv
+                    load_dotenv()
+                # Get the database URL from the environment
+                url = os.getenv(variable)
+                options = {}
+                if not url.startswith("sqlite"):
+                    # each worker process has its own pool, so the database sees up to
+                    # workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections
+                    options = dict(pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+                                   max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+                                   pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "3600")))
+                engine = create_engine(url, **options)
+                for listener in _engine_listeners:
+                    listener(engine)
+                _engines[variable] = engine
+    return engine
+
+def get_engine() -> Engine:
+    """
+    The engine for DB_URL, created on first use rather than at import time, so
+    importing the app (e.g. a forking worker or test collection) needs neither
+    the database driver nor the database.
+    """
+    return _engine_for('DB_URL')
+
+def get_read_engine() -> Engine:
+    """
+    The engine for DB_READ_URL, a read replica, or the primary engine when it is not set.
+    """
+    if "DB_READ_URL" in _engines or os.getenv("DB_READ_URL"):
+        return _engine_for("DB_READ_URL")
+    return get_engine()
+
+def on_engine_created(listener: Callable):
+    """
+    Register a callback receiving every engine once it is created (immediately,
+    if it already exists), e.g. to attach event listeners. Can be used as a decorator.
+    """
+    _engine_listeners.append(listener)
+    for engine in list(_engines.values()):
+        listener(engine)
+    return listener
+
+def dispose_engine():
+    """Close the pooled connections, e.g. on shutdown."""
+    for engine in list(_engines.values()):
+        engine.dispose()
+
+def _forget_pool_after_fork():
+    # a forked worker must not share the parent's sockets; it opens its own
+    for engine in list(_engines.values()):
+        engine.dispose(close=False)
+
+os.register_at_fork(after_in_child=_forget_pool_after_fork)
+
+def __getattr__(name):
+    # `from database import engine` keeps working, and creates the engine on first access
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Function to get a database session
 def get_db() -> Session:
+    with Session(get_engine()) as session:
+        yield session
+
+def get_read_db(request: Request) -> Session:
+    """
+    Session for read-only endpoints: on the read replica, except for a user who
+    wrote in the last READ_AFTER_WRITE_SECONDS, who reads from the primary so
+    that replication lag never hides their own writes. Whether the replica was
+    used is left in request.state.read_replica for the response cache.
+    """
+    user_id = request.path_params.get("user_id")
+    engine = get_engine() if user_id is not None and wrote_recently(user_id) else get_read_engine()
+    request.state.read_replica = engine is not get_engine()
     with Session(engine) as session:
         yield session
 
 # This function can be called to create all tables
 def create_db_and_tables():
+    engine = get_engine()
     SQLModel.metadata.drop_all(engine)
     print("Tables dropped")
     SQLModel.metadata.create_all(engine)
     print("Tables created")
 
+# Callbacks notified with the ids of users whose data was written by a
+# committed session (used for cache invalidation and read-your-writes)
+_user_write_listeners: List[Callable[[Iterable[uuid.UUID]], None]] = []
+
+def on_user_write(listener: Callable[[Iterable[uuid.UUID]], None]):
+    """
+    Register a callback that is invoked after every commit that inserted,
+    updated or deleted users, devices, journals, photos or entries. The callback receives the
+    set of affected user ids. Can be used as a decorator.
+    """
+    _user_write_listeners.append(listener)
+    return listener
+
+@event.listens_for(Session, "after_flush")
+def _collect_user_writes(session, flush_context):
+    touched = session.info.setdefault("touched_user_ids", set())
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, (User, Device, Journal, Tag, Photo, Entry)) and obj.user_id is not None:
+            touched.add(obj.user_id)
+
+@event.listens_for(Session, "after_commit")
+def _notify_user_writes(session):
+    touched = session.info.pop("touched_user_ids", None)
+    if touched:
+        for listener in _user_write_listeners:
+            listener(touched)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_user_writes(session):
+    session.info.pop("touched_user_ids", None)
+
+# Users who wrote recently read from the primary, see get_read_db. The time of
+# their last write is kept in a store all workers see (use_write_store), or in
+# this process until one is set.
+READ_AFTER_WRITE_SECONDS = float(os.getenv("READ_AFTER_WRITE_SECONDS", "5"))
+_recent_writes: Dict[str, float] = {}
+_write_store = None
+
+def use_write_store(store):
+    """
+    Keep the last write times in ``store``, anything with get(key) -> Optional[bytes]
+    and set(key, value, ttl), e.g. the response cache backend, shared through Redis.
+    """
+    global _write_store
+    _write_store = store
+
+@on_user_write
+def _remember_writes(user_ids: Iterable[uuid.UUID]):
+    now = time.time()
+    if _write_store is not None:
+        for user_id in user_ids:
+            _write_store.set(f"written:{user_id}", repr(now).encode(), math.ceil(READ_AFTER_WRITE_SECONDS) + 1)
+        return
+    for user_id in user_ids:
+        _recent_writes[str(user_id)] = now
+    if len(_recent_writes) > 10000:
+        for user_id, written in list(_recent_writes.items()):
+            if now - written > READ_AFTER_WRITE_SECONDS:
+                _recent_writes.pop(user_id, None)
+
+def wrote_recently(user_id) -> bool:
+    try:
+        user_id = str(uuid.UUID(str(user_id)))
+    except ValueError:
+        return False
+    if _write_store is not None:
+        value = _write_store.get(f"written:{user_id}")
+        written = float(value) if value is not None else None
+    else:
+        written = _recent_writes.get(user_id)
+    return written is not None and time.time() - written < READ_AFTER_WRITE_SECONDS
+
 class User(SQLModel, table=True):
     __tablename__ = 'users'
     
-    user_id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    user_id: uuid.UUID = Field(default_factory=new_id, primary_key=True, sa_type=BinaryUUID)
     username: str = Field(max_length=255, unique=False, nullable=False)
     email: str = Field(max_length=255, unique=True, nullable=False)
     password_hash: str = Field(max_length=255, nullable=False)
@@ -50,8 +245,8 @@ class Device(SQLModel, table=True):
     __tablename__ = 'devices'
     
     
-    device_id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
-    user_id: uuid.UUID = Field(foreign_key="users.user_id")
+    device_id: uuid.UUID = Field(default_factory=new_id, primary_key=True, sa_type=BinaryUUID)
+    user_id: uuid.UUID = Field(foreign_key="users.user_id", sa_type=BinaryUUID)
     
     device_name: str = Field(max_length=255, default=None)
     device_type: Optional[str] = Field(max_length=255, default=None)
@@ -70,39 +265,80 @@ class Device(SQLModel, table=True):
     photos: List["Photo"] = Relationship(back_populates="device")
     entries: List["Entry"] = Relationship(back_populates="device")
 
+class JournalTag(SQLModel, table=True):
+    __tablename__ = 'journal_tags'
+    __table_args__ = (
+        Index('ix_journal_tags_tag_id_journal_id', 'tag_id', 'journal_id'),
+    )
+
+    journal_id: uuid.UUID = Field(foreign_key="journals.journal_id", primary_key=True, sa_type=BinaryUUID)
+    tag_id: uuid.UUID = Field(foreign_key="tags.tag_id", primary_key=True, sa_type=BinaryUUID)
+
+class Tag(SQLModel, table=True):
+    __tablename__ = 'tags'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'name', name='uq_tags_user_id_name'),
+    )
+
+    tag_id: uuid.UUID = Field(default_factory=new_id, primary_key=True, sa_type=BinaryUUID)
+    user_id: uuid.UUID = Field(foreign_key="users.user_id", sa_type=BinaryUUID)
+    name: str = Field(max_length=64)
+    journal_count: int = Field(default=0)  # journals with this tag, kept up to date by api.tags
+
 class Journal(SQLModel, table=True):
     __tablename__ = 'journals'
-    
+    __table_args__ = (
+        Index('ix_journals_user_id_time_modified', 'user_id', 'time_modified'),
+    )
 
-    journal_id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
-    user_id: uuid.UUID = Field(foreign_key="users.user_id")
+    journal_id: uuid.UUID = Field(default_factory=new_id, primary_key=True, sa_type=BinaryUUID)
+    user_id: uuid.UUID = Field(foreign_key="users.user_id", sa_type=BinaryUUID)
     title: str = Field(max_length=255, nullable=False)
-    description: Optional[str] = Field(default=None, sa_column=Column(LONGTEXT))
+    description: Optional[str] = Field(default=None, sa_column=Column(LongText))
     time_created: datetime = Field(default_factory=datetime.utcnow)
     time_modified: datetime = Field(default_factory=datetime.utcnow, sa_column_kwargs={"onupdate": datetime.utcnow})
     starred: bool = Field(default=False)
+    is_public: bool = Field(default=False)
 
     user: "User" = Relationship(back_populates="journals")
     entries: List["Entry"] = Relationship(back_populates="journal")
     photos: List["Photo"] = Relationship(back_populates="journal")
+    # written through api.tags, which keeps the counts; loaded in the same query as the journal
+    tag_rows: List["Tag"] = Relationship(link_model=JournalTag, sa_relationship_kwargs={"lazy": "joined"})
+
+    @property
+    def tags(self) -> List[str]:
+        return sorted(tag.name for tag in self.tag_rows)
 
 class Photo(SQLModel, table=True):
     __tablename__ = 'photos'
-    
+    __table_args__ = (
+        Index('ix_photos_user_id_time_taken', 'user_id', 'time_taken'),
+        Index('ix_photos_user_id_time_modified', 'user_id', 'time_modified'),
+        Index('ix_photos_latitude_longitude', 'latitude', 'longitude'),
+    )
 
-    photo_id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
-    user_id: uuid.UUID = Field(foreign_key="users.user_id")
-    journal_id: Optional[uuid.UUID] = Field(foreign_key="journals.journal_id")
-    device_id: uuid.UUID = Field(foreign_key="devices.device_id")
+    photo_id: uuid.UUID = Field(default_factory=new_id, primary_key=True, sa_type=BinaryUUID)
+    user_id: uuid.UUID = Field(foreign_key="users.user_id", sa_type=BinaryUUID)
+    journal_id: Optional[uuid.UUID] = Field(foreign_key="journals.journal_id", sa_type=BinaryUUID)
+    device_id: uuid.UUID = Field(foreign_key="devices.device_id", sa_type=BinaryUUID)
     time_created: datetime = Field(default_factory=datetime.utcnow)
     time_modified: datetime = Field(default_factory=datetime.utcnow, sa_column_kwargs={"onupdate": datetime.utcnow})
     location: Optional[str] = Field(max_length=255, default=None)
-    description: Optional[str] = Field(default=None, sa_column=Column(LONGTEXT))
+    description: Optional[str] = Field(default=None, sa_column=Column(LongText))
     url: str = Field(max_length=255)
     starred: bool = Field(default=False)
     file_name: Optional[str] = Field(max_length=255, default=None)
     file_size: Optional[int] = Field(default=None)
     file_type: Optional[str] = Field(max_length=255, default=None)
+    # read from the image header on upload (api.image_metadata), see scripts/backfill_photo_metadata.py
+    mime_type: Optional[str] = Field(max_length=32, default=None)
+    width: Optional[int] = Field(default=None)
+    height: Optional[int] = Field(default=None)
+    time_taken: Optional[datetime] = Field(default=None)  # EXIF capture time; readers fall back to time_created
+    latitude: Optional[float] = Field(default=None)
+    longitude: Optional[float] = Field(default=None)
+    phash: Optional[str] = Field(max_length=16, default=None)  # perceptual hash, see api.phash
 
     user: "User" = Relationship(back_populates="photos")
     journal: "Journal" = Relationship(back_populates="photos")
@@ -112,15 +348,51 @@ class Entry(SQLModel, table=True):
     __tablename__ = 'entries'
     
 
-    entry_id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
-    user_id: uuid.UUID = Field(foreign_key="users.user_id")
-    journal_id: uuid.UUID = Field(foreign_key="journals.journal_id")
-    device_id: uuid.UUID = Field(foreign_key="devices.device_id")
+    entry_id: uuid.UUID = Field(default_factory=new_id, primary_key=True, sa_type=BinaryUUID)
+    user_id: uuid.UUID = Field(foreign_key="users.user_id", sa_type=BinaryUUID)
+    journal_id: uuid.UUID = Field(foreign_key="journals.journal_id", sa_type=BinaryUUID)
+    device_id: uuid.UUID = Field(foreign_key="devices.device_id", sa_type=BinaryUUID)
     time_created: datetime = Field(default_factory=datetime.utcnow)
     time_modified: datetime = Field(default_factory=datetime.utcnow, sa_column_kwargs={"onupdate": datetime.utcnow})
     position: Optional[str] = Field(max_length=255, default=None)
-    content: Optional[str] = Field(default=None, sa_column=Column(LONGTEXT))
+    content: Optional[str] = Field(default=None, sa_column=Column(LongText))
 
     user: "User" = Relationship(back_populates="entries")
     journal: "Journal" = Relationship(back_populates="entries")
     device: "Device" = Relationship(back_populates="entries")
+
+class GenerationJob(SQLModel, table=True):
+    __tablename__ = 'generation_jobs'
+    
+
+    job_id: uuid.UUID = Field(default_factory=new_id, primary_key=True, sa_type=BinaryUUID)
+    user_id: uuid.UUID = Field(foreign_key="users.user_id", index=True, sa_type=BinaryUUID)
+    status: str = Field(max_length=16, default="queued")  # queued, running, succeeded, failed
+    photo_ids: str = Field(sa_column=Column(Text, nullable=False))  # JSON list of photo ids
+    attempts: int = Field(default=0)
+    journal_id: Optional[uuid.UUID] = Field(default=None, foreign_key="journals.journal_id", sa_type=BinaryUUID)
+    error: Optional[str] = Field(default=None, sa_column=Column(Text))
+    fingerprint: Optional[str] = Field(default=None, max_length=64, index=True)  # see api.jobs.generation_fingerprint
+    time_created: datetime = Field(default_factory=datetime.utcnow)
+    time_modified: datetime = Field(default_factory=datetime.utcnow, sa_column_kwargs={"onupdate": datetime.utcnow})
+
+class Lease(SQLModel, table=True):
+    __tablename__ = 'leases'
+    
+
+    name: str = Field(max_length=128, primary_key=True)  # e.g. "describe:<photo_id>"
+    owner: str = Field(max_length=32)
+    expires_at: datetime
+
+class PhotoEmbedding(SQLModel, table=True):
+    __tablename__ = 'photo_embeddings'
+    
+
+    # removed with its photo; see api.search for how vectors are kept up to date
+    photo_id: uuid.UUID = Field(sa_column=Column(BinaryUUID, ForeignKey("photos.photo_id", ondelete="CASCADE"), primary_key=True))
+    user_id: uuid.UUID = Field(foreign_key="users.user_id", index=True, sa_type=BinaryUUID)
+    model: str = Field(max_length=64)  # the embedder that produced the vector
+    description_hash: str = Field(max_length=40)  # sha1 of the embedded description
+    vector: bytes = Field(sa_column=Column(LargeBinary, nullable=False))  # int8 components
+    scale: float  # component value = int8 * scale
+    time_embedded: datetime = Field(default_factory=datetime.utcnow)
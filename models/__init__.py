@@ -1,11 +1,18 @@
-from .user import UserBase, UserCreate, UserUpdate, UserLogin, UserResponse, ActivityResponse
+from .user import UserBase, UserCreate, UserUpdate, UserLogin, UserResponse, UserDetailResponse, ActivityResponse
 from .device import DeviceBase, DeviceCreate, DeviceUpdate, DeviceResponse
 from .entry import EntryBase, EntryCreate, EntryUpdate, EntryResponse
-from .journal import JournalBase, JournalCreate, JournalUpdate, JournalResponse
-from .photo import PhotoBase, PhotoCreate, PhotoUpdate, PhotoResponse
+from .journal import JournalBase, JournalCreate, JournalUpdate, JournalResponse, JournalDetailResponse, JournalSummary, TagResponse
+from .photo import PhotoBase, PhotoCreate, PhotoUpdate, PhotoResponse, PhotoDetailResponse, PhotoSummary, DuplicateGroup, PhotoSearchResult, DeviceFacet, MonthFacet, PhotoFacets
+from .job import GenerationJobBase, GenerationJobCreate, GenerationJobResponse
+from .moment import MomentResponse
 
-__all__ = ["UserBase", "UserCreate", "UserUpdate", "UserLogin","UserResponse", "ActivityResponse", 
+# photo.py and journal.py reference each other
+PhotoDetailResponse.model_rebuild(_types_namespace={"JournalResponse": JournalResponse})
+
+__all__ = ["UserBase", "UserCreate", "UserUpdate", "UserLogin","UserResponse", "UserDetailResponse", "ActivityResponse", 
            "DeviceBase", "DeviceCreate", "DeviceUpdate", "DeviceResponse",
            "EntryBase", "EntryCreate", "EntryUpdate", "EntryResponse",
-           "JournalBase", "JournalCreate", "JournalUpdate", "JournalResponse",
-           "PhotoBase", "PhotoCreate", "PhotoUpdate", "PhotoResponse"]
\ No newline at end of file
+           "JournalBase", "JournalCreate", "JournalUpdate", "JournalResponse", "JournalDetailResponse", "JournalSummary", "TagResponse",
+           "PhotoBase", "PhotoCreate", "PhotoUpdate", "PhotoResponse", "PhotoDetailResponse", "PhotoSummary", "DuplicateGroup", "PhotoSearchResult", "DeviceFacet", "MonthFacet", "PhotoFacets",
+           "GenerationJobBase", "GenerationJobCreate", "GenerationJobResponse",
+           "MomentResponse"]
@@ -0,0 +1,24 @@
+from pydantic import BaseModel
+from typing import Optional, List
+from uuid import UUID
+from datetime import datetime
+
+class GenerationJobBase(BaseModel):
+    pass
+
+class GenerationJobCreate(GenerationJobBase):
+    photo_ids: List[UUID]
+    collapse_duplicates: bool = False  # generate from one photo per group of near-duplicates
+
+class GenerationJobResponse(GenerationJobBase):
+    job_id: UUID
+    user_id: UUID
+    status: str
+    attempts: int
+    journal_id: Optional[UUID] = None
+    error: Optional[str] = None
+    time_created: datetime
+    time_modified: datetime
+    
+    class Config:
+        from_attributes = True
@@ -3,12 +3,17 @@ from typing import Optional, List
 from uuid import UUID, uuid4
 from datetime import datetime
 
+from .entry import EntryResponse
+from .photo import PhotoResponse
+
 
 class JournalBase(BaseModel):
     title: str
 
 class JournalCreate(JournalBase):
     description: Optional[str] = None
+    tags : Optional[List[str]] = None
+    is_public: bool = False
     
     
 class JournalUpdate(JournalBase):
@@ -31,3 +36,28 @@ class JournalResponse(JournalBase):
     class Config:
         from_attributes = True
 
+
+# JournalResponse with relationships requested through ?include=
+class JournalDetailResponse(JournalResponse):
+    photos: Optional[List[PhotoResponse]] = None
+    entries: Optional[List[EntryResponse]] = None
+
+
+# Lightweight listing model: no LONGTEXT description
+class JournalSummary(JournalBase):
+    journal_id: UUID
+    user_id: UUID
+    time_created: datetime
+    time_modified: datetime
+    starred: Optional[bool] = None
+    tags : Optional[List[str]] = None
+    is_public: Optional[bool] = None
+    
+    class Config:
+        from_attributes = True
+
+
+# A tag with the number of journals it is on, see GET /users/{user_id}/tags
+class TagResponse(BaseModel):
+    name: str
+    journal_count: int
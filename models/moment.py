@@ -0,0 +1,14 @@
+from pydantic import BaseModel
+from typing import Optional, List
+from uuid import UUID
+from datetime import datetime
+
+# A group of photos taken close together in time and place, see GET /users/{user_id}/moments
+class MomentResponse(BaseModel):
+    start: datetime
+    end: datetime
+    photo_count: int
+    location: Optional[str] = None  # the most common location label
+    latitude: Optional[float] = None  # mean position of the photos with GPS
+    longitude: Optional[float] = None
+    photo_ids: List[UUID]  # in the order they were taken, e.g. for POST /users/{user_id}/journals/generate
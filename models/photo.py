@@ -3,6 +3,8 @@ from typing import Optional, List, BinaryIO
 from uuid import UUID, uuid4
 from datetime import datetime
 
+from .device import DeviceResponse
+
 class PhotoBase(BaseModel):
     pass
     
@@ -35,8 +37,73 @@ class PhotoResponse(PhotoBase):
     journal_id: Optional[UUID] = None
     description: Optional[str] = None
     file_name: Optional[str] = None
+    mime_type: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    time_taken: Optional[datetime] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    phash: Optional[str] = None
     
     
     class Config:
         from_attributes = True
-    
\ No newline at end of file
+
+
+# PhotoResponse with relationships requested through ?include=
+class PhotoDetailResponse(PhotoResponse):
+    device: Optional[DeviceResponse] = None
+    journal: Optional["JournalResponse"] = None
+
+
+# Lightweight listing model: no LONGTEXT description
+class PhotoSummary(PhotoBase):
+    photo_id: UUID
+    user_id: UUID
+    device_id: UUID
+    time_created: datetime
+    time_modified: datetime
+    url: Optional[str] = None
+    journal_id: Optional[UUID] = None
+    file_name: Optional[str] = None
+    mime_type: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    time_taken: Optional[datetime] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    phash: Optional[str] = None
+    
+    class Config:
+        from_attributes = True
+
+
+# Near-duplicate photos, see GET /users/{user_id}/photos/duplicates
+class DuplicateGroup(PhotoBase):
+    keep: UUID  # the suggested photo to keep
+    photos: List[PhotoSummary]
+
+
+# A search hit, see GET /users/{user_id}/photos/search
+class PhotoSearchResult(PhotoSummary):
+    score: float  # cosine similarity of the description to the query
+
+
+# Photo counts for the gallery sidebar, see GET /users/{user_id}/photos/facets
+class DeviceFacet(PhotoBase):
+    device_id: UUID
+    device_name: Optional[str] = None
+    count: int
+
+
+class MonthFacet(PhotoBase):
+    month: str  # YYYY-MM of when the photos were taken
+    count: int
+
+
+class PhotoFacets(PhotoBase):
+    total: int
+    starred: int
+    unstarred: int
+    devices: List[DeviceFacet]
+    months: List[MonthFacet]
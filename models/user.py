@@ -3,6 +3,8 @@ from typing import Optional, List
 from uuid import UUID, uuid4
 from datetime import datetime
 
+from .device import DeviceResponse
+
 class UserBase(BaseModel):
     username: Optional[str] = None
     email: Optional[str] = None
@@ -36,6 +38,11 @@ class UserResponse(UserBase):
         from_attributes = True
         
         
+# UserResponse with relationships requested through ?include=
+class UserDetailResponse(UserResponse):
+    devices: Optional[List[DeviceResponse]] = None
+        
+        
 class ActivityResponse(BaseModel):
     date: str
     count: int
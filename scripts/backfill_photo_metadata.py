@@ -0,0 +1,140 @@
+"""
+Backfill photo metadata for photos uploaded before it was read on upload.
+
+Walks the photos without a mime_type in primary key order, in batches. For
+each photo only the first --header-bytes of the image are fetched from OSS
+(a ranged GET) and parsed (api/image_metadata.py), and each batch is written
+back with one executemany. Every recognized image gets its mime_type, so it
+is done once, even without an EXIF capture time (time_taken stays NULL), and
+the script can be stopped and rerun at any time; photos whose image could
+not be fetched or recognized are left for the next run. --phash fills in missing perceptual hashes (api/phash.py) the same
+way, from the whole image.
+
+    python scripts/backfill_photo_metadata.py --batch-size 500 --workers 16
+"""
+import sys
+import os
+
+# Add the project root and app directories to the Python path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "app")]
+
+import argparse
+import io
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from urllib.parse import unquote, urlsplit
+
+from sqlalchemy import bindparam, select, update
+
+from api.image_metadata import read_metadata
+from api.phash import dhash
+
+logger = logging.getLogger("backfill_photo_metadata")
+
+
+def object_key(url: str) -> str:
+    """The OSS key of an uploaded photo: its URL path (see create_user_photo)."""
+    return unquote(urlsplit(url).path.lstrip("/"))
+
+
+def fetch(bucket, url: str, size: Optional[int]) -> Optional[bytes]:
+    """The first ``size`` bytes of a photo, or all of it."""
+    try:
+        if size is None:
+            return bucket.get_object(object_key(url)).read()
+        return bucket.get_object(object_key(url), byte_range=(0, size - 1)).read()
+    except Exception as e:
+        logger.warning(f"Could not fetch {url}: {e}")
+        return None
+
+
+def header_values(row, data: bytes) -> dict:
+    meta = read_metadata(io.BytesIO(data))
+    return dict(mime_type=meta.mime_type, width=meta.width, height=meta.height,
+                time_taken=meta.time_taken, latitude=meta.latitude, longitude=meta.longitude)
+
+
+def phash_values(row, data: bytes) -> Optional[dict]:
+    phash = dhash(io.BytesIO(data))
+    return None if phash is None else dict(phash=phash)
+
+
+def backfill(engine, bucket, batch_size: int = 500, workers: int = 8, header_bytes: int = 256 * 1024,
+             limit: Optional[int] = None, phash: bool = False, log=print) -> int:
+    """
+    Fill in the metadata of up to ``limit`` photos, or with ``phash`` their
+    perceptual hash, for which the whole image is fetched. Images Pillow cannot
+    decode keep no hash and are tried again on the next run.
+
+    Returns:
+        int: The number of photos updated.
+    """
+    from database import Photo
+    photos = Photo.__table__
+    missing, size, values_for = (photos.c.phash, None, phash_values) if phash else \
+        (photos.c.mime_type, header_bytes, header_values)
+    columns = ["phash"] if phash else ["mime_type", "width", "height", "time_taken", "latitude", "longitude"]
+    # the key comes from an earlier batch and is compared to the same column, so it keeps its type
+    write = update(photos).where(photos.c.photo_id == bindparam("key")) \
+        .values(**{name: bindparam(name) for name in columns})
+
+    updated, seen, last_id = 0, 0, None
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while limit is None or seen < limit:
+            query = select(photos.c.photo_id, photos.c.url) \
+                .where(missing.is_(None)).order_by(photos.c.photo_id).limit(batch_size)
+            if last_id is not None:
+                query = query.where(photos.c.photo_id > last_id)
+            with engine.connect() as conn:
+                rows = conn.execute(query).all()
+            if not rows:
+                break
+            last_id = rows[-1].photo_id
+            if limit is not None:
+                rows = rows[:limit - seen]
+            seen += len(rows)
+
+            values: List[dict] = []
+            for row, data in zip(rows, pool.map(lambda row: fetch(bucket, row.url, size), rows)):
+                row_values = values_for(row, data) if data is not None else None
+                if row_values is not None:
+                    values.append(dict(row_values, key=row.photo_id))
+            if values:
+                with engine.begin() as conn:
+                    conn.execute(write, values)
+            updated += len(values)
+            if log:
+                log(f"{updated} photos updated, {seen / (time.perf_counter() - started):.0f} photos/s")
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db-url", default=None, help="defaults to DB_URL")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=8, help="concurrent ranged GETs")
+    parser.add_argument("--header-bytes", type=int, default=256 * 1024,
+                        help="bytes fetched per image; EXIF is at most 64 KiB, in front of the frame header")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many photos")
+    parser.add_argument("--phash", action="store_true",
+                        help="compute missing perceptual hashes instead; fetches whole images and needs Pillow")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.db_url:
+        os.environ["DB_URL"] = args.db_url
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(ROOT, "app", ".env"))
+    from database import engine
+    from api.storage import get_bucket
+
+    updated = backfill(engine, get_bucket(), args.batch_size, args.workers, args.header_bytes, args.limit, args.phash)
+    print(f"{updated} photos updated")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Synthetic data generator for scale testing.
+
+Writes users, devices, journals, photos and entries straight into the
+database in batched SQLAlchemy Core inserts, which is orders of magnitude
+faster than going through the API. The output is fully determined by the
+seed: the same arguments always produce the same rows and ids.
+
+Photos are taken in bursty sessions (more at weekends and in the afternoon)
+and text lengths follow log-normal distributions, so that indexes, sorting
+and LONGTEXT columns behave like production data.
+
+    python scripts/generate_data.py --users 100 --photos-per-user 20000 --seed 42
+"""
+import sys
+import os
+
+# Add the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import math
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List
+
+from sqlalchemy import insert
+
+from database.ids import uuid7_from
+
+WORDS = (
+    "morning afternoon evening light sun rain cloud sky river lake sea beach park street market cafe coffee tea "
+    "friend family dog cat bird tree flower leaf mountain trail bridge train bus city window garden book music "
+    "walk run laugh quiet busy warm cold bright soft colorful old new small large happy calm tired curious "
+    "we I they watched found shared remembered tried enjoyed visited cooked painted read wrote waited"
+).split()
+
+LOCATIONS = ["Home", "Office", "Central Park", "Riverside", "Old Town", "Campus", "Beach", "Airport", "Mountain Trail"]
+TAGS = ["travel", "food", "family", "friends", "work", "nature", "city", "pets", "weekend", "holiday", "sport", "music"]
+FILE_TYPES = [("image/jpeg", ".jpg", 0.8), ("image/heic", ".heic", 0.15), ("image/png", ".png", 0.05)]
+
+
+@dataclass
+class GeneratorConfig:
+    users: int = 10
+    devices_per_user: int = 2
+    journals_per_user: int = 50
+    photos_per_user: int = 2000
+    entries_per_user: int = 200
+    start: datetime = datetime(2024, 1, 1)
+    days: int = 365
+    photos_per_session: float = 25.0  # mean burst size
+    seconds_between_photos: float = 90.0  # mean gap inside a burst
+    description_rate: float = 0.85  # share of photos that already have a caption
+    journal_photo_rate: float = 0.3  # share of photos attached to a journal
+    tags_per_journal: float = 1.5  # mean
+    duplicate_rate: float = 0.15  # share of photos that are near-duplicates of the previous one
+    seed: int = 0
+    batch_size: int = 5000
+
+
+@dataclass
+class DataGenerator:
+    config: GeneratorConfig
+    rng: random.Random = field(init=False)
+    last_phash: int = field(init=False, default=0)
+
+    def __post_init__(self):
+        self.rng = random.Random(self.config.seed)
+
+    def new_id(self, created: datetime) -> uuid.UUID:
+        """A UUIDv7 for a row created at ``created``, like the app's own ids (database/ids.py)."""
+        unix_ms = int(created.replace(tzinfo=timezone.utc).timestamp() * 1000)
+        return uuid7_from(unix_ms, self.rng.getrandbits(12), self.rng.getrandbits(62))
+
+    def text(self, median_chars: int, sigma: float = 0.6, max_chars: int = 60000) -> str:
+        """Random prose whose length is log-normally distributed around ``median_chars``."""
+        length = min(max_chars, int(self.rng.lognormvariate(math.log(median_chars), sigma)))
+        words, size = [], 0
+        while size < length:
+            word = self.rng.choice(WORDS)
+            words.append(word)
+            size += len(word) + 1
+        return " ".join(words).capitalize() + "."
+
+    def session_start(self) -> datetime:
+        config = self.config
+        while True:
+            day = self.rng.randrange(config.days)
+            # twice as many outings at the weekend
+            if (config.start + timedelta(days=day)).weekday() >= 5 or self.rng.random() < 0.5:
+                break
+        hour = self.rng.triangular(7, 23, 15)
+        return config.start + timedelta(days=day, hours=hour)
+
+    def timestamps(self, count: int) -> List[datetime]:
+        """``count`` sorted timestamps, grouped into bursts like real camera rolls."""
+        stamps = []
+        while len(stamps) < count:
+            current = self.session_start()
+            for _ in range(max(1, int(self.rng.expovariate(1 / self.config.photos_per_session)))):
+                stamps.append(current)
+                current += timedelta(seconds=self.rng.expovariate(1 / self.config.seconds_between_photos))
+        return sorted(stamps[:count])
+
+    def photo_metadata(self, mime: str, taken: datetime, home: tuple) -> dict:
+        """What the upload reads from the image: a phone camera frame, GPS near home for most photos, a hash."""
+        rng = self.rng
+        width, height = (4032, 3024) if rng.random() < 0.7 else (3024, 4032)
+        located = rng.random() < 0.7
+        if rng.random() < self.config.duplicate_rate:
+            # the same scene again: a few bits of the perceptual hash flip
+            for bit in rng.sample(range(64), rng.randrange(4)):
+                self.last_phash ^= 1 << bit
+        else:
+            self.last_phash = rng.getrandbits(64)
+        return dict(mime_type=mime, width=width, height=height, time_taken=taken,
+                    latitude=round(home[0] + rng.gauss(0, 0.05), 6) if located else None,
+                    longitude=round(home[1] + rng.gauss(0, 0.05), 6) if located else None,
+                    phash=f"{self.last_phash:016x}")
+
+    def user_rows(self, index: int) -> Iterator[tuple]:
+        """Yield (table name, row) for one user and everything they own, parents first."""
+        config = self.config
+        rng = self.rng
+        joined = config.start - timedelta(days=rng.randrange(1, 365))
+        user_id = self.new_id(joined)
+        yield "users", dict(user_id=user_id, username=f"user{index}", email=f"user{index}@example.test",
+                            password_hash="$5$rounds=535000$synthetic", time_created=joined,
+                            last_login=config.start + timedelta(days=config.days), is_active=True,
+                            profile_picture_url=None, bio=self.text(120) if rng.random() < 0.5 else None)
+
+        device_ids = []
+        for d in range(config.devices_per_user):
+            device_ids.append(self.new_id(joined))
+            yield "devices", dict(device_id=device_ids[-1], user_id=user_id, device_name=f"device{d}",
+                                  device_type=rng.choice(["smartphone", "tablet", "embedded"]),
+                                  os_type=rng.choice(["iOS", "Android", "Linux"]), os_version=f"{rng.randint(10, 17)}.0",
+                                  app_version="1.0", last_sync=config.start + timedelta(days=config.days), is_active=True,
+                                  api_key=f"{user_id.hex}-{d}", time_created=joined, time_modified=joined)
+
+        journal_ids = []
+        for created in self.timestamps(config.journals_per_user):
+            created += timedelta(hours=rng.uniform(1, 6))
+            journal_ids.append(self.new_id(created))
+            yield "journals", dict(journal_id=journal_ids[-1], user_id=user_id, title=self.text(30, 0.3, 120).title(),
+                                   description=self.text(3000, 0.5), time_created=created,
+                                   time_modified=created + timedelta(minutes=rng.expovariate(1 / 30)),
+                                   starred=rng.random() < 0.1, is_public=rng.random() < 0.2)
+
+        # a couple of tags per journal from a small vocabulary, counted as the API keeps them
+        tagged = {journal_id: rng.sample(TAGS, min(len(TAGS), int(rng.expovariate(1 / config.tags_per_journal))))
+                  for journal_id in journal_ids}
+        tag_ids = {}
+        for name in TAGS:
+            count = sum(name in names for names in tagged.values())
+            if count:
+                tag_ids[name] = self.new_id(joined)
+                yield "tags", dict(tag_id=tag_ids[name], user_id=user_id, name=name, journal_count=count)
+        for journal_id, names in tagged.items():
+            for name in names:
+                yield "journal_tags", dict(journal_id=journal_id, tag_id=tag_ids[name])
+
+        home = rng.sample(LOCATIONS, 3)
+        home_position = (rng.uniform(-45, 60), rng.uniform(-120, 140))
+        for created in self.timestamps(config.photos_per_user):
+            mime, extension, _ = rng.choices(FILE_TYPES, weights=[weight for *_, weight in FILE_TYPES])[0]
+            photo_id = self.new_id(created)
+            yield "photos", dict(photo_id=photo_id, user_id=user_id, device_id=rng.choice(device_ids),
+                                 journal_id=rng.choice(journal_ids) if journal_ids and rng.random() < config.journal_photo_rate else None,
+                                 time_created=created, time_modified=created, location=rng.choice(home) if rng.random() < 0.6 else None,
+                                 description=self.text(700) if rng.random() < config.description_rate else None,
+                                 url=f"https://vmbook.example.test/{photo_id}{extension}", starred=rng.random() < 0.05,
+                                 file_name=f"IMG_{rng.randrange(10000):04d}{extension}",
+                                 file_size=int(rng.lognormvariate(math.log(2_500_000), 0.5)), file_type=mime,
+                                 **self.photo_metadata(mime, created, home_position))
+
+        if journal_ids:
+            for created in self.timestamps(config.entries_per_user):
+                yield "entries", dict(entry_id=self.new_id(created), user_id=user_id, journal_id=rng.choice(journal_ids),
+                                      device_id=rng.choice(device_ids), time_created=created, time_modified=created,
+                                      position=None, content=self.text(200, 0.8))
+
+    def generate(self, engine, log=print) -> Dict[str, int]:
+        """
+        Insert all rows, ``batch_size`` rows per INSERT, one transaction per user.
+
+        Returns:
+            Dict[str, int]: The number of rows written per table.
+        """
+        from database import User, Device, Journal, Tag, JournalTag, Photo, Entry
+        tables = {model.__tablename__: model.__table__ for model in (User, Device, Journal, Tag, JournalTag, Photo, Entry)}
+        counts = {name: 0 for name in tables}
+        started = time.perf_counter()
+
+        for index in range(self.config.users):
+            pending: Dict[str, List[dict]] = {name: [] for name in tables}
+            with engine.begin() as conn:
+                def flush(name):
+                    if pending[name]:
+                        conn.execute(insert(tables[name]), pending[name])
+                        counts[name] += len(pending[name])
+                        pending[name] = []
+
+                previous = None
+                for name, row in self.user_rows(index):
+                    # rows come grouped by table, parents first; write a table out
+                    # completely before its children for the foreign keys
+                    if previous is not None and name != previous:
+                        flush(previous)
+                    previous = name
+                    pending[name].append(row)
+                    if len(pending[name]) >= self.config.batch_size:
+                        flush(name)
+                if previous is not None:
+                    flush(previous)
+            if log:
+                elapsed = time.perf_counter() - started
+                log(f"user {index + 1}/{self.config.users}: {sum(counts.values())} rows, "
+                    f"{sum(counts.values()) / elapsed:.0f} rows/s")
+        return counts
+
+
+def main():
+    defaults = GeneratorConfig()
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db-url", default=None, help="defaults to DB_URL")
+    parser.add_argument("--create-tables", action="store_true", help="drop and recreate all tables first")
+    for name in ("users", "devices_per_user", "journals_per_user", "photos_per_user", "entries_per_user", "days",
+                 "seed", "batch_size"):
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=getattr(defaults, name))
+    args = parser.parse_args()
+
+    if args.db_url:
+        os.environ["DB_URL"] = args.db_url
+    from database import engine, create_db_and_tables
+    if args.create_tables:
+        create_db_and_tables()
+
+    config = GeneratorConfig(users=args.users, devices_per_user=args.devices_per_user,
+                             journals_per_user=args.journals_per_user, photos_per_user=args.photos_per_user,
+                             entries_per_user=args.entries_per_user, days=args.days, seed=args.seed,
+                             batch_size=args.batch_size)
+    counts = DataGenerator(config).generate(engine)
+    print(", ".join(f"{count} {name}" for name, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import io
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "app")]
+
+# In-process tests never talk to the real database, OSS or dashscope
+os.environ["DB_URL"] = os.getenv("TEST_DB_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "vmbook-test.db"))
+os.environ["EMBEDDER"] = "hashing"
+
+import pytest
+from contextlib import contextmanager
+from sqlalchemy import event
+
+
+@pytest.fixture(scope="session")
+def app():
+    """
+    The FastAPI app running in-process against the test database
+    """
+    from sqlmodel import SQLModel
+    from main import app
+    from database import engine
+
+    SQLModel.metadata.create_all(engine)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def db_session(app):
+    from sqlmodel import Session
+    from database import engine
+
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture
+def count_queries(app):
+    """
+    Context manager collecting the SQL statements executed inside it
+    """
+    from database import engine
+
+    @contextmanager
+    def counter():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+
+    return counter
+
+
+@pytest.fixture
+def seed_photos(db_session):
+    """
+    Factory creating a user with one device and ``count`` photos; returns (user_id, photo_ids)
+    """
+    import uuid
+    from datetime import datetime, timedelta
+    from database import User, Device, Photo
+
+    def seed(count: int = 3, description: str = None):
+        user = User(username="seeded", email=f"{uuid.uuid4()}@test.com", password_hash="x")
+        device = Device(user_id=user.user_id, device_name="camera", api_key=str(uuid.uuid4()))
+        start = datetime(2024, 8, 1, 9, 0)
+        photos = [Photo(user_id=user.user_id, device_id=device.device_id, url=f"https://example.com/{uuid.uuid4()}.jpg",
+                        description=description, time_created=start + timedelta(minutes=10 * i))
+                  for i in range(count)]
+        db_session.add_all([user, device, *photos])
+        db_session.commit()
+        return user.user_id, [photo.photo_id for photo in photos]
+
+    return seed
+
+
+@pytest.fixture
+def stub_provider():
+    """
+    Replace dashscope with the deterministic StubProvider for the duration of a test
+    """
+    from api.providers import StubProvider, get_provider, set_provider
+
+    previous = get_provider()
+    provider = StubProvider()
+    set_provider(provider)
+    yield provider
+    set_provider(previous)
+
+
+class MemoryBucket:
+    """Stands in for oss2.Bucket, keeping uploads in memory"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, key, data):
+        self.objects[key] = data.read()
+
+    def sign_url(self, method, key, expires, slash_safe=False):
+        return f"https://bucket.example.com/{key}?Expires={expires}"
+
+    def get_object(self, key, byte_range=None):
+        data = self.objects[key]
+        if byte_range is not None:
+            data = data[byte_range[0]:byte_range[1] + 1]
+        return io.BytesIO(data)
+
+
+@pytest.fixture
+def memory_bucket():
+    """
+    Replace OSS with a MemoryBucket for the duration of a test
+    """
+    from api.storage import set_bucket
+
+    bucket = MemoryBucket()
+    set_bucket(bucket)
+    yield bucket
+    set_bucket(None)
@@ -0,0 +1,144 @@
+import pytest
+from uuid import uuid4
+
+from api.cache import LRUBackend, RedisBackend, ResponseCache, normalize_params, etag_matches
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_backend_evicts_least_recently_used():
+    """
+    Test case for LRU eviction order
+    """
+    backend = LRUBackend(max_entries=2)
+    backend.set("a", b"1", ttl=60)
+    backend.set("b", b"2", ttl=60)
+    assert backend.get("a") == b"1"  # "a" is now most recently used
+    backend.set("c", b"3", ttl=60)
+
+    assert backend.get("b") is None
+    assert backend.get("a") == b"1"
+    assert backend.get("c") == b"3"
+
+
+def test_lru_backend_expires_entries():
+    clock = FakeClock()
+    backend = LRUBackend(max_entries=10, clock=clock)
+    backend.set("a", b"1", ttl=5)
+    clock.now = 4
+    assert backend.get("a") == b"1"
+    clock.now = 5
+    assert backend.get("a") is None
+
+
+def test_version_bump_invalidates_only_that_user():
+    """
+    Test case for per-user invalidation via version bumps
+    """
+    cache = ResponseCache(LRUBackend())
+    alice, bob = uuid4(), uuid4()
+    params = {"limit": 10, "offset": 0}
+
+    alice_key = cache.key("photos", alice, params)
+    bob_key = cache.key("photos", bob, params)
+    cache.set(alice_key, b"[]")
+    cache.set(bob_key, b"[]")
+
+    cache.bump([alice])
+
+    assert cache.get(cache.key("photos", alice, params)) is None
+    assert cache.get(cache.key("photos", bob, params)) == cache.get(bob_key)
+
+
+def test_normalize_params_ignores_order_and_unset_values():
+    assert normalize_params({"limit": 10, "contains": None, "order": "desc"}) == \
+        normalize_params({"order": "desc", "limit": 10})
+    assert normalize_params({"limit": 10}) != normalize_params({"limit": 20})
+
+
+def test_etag_matches():
+    etag = '"abc"'
+    assert etag_matches('"abc"', etag)
+    assert etag_matches('W/"abc"', etag)
+    assert etag_matches('"xyz", "abc"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"xyz"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_redis_backend_shares_cache_and_versions():
+    """
+    Test case for the shared backend: two caches on one server see the same entries
+    """
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    first = ResponseCache(RedisBackend(fakeredis.FakeRedis(server=server)))
+    second = ResponseCache(RedisBackend(fakeredis.FakeRedis(server=server)))
+    user_id = uuid4()
+
+    key = first.key("journals", user_id, {"limit": 10})
+    etag = first.set(key, b'[{"title": "x"}]')
+    assert second.get(key) == (etag, b'[{"title": "x"}]')
+
+    second.bump([user_id])
+    assert first.version(user_id) == 1
+    assert first.get(first.key("journals", user_id, {"limit": 10})) is None
+
+
+def test_journal_listing_is_cached_until_a_write(client, seed_photos):
+    """
+    Test case for the journal listing: ETag, 304 on a match, and a new body after POST, PUT and DELETE
+    """
+    user_id, _ = seed_photos(0)
+    url = f"/users/{user_id}/journals?fields=summary"
+
+    def check_hit():
+        response = client.get(url)
+        assert response.status_code == 200 and response.headers["ETag"]
+        assert client.get(url, headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+        return response
+
+    first = check_hit()
+    assert first.json() == []
+
+    journal = client.post(f"/users/{user_id}/journals", json={"title": "Lisbon"}).json()
+    created = check_hit()
+    assert created.headers["ETag"] != first.headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": first.headers["ETag"]}).status_code == 200
+    assert [j["title"] for j in created.json()] == ["Lisbon"]
+
+    assert client.put(f"/users/{user_id}/journals/{journal['journal_id']}", json={"title": "Porto"}).status_code == 200
+    assert [j["title"] for j in check_hit().json()] == ["Porto"]
+
+    assert client.delete(f"/users/{user_id}/journals/{journal['journal_id']}").status_code == 200
+    assert check_hit().json() == []
+
+
+def test_photo_listing_is_cached_until_a_write(client, seed_photos, db_session):
+    """
+    Test case for the photo listing: any commit touching the user (after_commit hook) changes the next response
+    """
+    from database import Photo
+
+    user_id, photo_ids = seed_photos(2)
+    url = f"/users/{user_id}/photos"
+    response = client.get(url)
+    etag = response.headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    # a commit outside the API
+    db_session.get(Photo, photo_ids[0]).location = "Riverside"
+    db_session.commit()
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["ETag"] != etag
+    etag = response.headers["ETag"]
+
+    assert client.delete(f"/users/{user_id}/photos/{photo_ids[1]}").status_code == 200
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200 and len(response.json()) == 1
@@ -0,0 +1,56 @@
+import uuid
+
+
+def photo_ids(response):
+    assert response.status_code == 200, response.text
+    return sorted(photo["photo_id"] for photo in response.json())
+
+
+def test_filter_photos_by_device_ids_and_own_device_names(client, seed_photos, db_session, count_queries):
+    from database import Device, Photo
+
+    # every seeded user has a device named "camera"
+    seed_photos(2)
+    user_id, ids = seed_photos(4)
+    phone = Device(user_id=user_id, device_name="phone", api_key=str(uuid.uuid4()))
+    db_session.add(phone)
+    camera_id = db_session.get(Photo, ids[0]).device_id
+    for photo_id in ids[2:]:
+        db_session.get(Photo, photo_id).device_id = phone.device_id
+    db_session.commit()
+    url = f"/users/{user_id}/photos?limit=100"
+
+    assert photo_ids(client.get(f"{url}&device=camera")) == sorted(str(i) for i in ids[:2])
+    assert photo_ids(client.get(f"{url}&device_id={phone.device_id}")) == sorted(str(i) for i in ids[2:])
+    assert len(photo_ids(client.get(f"{url}&device_id={phone.device_id}&device_id={camera_id}"))) == 4
+    assert photo_ids(client.get(f"{url}&device=camera&device_id={phone.device_id}")) == []
+    assert client.get(f"{url}&device=tablet").status_code == 404
+
+    # the names are looked up once, not on every listing
+    with count_queries() as statements:
+        assert len(photo_ids(client.get(f"{url}&device=phone&limit=2"))) == 2
+    assert not any("FROM devices" in statement for statement in statements)
+
+    # renaming and deleting devices drop the cached names
+    assert client.put(f"/users/{user_id}/devices/{phone.device_id}", json={"device_name": "old phone"}).status_code == 200
+    assert client.get(f"{url}&device=phone").status_code == 404
+    assert len(photo_ids(client.get(f"{url}&device=old%20phone"))) == 2
+    created = client.post(f"/users/{user_id}/devices", json={"device_name": "tablet", "api_key": str(uuid.uuid4())})
+    assert created.status_code == 200, created.text
+    assert photo_ids(client.get(f"{url}&device=tablet")) == []
+
+
+def test_devices_of_other_users_are_not_found(client, seed_photos, db_session):
+    from database import Device, Photo
+
+    owner, owner_photos = seed_photos(1)
+    other, _ = seed_photos(1)
+    device_id = db_session.get(Photo, owner_photos[0]).device_id
+    url = f"/users/{other}/devices/{device_id}"
+
+    assert client.get(url).status_code == 404
+    assert client.put(url, json={"device_name": "taken", "api_key": "taken"}).status_code == 404
+    assert client.delete(url).status_code == 404
+    db_session.expire_all()
+    device = db_session.get(Device, device_id)
+    assert (device.device_name, device.user_id) == ("camera", owner)
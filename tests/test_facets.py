@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+
+def test_facets_count_every_dimension_in_one_query(client, seed_photos, db_session, count_queries):
+    import uuid
+    from database import Device, Photo
+
+    # seed_photos takes one photo every 10 minutes on August 1st, 2024
+    user_id, photo_ids = seed_photos(5)
+    photos = [db_session.get(Photo, photo_id) for photo_id in photo_ids]
+    phone = Device(user_id=user_id, device_name="phone", api_key=str(uuid.uuid4()))
+    db_session.add(phone)
+    photos[0].starred = photos[1].starred = True
+    photos[1].device_id = photos[2].device_id = phone.device_id
+    photos[3].time_taken = photos[3].time_created + timedelta(days=40)
+    db_session.commit()
+
+    url = f"/users/{user_id}/photos/facets"
+    with count_queries() as statements:
+        facets = client.get(url).json()
+    # user, grouped counts, device names
+    assert len(statements) == 3
+    assert (facets["total"], facets["starred"], facets["unstarred"]) == (5, 2, 3)
+    assert [(d["device_name"], d["count"]) for d in facets["devices"]] == [("camera", 3), ("phone", 2)]
+    assert facets["months"] == [{"month": "2024-09", "count": 1}, {"month": "2024-08", "count": 4}]
+
+    # each facet ignores its own filter, the rest follow all of them
+    facets = client.get(f"{url}?starred=true&device=phone").json()
+    assert (facets["total"], facets["starred"], facets["unstarred"]) == (1, 1, 1)
+    assert [(d["device_name"], d["count"]) for d in facets["devices"]] == [("camera", 1), ("phone", 1)]
+    assert facets["months"] == [{"month": "2024-08", "count": 1}]
+
+    assert client.get(f"{url}?device=nosuchdevice").status_code == 404
+    # cached until the user's photos change
+    etag = client.get(url).headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    assert client.delete(f"/users/{user_id}/photos/{photo_ids[3]}").status_code == 200
+    assert client.get(url).json()["months"] == [{"month": "2024-08", "count": 4}]
@@ -0,0 +1,81 @@
+import asyncio
+import re
+import threading
+from datetime import datetime, timedelta
+
+from api.functions import chunk_lines, compact_entries, estimate_tokens, expand_image_refs, generate_journal_func
+
+
+class EchoProvider:
+    """Answers with every image reference found in the prompt, and records the prompts"""
+
+    def __init__(self):
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def complete(self, prompt):
+        with self._lock:
+            self.prompts.append(prompt)
+        refs = re.findall(r"\[(img\d+)\]", prompt.split("Here are the entries")[-1])
+        if "Summarize" in prompt:
+            return " ".join(f"saw [{ref}]" for ref in refs)
+        return "# A long day\n\n" + " ".join(f"![]({ref})" for ref in refs)
+
+
+def make_entries(count, start=datetime(2024, 8, 1, 8, 0), step=timedelta(minutes=10), words=30):
+    return [dict(time_created=start + step * i, type="image", content=" ".join(["word"] * words),
+                 url=f"https://vmbook.example.com/photos/{i:04d}.jpg") for i in range(count)]
+
+
+def test_compact_entries_is_much_smaller_than_the_repr():
+    entries = make_entries(3, words=5) + [dict(time_created=datetime(2024, 8, 2, 9, 30), type="text", content="Rain.")]
+
+    lines, times, urls = compact_entries(entries)
+
+    assert lines == ["Thursday 2024-08-01", "08:00 [img1] word word word word word", "08:10 [img2] word word word word word",
+                     "08:20 [img3] word word word word word", "Friday 2024-08-02", "09:30 Rain."]
+    assert times[0] is None and times[1] == datetime(2024, 8, 1, 8, 0)
+    assert urls["img2"] == "https://vmbook.example.com/photos/0001.jpg"
+    assert estimate_tokens("\n".join(lines)) * 3 < estimate_tokens(repr(entries))
+
+
+def test_expand_image_refs():
+    urls = {"img1": "https://a/1.jpg", "img2": "https://a/2.jpg"}
+
+    assert expand_image_refs("![](img1) and [img2], not img3 or ![](img3)", urls) == \
+        "![](https://a/1.jpg) and ![](https://a/2.jpg), not img3 or ![](img3)"
+
+
+def test_chunks_follow_pauses_in_the_day():
+    morning = make_entries(6, start=datetime(2024, 8, 1, 8, 0))
+    evening = make_entries(6, start=datetime(2024, 8, 1, 19, 0))
+    lines, times, _ = compact_entries(morning + evening)
+
+    chunks = chunk_lines(lines, budget=estimate_tokens("\n".join(lines)) * 3 // 4, times=times)
+
+    assert len(chunks) == 2
+    assert chunks[1][0].startswith("19:00")
+
+
+def test_small_selections_are_generated_in_one_call():
+    provider = EchoProvider()
+
+    title, journal = asyncio.run(generate_journal_func(make_entries(3), provider))
+
+    assert len(provider.prompts) == 1
+    assert title == " A long day"
+    assert journal.count("](https://vmbook.example.com/photos/") == 3
+
+
+def test_large_selections_are_summarized_in_chunks():
+    provider = EchoProvider()
+    entries = make_entries(200)
+
+    title, journal = asyncio.run(generate_journal_func(entries, provider, budget=2000))
+
+    summaries = [prompt for prompt in provider.prompts if "Summarize" in prompt]
+    assert len(summaries) > 1
+    assert len(provider.prompts) >= len(summaries) + 1
+    assert all(estimate_tokens(prompt) <= 2000 for prompt in provider.prompts)
+    # every photo made it through the summaries into the journal
+    assert all(f"![]({entry['url']})" in journal for entry in entries)
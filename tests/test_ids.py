@@ -0,0 +1,32 @@
+import time
+import uuid
+
+from database.ids import uuid7, uuid7_from
+
+
+def test_uuid7_layout():
+    before = time.time_ns() // 1_000_000
+    value = uuid7()
+    after = time.time_ns() // 1_000_000
+
+    assert value.version == 7
+    assert value.variant == uuid.RFC_4122
+    assert before <= value.int >> 80 <= after + 1
+    assert uuid7_from(1_700_000_000_000, 0xABC, 1).int >> 80 == 1_700_000_000_000
+
+
+def test_uuid7_is_strictly_increasing_within_a_process():
+    ids = [uuid7() for _ in range(20000)]
+
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+
+
+def test_models_default_to_time_ordered_ids(seed_photos):
+    from database import Journal
+
+    _, photo_ids = seed_photos(3)
+
+    assert all(photo_id.version == 7 for photo_id in photo_ids)
+    assert photo_ids == sorted(photo_ids)
+    assert Journal(user_id=uuid.uuid4()).journal_id.version == 7
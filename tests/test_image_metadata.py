@@ -0,0 +1,132 @@
+import io
+import json
+import os
+import struct
+from datetime import datetime
+
+import pytest
+
+from api.image_metadata import read_metadata
+
+TEST_IMAGE = os.path.join(os.path.dirname(__file__), "testimage.jpg")  # 188x177, no EXIF
+
+
+def ifd(entries, offset, extra_offset):
+    """A little-endian TIFF IFD at ``offset``; values longer than 4 bytes go after it, from ``extra_offset``."""
+    head, extra = struct.pack("<H", len(entries)), b""
+    for tag, kind, count, value in sorted(entries):
+        if len(value) <= 4:
+            head += struct.pack("<HHI", tag, kind, count) + value.ljust(4, b"\x00")
+        else:
+            head += struct.pack("<HHII", tag, kind, count, extra_offset + len(extra))
+            extra += value
+    return head + struct.pack("<I", 0), extra
+
+
+def exif_segment(taken="2024:08:01 09:30:00", offset="+08:00", orientation=6,
+                 latitude=((31, 1), (14, 1), (2424, 100)), longitude=((121, 1), (28, 1), (3000, 100))):
+    rational = lambda values: b"".join(struct.pack("<II", *value) for value in values)
+    # IFD0 at 8, Exif IFD at 100, GPS IFD at 200
+    ifd0, _ = ifd([(0x0112, 3, 1, struct.pack("<H", orientation)), (0x8769, 4, 1, struct.pack("<I", 100)),
+                   (0x8825, 4, 1, struct.pack("<I", 200))], 8, 60)
+    exif, exif_extra = ifd([(0x9003, 2, 20, taken.encode() + b"\x00"), (0x9011, 2, 7, offset.encode() + b"\x00")],
+                           100, 130)
+    gps, gps_extra = ifd([(1, 2, 2, b"N\x00"), (2, 5, 3, rational(latitude)), (3, 2, 2, b"E\x00"),
+                          (4, 5, 3, rational(longitude))], 200, 254)
+    tiff = (b"II*\x00" + struct.pack("<I", 8) + ifd0).ljust(100, b"\x00")
+    tiff = (tiff + exif + exif_extra).ljust(200, b"\x00") + gps + gps_extra
+    payload = b"Exif\x00\x00" + tiff
+    return b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+
+
+def jpeg_with_exif(**exif) -> bytes:
+    with open(TEST_IMAGE, "rb") as f:
+        image = f.read()
+    return image[:2] + exif_segment(**exif) + image[2:]
+
+
+def test_reads_exif_capture_time_gps_and_orientation():
+    # read from the current position, e.g. after a multipart boundary
+    file = io.BytesIO(b"---" + jpeg_with_exif())
+    file.seek(3)
+
+    meta = read_metadata(file)
+
+    assert meta.mime_type == "image/jpeg"
+    assert (meta.width, meta.height) == (177, 188)  # rotated by the orientation tag
+    assert meta.time_taken == datetime(2024, 8, 1, 1, 30)  # converted to UTC
+    assert meta.latitude == pytest.approx(31.240067, abs=1e-6)
+    assert meta.longitude == pytest.approx(121.475, abs=1e-6)
+    assert file.tell() == 3
+
+
+def test_headers_without_exif():
+    png = b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">II", 640, 480) + b"\x08\x02\x00\x00\x00"
+    gif = b"GIF89a" + struct.pack("<HH", 32, 16) + b"\x00" * 20
+    webp = b"RIFF\x00\x00\x00\x00WEBPVP8X" + b"\x0a\x00\x00\x00\x00\x00\x00\x00" + (1919).to_bytes(3, "little") \
+        + (1079).to_bytes(3, "little")
+
+    assert read_metadata(open(TEST_IMAGE, "rb")).time_taken is None
+    assert (read_metadata(io.BytesIO(png)).mime_type, read_metadata(io.BytesIO(png)).width) == ("image/png", 640)
+    assert (read_metadata(io.BytesIO(gif)).width, read_metadata(io.BytesIO(gif)).height) == (32, 16)
+    assert (read_metadata(io.BytesIO(webp)).width, read_metadata(io.BytesIO(webp)).height) == (1920, 1080)
+    assert read_metadata(io.BytesIO(b"not an image")).mime_type is None
+
+
+def test_truncated_and_blank_headers():
+    image = jpeg_with_exif(taken="0000:00:00 00:00:00", latitude=((0, 1), (0, 1), (0, 1)), longitude=((0, 1),) * 3)
+
+    blank = read_metadata(io.BytesIO(image))
+    truncated = read_metadata(io.BytesIO(jpeg_with_exif()[:400]))
+
+    assert blank.time_taken is None and blank.latitude is None and blank.width == 177
+    assert truncated.time_taken == datetime(2024, 8, 1, 1, 30)
+    assert truncated.width is None
+
+
+def test_upload_reads_the_image_header(client, seed_photos, db_session, memory_bucket):
+    from database import Device
+
+    user_id, _ = seed_photos(0)
+    device = db_session.query(Device).filter(Device.user_id == user_id).first()
+
+    response = client.post(f"/users/{user_id}/photos", data={"photo_create": json.dumps({"device_id": str(device.device_id)})},
+                           files={"image": ("holiday.jpg", jpeg_with_exif(), "image/jpeg")})
+
+    assert response.status_code == 200
+    photo = response.json()
+    assert photo["time_taken"] == "2024-08-01T01:30:00"
+    assert (photo["width"], photo["height"], photo["mime_type"]) == (177, 188, "image/jpeg")
+    assert photo["latitude"] == pytest.approx(31.240067, abs=1e-6)
+    assert photo["file_name"] == "holiday.jpg"
+    # the whole file was uploaded, not just what was left after the header
+    assert list(memory_bucket.objects.values()) == [jpeg_with_exif()]
+
+    # without EXIF the capture time is left unknown, not set to the upload time
+    with open(TEST_IMAGE, "rb") as f:
+        response = client.post(f"/users/{user_id}/photos",
+                               data={"photo_create": json.dumps({"device_id": str(device.device_id)})},
+                               files={"image": ("scan.jpg", f.read(), "image/jpeg")})
+    assert response.status_code == 200
+    assert response.json()["time_taken"] is None
+
+
+def test_backfill(app, seed_photos, db_session, memory_bucket):
+    from database import engine, Photo
+    from scripts.backfill_photo_metadata import backfill
+
+    _, photo_ids = seed_photos(2)
+    with open(TEST_IMAGE, "rb") as f:
+        memory_bucket.objects = {"with-exif.jpg": jpeg_with_exif(), "without.jpg": f.read()}
+    for photo_id, key in zip(photo_ids, memory_bucket.objects):
+        db_session.get(Photo, photo_id).url = f"https://bucket.example.com/{key}"
+    db_session.query(Photo).filter(Photo.photo_id.notin_(photo_ids)).update({"mime_type": "image/jpeg"})
+    db_session.commit()
+
+    assert backfill(engine, memory_bucket, batch_size=1, log=None) == 2
+    db_session.expire_all()
+    with_exif, without = [db_session.get(Photo, photo_id) for photo_id in photo_ids]
+    assert with_exif.time_taken == datetime(2024, 8, 1, 1, 30)
+    assert without.time_taken is None
+    assert (without.mime_type, without.width) == ("image/jpeg", 188)
+    assert backfill(engine, memory_bucket, log=None) == 0
@@ -0,0 +1,135 @@
+import uuid
+
+import pytest
+
+from database import User, Device, Journal, Photo, Entry
+
+
+def seed_journal(session, photos: int, entries: int):
+    """
+    Create a user with a device and one journal holding ``photos`` photos and ``entries`` entries
+    """
+    user = User(username="includes", email=f"{uuid.uuid4()}@test.com", password_hash="x")
+    device = Device(user_id=user.user_id, device_name="camera", api_key=str(uuid.uuid4()))
+    journal = Journal(user_id=user.user_id, title="Trip", description="# Trip")
+    session.add_all([user, device, journal])
+    session.flush()
+    for i in range(photos):
+        session.add(Photo(user_id=user.user_id, journal_id=journal.journal_id, device_id=device.device_id,
+                          url=f"https://example.com/{i}.jpg", description=f"photo {i}"))
+    for i in range(entries):
+        session.add(Entry(user_id=user.user_id, journal_id=journal.journal_id, device_id=device.device_id,
+                          content=f"entry {i}"))
+    session.commit()
+    # ids only: touching expired ORM objects later would add queries to the counts
+    return user.user_id, journal.journal_id
+
+
+@pytest.mark.parametrize("photos,entries", [(2, 1), (30, 20)])
+def test_journal_detail_query_count_is_constant(client, db_session, count_queries, photos, entries):
+    """
+    Test case for fetching a journal with its photos and entries in a fixed number of queries
+    """
+    user_id, journal_id = seed_journal(db_session, photos, entries)
+
+    with count_queries() as statements:
+        response = client.get(f"/users/{user_id}/journals/{journal_id}?include=photos,entries")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["photos"]) == photos
+    assert len(data["entries"]) == entries
+    # user, journal, photos, entries
+    assert len(statements) == 4
+
+
+def test_journal_list_include_query_count_is_constant(client, db_session, count_queries):
+    user_id, _ = seed_journal(db_session, photos=5, entries=5)
+    for i in range(10):
+        db_session.add(Journal(user_id=user_id, title=f"Journal {i}"))
+    db_session.commit()
+
+    with count_queries() as statements:
+        response = client.get(f"/users/{user_id}/journals?include=photos,entries&limit=20")
+
+    assert response.status_code == 200
+    assert len(response.json()) == 11
+    assert sum(len(journal["photos"]) for journal in response.json()) == 5
+    assert len(statements) == 4
+
+
+def test_photo_list_include_device(client, db_session, count_queries):
+    user_id, _ = seed_journal(db_session, photos=12, entries=0)
+
+    with count_queries() as statements:
+        response = client.get(f"/users/{user_id}/photos?include=device,journal&fields=summary&limit=20")
+
+    assert response.status_code == 200
+    photos = response.json()
+    assert len(photos) == 12
+    assert all(photo["device"]["device_name"] == "camera" for photo in photos)
+    assert all(photo["journal"]["title"] == "Trip" for photo in photos)
+    assert "description" not in photos[0]
+    # user, photos, devices, journals
+    assert len(statements) == 4
+
+
+def test_user_include_devices(client, db_session, count_queries):
+    user_id, _ = seed_journal(db_session, photos=0, entries=0)
+
+    with count_queries() as statements:
+        response = client.get(f"/users/{user_id}?include=devices")
+
+    assert response.status_code == 200
+    assert [device["device_name"] for device in response.json()["devices"]] == ["camera"]
+    assert len(statements) == 2
+
+
+def test_without_include_relationships_are_not_loaded(client, db_session, count_queries):
+    user_id, journal_id = seed_journal(db_session, photos=3, entries=3)
+
+    with count_queries() as statements:
+        response = client.get(f"/users/{user_id}/journals/{journal_id}")
+
+    assert response.status_code == 200
+    assert "photos" not in response.json()
+    assert len(statements) == 2
+
+
+def test_unknown_include_is_rejected(client, db_session):
+    user_id, journal_id = seed_journal(db_session, photos=0, entries=0)
+
+    response = client.get(f"/users/{user_id}/journals/{journal_id}?include=password_hash")
+
+    assert response.status_code == 400
+
+
+def test_photos_and_journals_of_other_users_are_not_found(client, db_session):
+    from fastapi import HTTPException
+    from api.endpoints_v1 import delete_user_journals
+
+    owner, journal_id = seed_journal(db_session, photos=1, entries=0)
+    other, _ = seed_journal(db_session, photos=0, entries=0)
+    photo_id = db_session.query(Photo.photo_id).filter(Photo.journal_id == journal_id).scalar()
+
+    photo_url, journal_url = f"/users/{other}/photos/{photo_id}", f"/users/{other}/journals/{journal_id}"
+    assert client.put(photo_url, json={"photo_id": str(photo_id), "description": "taken"}).status_code == 404
+    assert client.get(f"{photo_url}/analyze").status_code == 404
+    assert client.delete(photo_url).status_code == 404
+    assert client.request("DELETE", f"/users/{other}/photos", json=[str(photo_id)]).status_code == 404
+    assert client.delete(journal_url).status_code == 404
+    # POST /users/{user_id}/journals creates a journal, so the bulk delete is called directly
+    with pytest.raises(HTTPException) as raised:
+        delete_user_journals(other, [journal_id], db_session)
+    assert raised.value.status_code == 404
+
+    db_session.expire_all()
+    assert db_session.get(Photo, photo_id).description == "photo 0"
+    assert db_session.get(Journal, journal_id).user_id == owner
+
+    # the owner's update only changes the fields it sends
+    response = client.put(f"/users/{owner}/photos/{photo_id}", json={"photo_id": str(photo_id), "starred": True})
+    assert response.status_code == 200, response.text
+    db_session.expire_all()
+    photo = db_session.get(Photo, photo_id)
+    assert (photo.starred, photo.description) == (True, "photo 0")
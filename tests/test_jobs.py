@@ -0,0 +1,261 @@
+import asyncio
+import time
+
+import pytest
+from sqlmodel import Session
+
+from database import engine, Journal
+from api.jobs import JobScheduler, TokenBucket, QueueFull, SchedulerClosed
+from api.providers import StubProvider
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket_limits_rate():
+    """
+    Test case for the token bucket: a burst of `capacity`, then `rate` per second
+    """
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock, sleep=clock.sleep)
+
+    assert [bucket.try_acquire() for _ in range(3)] == [0, 0, 0]
+    assert bucket.try_acquire() == pytest.approx(0.5)
+
+    for _ in range(4):
+        bucket.acquire()
+    assert clock.now == pytest.approx(2.0)
+
+
+def test_shared_token_bucket_limits_all_workers_together():
+    """
+    Test case for the Redis token bucket: two workers draw on the same tokens
+    """
+    fakeredis = pytest.importorskip("fakeredis")
+    from api.jobs import SharedTokenBucket
+
+    server = fakeredis.FakeServer()
+    clock = FakeClock()
+    first, second = (SharedTokenBucket(fakeredis.FakeRedis(server=server), "rate", rate=2, capacity=3,
+                                       clock=clock, sleep=clock.sleep) for _ in range(2))
+
+    assert [first.try_acquire(), second.try_acquire(), first.try_acquire()] == [0, 0, 0]
+    assert second.try_acquire() == pytest.approx(0.5)
+
+    for bucket in (first, second, first, second):
+        bucket.acquire()
+    assert clock.now == pytest.approx(2.0)
+
+
+def test_scheduler_is_fair_between_users(app, seed_photos):
+    """
+    Test case for round-robin scheduling: a user with a backlog does not starve others
+    """
+    alice, alice_photos = seed_photos(1)
+    bob, bob_photos = seed_photos(1)
+    order = []
+
+    async def run():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def handler(job_id, provider, session_factory):
+            with session_factory() as session:
+                from database import GenerationJob
+                order.append(session.get(GenerationJob, job_id).user_id)
+            started.set()
+            await release.wait()
+
+        scheduler = JobScheduler(handler=handler, provider_factory=StubProvider, concurrency=1, max_pending=10)
+        # alice's first job keeps the only worker busy while the others queue up
+        jobs = [await scheduler.submit(alice, alice_photos, regenerate=True)]
+        await started.wait()
+        jobs += [await scheduler.submit(alice, alice_photos, regenerate=True) for _ in range(2)]
+        jobs.append(await scheduler.submit(bob, bob_photos))
+        release.set()
+        for job in jobs:
+            await scheduler.wait(job.job_id, timeout=5)
+
+    asyncio.run(run())
+    assert order == [alice, alice, bob, alice]
+
+
+def test_scheduler_limits_pending_jobs_per_user(app, seed_photos):
+    user_id, photo_ids = seed_photos(1)
+
+    async def run():
+        started = asyncio.Event()
+
+        async def handler(job_id, provider, session_factory):
+            started.set()
+            await asyncio.Event().wait()
+
+        scheduler = JobScheduler(handler=handler, provider_factory=StubProvider, concurrency=1, max_pending=2)
+        # the running job does not count, the two queued behind it do
+        await scheduler.submit(user_id, photo_ids)
+        await started.wait()
+        await scheduler.submit(user_id, photo_ids, regenerate=True)
+        await scheduler.submit(user_id, photo_ids, regenerate=True)
+        with pytest.raises(QueueFull):
+            await scheduler.submit(user_id, photo_ids, regenerate=True)
+
+    asyncio.run(run())
+
+
+def test_scheduler_retries_rate_limited_calls(app, seed_photos):
+    """
+    Test case for retries: a provider throttling twice still produces a journal on the third attempt
+    """
+    user_id, photo_ids = seed_photos(2, description="A squirrel")
+    provider = StubProvider(fail_times=2)
+    scheduler = JobScheduler(provider_factory=lambda: provider, backoff=0)
+
+    async def run():
+        job = await scheduler.submit(user_id, photo_ids)
+        return await scheduler.wait(job.job_id, timeout=5)
+
+    job = asyncio.run(run())
+    assert job.status == "succeeded"
+    assert job.attempts == 3
+    with Session(engine) as session:
+        journal = session.get(Journal, job.journal_id)
+        assert journal.user_id == user_id
+        assert journal.title.startswith(" Stub journal")
+
+
+def test_scheduler_gives_up_after_max_attempts(app, seed_photos):
+    user_id, photo_ids = seed_photos(1, description="A squirrel")
+    scheduler = JobScheduler(provider_factory=lambda: StubProvider(fail_times=10), backoff=0, max_attempts=2)
+
+    async def run():
+        job = await scheduler.submit(user_id, photo_ids)
+        return await scheduler.wait(job.job_id, timeout=5)
+
+    job = asyncio.run(run())
+    assert job.status == "failed"
+    assert job.attempts == 2
+    assert "rate limit" in job.error
+
+
+def test_scheduler_shutdown_drains_then_fails_leftovers(app, seed_photos):
+    """
+    Test case for graceful shutdown: running jobs get the drain timeout, jobs that cannot finish are marked failed
+    """
+    user_id, photo_ids = seed_photos(1, description="A squirrel")
+    started = []
+
+    async def handler(job_id, provider, session_factory):
+        started.append(job_id)
+        # the first job finishes within the drain timeout, the second never does
+        await asyncio.sleep(0.05 if len(started) == 1 else 60)
+
+    scheduler = JobScheduler(handler=handler, provider_factory=StubProvider, concurrency=1, max_pending=10)
+
+    async def run():
+        scheduler.start()
+        first, second = [await scheduler.submit(user_id, photo_ids, regenerate=True) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        await scheduler.shutdown(timeout=0.2)
+        with pytest.raises(SchedulerClosed):
+            await scheduler.submit(user_id, photo_ids)
+        return scheduler.get(first.job_id), await scheduler.wait(second.job_id, timeout=1)
+
+    first, second = asyncio.run(run())
+    assert first.status == "succeeded"
+    assert second.status == "failed"
+    assert second.error == "Interrupted by server shutdown"
+
+
+def test_identical_requests_share_one_generation(app, seed_photos):
+    """
+    Test case for single-flight and the result cache: the model is asked once per distinct input
+    """
+    user_id, photo_ids = seed_photos(2, description="A squirrel")
+    provider = StubProvider(latency=0.05)
+    scheduler = JobScheduler(provider_factory=lambda: provider)
+
+    async def run():
+        concurrent = [await scheduler.submit(user_id, photo_ids) for _ in range(3)]
+        first = await scheduler.wait(concurrent[0].job_id, timeout=5)
+        later = await scheduler.submit(user_id, list(reversed(photo_ids)))
+        fresh = await scheduler.wait((await scheduler.submit(user_id, photo_ids, regenerate=True)).job_id, timeout=5)
+        return concurrent, first, later, fresh
+
+    concurrent, first, later, fresh = asyncio.run(run())
+    assert len({job.job_id for job in concurrent}) == 1
+    assert first.status == "succeeded"
+    assert later.job_id == first.job_id and later.journal_id == first.journal_id
+    assert fresh.journal_id != first.journal_id
+    assert [kind for kind, _ in provider.calls] == ["complete", "complete"]
+
+
+def test_changed_descriptions_miss_the_cache(app, db_session, seed_photos):
+    from database import Photo
+
+    user_id, photo_ids = seed_photos(1, description="A squirrel")
+    scheduler = JobScheduler(provider_factory=StubProvider)
+
+    async def generate():
+        return await scheduler.wait((await scheduler.submit(user_id, photo_ids)).job_id, timeout=5)
+
+    first = asyncio.run(generate())
+    db_session.get(Photo, photo_ids[0]).description = "Two squirrels"
+    db_session.commit()
+    second = asyncio.run(generate())
+
+    assert second.job_id != first.job_id
+    assert second.journal_id != first.journal_id
+
+
+def test_generation_job_endpoints(client, seed_photos, stub_provider):
+    """
+    Test case for submitting a generation job and polling it until the journal is saved
+    """
+    user_id, photo_ids = seed_photos(3)
+
+    response = client.post(f"/users/{user_id}/journals/generate/jobs", json={"photo_ids": [str(i) for i in photo_ids]})
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] in ("queued", "running", "succeeded")
+
+    deadline = time.time() + 5
+    while job["status"] not in ("succeeded", "failed") and time.time() < deadline:
+        time.sleep(0.02)
+        job = client.get(f"/users/{user_id}/journals/generate/jobs/{job['job_id']}").json()
+
+    assert job["status"] == "succeeded"
+    journal = client.get(f"/users/{user_id}/journals/{job['journal_id']}").json()
+    assert journal["description"].startswith("# Stub journal")
+    # photos without a description were captioned first
+    assert [kind for kind, _ in stub_provider.calls] == ["describe_image"] * 3 + ["complete"]
+
+
+def test_generate_journal_waits_for_job(client, seed_photos, stub_provider):
+    user_id, photo_ids = seed_photos(2, description="A squirrel")
+
+    response = client.post(f"/users/{user_id}/journals/generate", json={"photo_ids": [str(i) for i in photo_ids]})
+
+    assert response.status_code == 200
+    assert response.json()["user_id"] == str(user_id)
+    assert response.json()["title"].startswith(" Stub journal")
+
+    again = client.post(f"/users/{user_id}/journals/generate", json={"photo_ids": [str(i) for i in photo_ids]})
+    assert again.json()["journal_id"] == response.json()["journal_id"]
+    fresh = client.post(f"/users/{user_id}/journals/generate?regenerate=true", json={"photo_ids": [str(i) for i in photo_ids]})
+    assert fresh.json()["journal_id"] != response.json()["journal_id"]
+    assert [kind for kind, _ in stub_provider.calls] == ["complete", "complete"]
+
+
+def test_generate_journal_requires_photos(client, seed_photos, stub_provider):
+    user_id, _ = seed_photos(0)
+
+    response = client.post(f"/users/{user_id}/journals/generate", json={})
+
+    assert response.status_code == 400
@@ -0,0 +1,82 @@
+import asyncio
+import re
+
+import pytest
+
+
+def sample(text: str, name: str, **labels) -> float:
+    """The value of one sample in the exposition text, or 0 if absent"""
+    for line in text.splitlines():
+        if line.startswith("#") or not line.startswith(name):
+            continue
+        metric, value = line.rsplit(" ", 1)
+        found = dict(re.findall(r'(\w+)="([^"]*)"', metric))
+        if metric.split("{")[0] == name and found == {k: str(v) for k, v in labels.items()}:
+            return float(value)
+    return 0.0
+
+
+def test_histogram_renders_cumulative_buckets():
+    from api.metrics import Histogram
+
+    histogram = Histogram("test_seconds", "Test.", ["route"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, route="/a")
+    text = "\n".join(histogram.render())
+
+    assert "# TYPE test_seconds histogram" in text
+    assert sample(text, "test_seconds_bucket", route="/a", le="0.1") == 1
+    assert sample(text, "test_seconds_bucket", route="/a", le="1") == 3
+    assert sample(text, "test_seconds_bucket", route="/a", le="+Inf") == 4
+    assert sample(text, "test_seconds_count", route="/a") == 4
+    assert sample(text, "test_seconds_sum", route="/a") == pytest.approx(4.05)
+
+
+def test_metric_rejects_unknown_labels():
+    from api.metrics import Counter
+
+    with pytest.raises(ValueError):
+        Counter("test_total", "Test.", ["route"]).inc(path="/a")
+
+
+def test_requests_are_labelled_by_route_template(client, seed_photos):
+    user_id, _ = seed_photos(2)
+    for _ in range(3):
+        assert client.get(f"/users/{user_id}/photos").status_code == 200
+    client.get("/no/such/path")
+
+    text = client.get("/metrics").text
+    route = "/users/{user_id}/photos"
+    assert sample(text, "vmbook_http_requests_total", method="GET", route=route, status="200") >= 3
+    assert sample(text, "vmbook_http_request_duration_seconds_count", method="GET", route=route) >= 3
+    assert sample(text, "vmbook_http_requests_total", method="GET", route="<unmatched>", status="404") >= 1
+    assert str(user_id) not in text
+    assert sample(text, "vmbook_http_requests_in_progress", method="GET") == 1  # the /metrics request itself
+
+
+def test_database_queries_are_counted(client, seed_photos):
+    user_id, _ = seed_photos(1)
+    before = sample(client.get("/metrics").text, "vmbook_db_queries_total", operation="SELECT")
+    client.get(f"/users/{user_id}/photos?limit=1&offset=1000")  # offset keeps the response cache cold
+    after = client.get("/metrics").text
+
+    assert sample(after, "vmbook_db_queries_total", operation="SELECT") > before
+    assert sample(after, "vmbook_db_query_duration_seconds_count", operation="SELECT") > 0
+
+
+def test_external_calls_are_timed(app, stub_provider):
+    from api.functions import describe_image, generate_journal_func
+    from api.metrics import external_calls, external_call_duration
+    from api.providers import ProviderError
+
+    calls = external_call_duration.count(call="describe_image")
+    describe_image("https://example.com/a.jpg")
+    asyncio.run(generate_journal_func([{"type": "text", "content": "hello"}]))
+
+    assert external_call_duration.count(call="describe_image") == calls + 1
+    assert external_calls.value(call="generate_journal", outcome="ok") >= 1
+
+    stub_provider.fail_times = 1
+    with pytest.raises(ProviderError):
+        describe_image("https://example.com/b.jpg")
+    assert external_calls.value(call="describe_image", outcome="error") >= 1
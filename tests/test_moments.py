@@ -0,0 +1,95 @@
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from api.moments import haversine_km, moment_starts
+
+
+def reference_starts(times, locations, positions, gap_hours=3, distance_km=25):
+    """moment_starts written out as a loop"""
+    starts, label, position = [], None, None
+    for i, (time, location, point) in enumerate(zip(times, locations, positions)):
+        new = i == 0 or (time - times[i - 1]).total_seconds() > gap_hours * 3600
+        if location is not None:
+            new |= label is not None and location != label
+            label = location
+        if point is not None:
+            new |= position is not None and haversine_km(*position, *point) > distance_km
+            position = point
+        if new:
+            starts.append(i)
+    return starts
+
+
+def arrays(times, locations, positions):
+    codes = {label: code for code, label in enumerate(sorted({l for l in locations if l is not None}))}
+    return (np.array(times, "datetime64[s]"), np.array([codes.get(l, -1) for l in locations]),
+            np.array([p[0] if p else np.nan for p in positions]), np.array([p[1] if p else np.nan for p in positions]))
+
+
+def test_moments_split_on_gaps_and_moves():
+    start = datetime(2024, 8, 1, 9)
+    times = [start, start + timedelta(minutes=30), start + timedelta(hours=1), start + timedelta(hours=5),
+             start + timedelta(hours=5, minutes=10), start + timedelta(hours=5, minutes=20)]
+    # a photo without a label between two labels does not hide the move
+    locations = ["Home", None, "Beach", "Beach", None, None]
+    positions = [None, None, None, (31.2, 121.4), None, (31.2, 122.4)]  # ~95 km east
+
+    assert list(moment_starts(*arrays(times, locations, positions))) == [0, 2, 3, 5]
+    assert list(moment_starts(*arrays([], [], []))) == []
+
+
+def test_vectorized_moments_match_the_loop():
+    rng = random.Random(0)
+    times, locations, positions = [], [], []
+    current = datetime(2024, 1, 1)
+    for _ in range(3000):
+        current += timedelta(minutes=rng.expovariate(1 / 40))
+        times.append(current)
+        locations.append(rng.choice(["Home", "Park", None, None, None]))
+        positions.append((31 + rng.uniform(0, 0.5), 121 + rng.uniform(0, 0.5)) if rng.random() < 0.3 else None)
+
+    assert list(moment_starts(*arrays(times, locations, positions))) == reference_starts(times, locations, positions)
+
+
+def test_moments_endpoint_follows_new_and_deleted_photos(client, seed_photos, db_session):
+    from database import Photo
+
+    # seed_photos takes one photo every 10 minutes
+    user_id, photo_ids = seed_photos(6)
+    photos = [db_session.get(Photo, photo_id) for photo_id in photo_ids]
+    for photo in photos[3:]:
+        photo.time_taken = photo.time_created + timedelta(days=1)
+        photo.location, photo.latitude, photo.longitude = "Riverside", 31.2, 121.5
+    db_session.commit()
+
+    moments = client.get(f"/users/{user_id}/moments").json()
+    assert [m["photo_ids"] for m in moments] == [[str(i) for i in photo_ids[3:]], [str(i) for i in photo_ids[:3]]]
+    assert (moments[0]["location"], moments[0]["latitude"], moments[0]["photo_count"]) == ("Riverside", 31.2, 3)
+    assert moments[0]["start"] == "2024-08-02T09:30:00"
+
+    # a new photo joins the first moment, a deleted one leaves the second too small
+    db_session.add(Photo(user_id=user_id, device_id=photos[0].device_id, url="https://example.com/new.jpg",
+                         time_created=photos[2].time_created + timedelta(minutes=5)))
+    db_session.delete(photos[4])
+    db_session.commit()
+    moments = client.get(f"/users/{user_id}/moments").json()
+    assert [m["photo_count"] for m in moments] == [4]
+    assert len(client.get(f"/users/{user_id}/moments?min_photos=1").json()) == 2
+    assert client.get(f"/users/{user_id}/moments?fromDate=2024-08-02T00:00:00&min_photos=1").json()[0]["photo_count"] == 2
+
+
+def test_moments_pick_up_changes_that_committed_late(client, seed_photos, db_session):
+    from database import Photo
+
+    user_id, photo_ids = seed_photos(6)
+    photos = [db_session.get(Photo, photo_id) for photo_id in photo_ids]
+    assert [m["photo_count"] for m in client.get(f"/users/{user_id}/moments").json()] == [6]
+    newest = max(photo.time_modified for photo in photos)
+
+    # flushed before the newest change the cache has seen, committed after it
+    photos[3].time_taken = photos[3].time_created + timedelta(days=1)
+    photos[3].time_modified = newest - timedelta(seconds=1)
+    db_session.commit()
+    assert [m["photo_count"] for m in client.get(f"/users/{user_id}/moments?min_photos=1").json()] == [1, 5]
@@ -0,0 +1,45 @@
+from api.pagination import count_rows
+
+
+def test_totals_are_sent_on_request_and_on_head(client, seed_photos, db_session):
+    from database import Photo
+
+    user_id, photo_ids = seed_photos(5, description="a dog in the park")
+    db_session.get(Photo, photo_ids[0]).description = "a cat"
+    db_session.commit()
+    url = f"/users/{user_id}/photos"
+
+    response = client.get(f"{url}?limit=2")
+    assert len(response.json()) == 2 and "X-Total-Count" not in response.headers
+    response = client.get(f"{url}?limit=2&include_total=true&contains=dog")
+    assert len(response.json()) == 2 and response.headers["X-Total-Count"] == "4"
+
+    response = client.head(f"{url}?contains=dog")
+    assert response.status_code == 200 and response.content == b""
+    assert response.headers["X-Total-Count"] == "4" and "X-Total-Count-Estimated" not in response.headers
+
+    client.post(f"/users/{user_id}/journals", json={"title": "Park", "tags": ["dogs"]})
+    assert client.head(f"/users/{user_id}/journals?tags=dogs").headers["X-Total-Count"] == "1"
+    assert client.head(f"/users/{user_id}/journals?tags=cats").headers["X-Total-Count"] == "0"
+    # the total follows writes
+    assert client.delete(f"{url}/{photo_ids[1]}").status_code == 200
+    assert client.head(f"{url}?contains=dog").headers["X-Total-Count"] == "3"
+
+
+def test_scanning_filters_are_estimated_past_the_limit(seed_photos, db_session):
+    from database import Photo
+
+    user_id, photo_ids = seed_photos(40, description="a dog")
+    for i, photo_id in enumerate(photo_ids):
+        photo = db_session.get(Photo, photo_id)
+        photo.time_modified = photo.time_created
+        if i % 4 == 0:
+            photo.description = "a cat"
+    db_session.commit()
+    mine = [Photo.user_id == user_id]
+    cats = [Photo.description.contains("cat")]
+
+    assert count_rows(db_session, Photo.time_modified, mine, cats) == (10, True)
+    # 5 of the 20 newest photos are cats
+    assert count_rows(db_session, Photo.time_modified, mine, cats, limit=20) == (10, False)
+    assert count_rows(db_session, Photo.time_modified, mine, [Photo.description.contains("bird")], limit=20) == (0, False)
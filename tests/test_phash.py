@@ -0,0 +1,143 @@
+import io
+import json
+import random
+
+import pytest
+
+from api.phash import DuplicateIndex, collapse_duplicates, dhash, hamming
+
+
+def scene(seed, size=(640, 480), quality=90) -> bytes:
+    """A JPEG of random blobs; the same seed draws the same scene"""
+    Image = pytest.importorskip("PIL.Image")
+    ImageDraw = pytest.importorskip("PIL.ImageDraw")
+    rng = random.Random(seed)
+    image = Image.new("RGB", (640, 480), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(600), rng.randrange(440)
+        draw.ellipse((x, y, x + rng.randrange(40, 300), y + rng.randrange(40, 300)),
+                     fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    output = io.BytesIO()
+    image.resize(size).save(output, "JPEG", quality=quality)
+    return output.getvalue()
+
+
+def test_dhash_survives_resizing_and_recompression():
+    original = dhash(io.BytesIO(scene(1)))
+    smaller = dhash(io.BytesIO(scene(1, size=(320, 240), quality=40)))
+    other = dhash(io.BytesIO(scene(2)))
+
+    assert len(original) == 16
+    assert hamming(original, smaller) <= 4
+    assert hamming(original, other) > 12
+    assert dhash(io.BytesIO(b"not an image")) is None
+
+
+def test_index_matches_brute_force():
+    rng = random.Random(0)
+    hashes = []
+    for _ in range(400):
+        value = rng.getrandbits(64)
+        if hashes and rng.random() < 0.3:
+            value = int(hashes[-1], 16)
+            for bit in rng.sample(range(64), rng.randrange(9)):
+                value ^= 1 << bit
+        hashes.append(f"{value:016x}")
+    index = DuplicateIndex(max_distance=6)
+    for position, phash in enumerate(hashes):
+        index.add(position, phash)
+
+    expected = sorted((hamming(hashes[0], phash), i) for i, phash in enumerate(hashes) if hamming(hashes[0], phash) <= 6)
+    assert index.near(hashes[0]) == expected
+    linked = {i for group in index.groups() for i in group}
+    assert linked == {i for i in range(400) for j in range(400) if i != j and hamming(hashes[i], hashes[j]) <= 6}
+    with pytest.raises(ValueError):
+        DuplicateIndex(max_distance=40)
+
+
+class Shot:
+    def __init__(self, phash, description=None, width=100, height=100):
+        self.phash, self.description, self.width, self.height = phash, description, width, height
+
+
+def test_collapse_keeps_one_photo_per_group_in_order():
+    first, described, larger, unrelated, unhashed = Shot("ff00ff00ff00ff00"), Shot("ff00ff00ff00ff01", "A dog"), \
+        Shot("ff00ff00ff00ff03", width=4000), Shot("0123456789abcdef"), Shot(None)
+
+    assert collapse_duplicates([first, described, unrelated, unhashed]) == [described, unrelated, unhashed]
+    assert collapse_duplicates([first, larger, unrelated]) == [larger, unrelated]
+    assert collapse_duplicates([first, Shot("ff00ff00ff00ff00")]) == [first]
+
+
+@pytest.fixture
+def photos_with_hashes(seed_photos, db_session):
+    from database import Photo
+
+    def seed(hashes, description=None):
+        user_id, photo_ids = seed_photos(len(hashes), description=description)
+        for photo_id, phash in zip(photo_ids, hashes):
+            # without EXIF capture times: the photos are ordered by upload time
+            db_session.get(Photo, photo_id).phash = phash
+        db_session.commit()
+        return user_id, photo_ids
+
+    return seed
+
+
+def test_duplicates_endpoint(client, photos_with_hashes):
+    user_id, photo_ids = photos_with_hashes(["ff00ff00ff00ff00", "0123456789abcdef", "ff00ff00ff00ff01",
+                                             "0123456789abcdee", "fedcba9876543210", None])
+
+    groups = client.get(f"/users/{user_id}/photos/duplicates").json()
+
+    # newest group first, photos in the order they were taken
+    assert [[photo["photo_id"] for photo in group["photos"]] for group in groups] == \
+        [[str(photo_ids[1]), str(photo_ids[3])], [str(photo_ids[0]), str(photo_ids[2])]]
+    assert groups[1]["keep"] == str(photo_ids[0])
+    assert client.get(f"/users/{user_id}/photos/duplicates?distance=0").json() == []
+    assert client.get(f"/users/{user_id}/photos/duplicates?distance=64").status_code == 422
+
+
+def test_generation_can_collapse_duplicates(client, photos_with_hashes, stub_provider):
+    user_id, photo_ids = photos_with_hashes(["ff00ff00ff00ff00", "ff00ff00ff00ff01", "0123456789abcdef"],
+                                            description="A squirrel")
+
+    job = client.post(f"/users/{user_id}/journals/generate/jobs",
+                      json={"photo_ids": [str(i) for i in photo_ids], "collapse_duplicates": True}).json()
+
+    from database import engine, GenerationJob
+    from sqlmodel import Session
+    with Session(engine) as session:
+        assert json.loads(session.get(GenerationJob, job["job_id"]).photo_ids) == [str(photo_ids[0]), str(photo_ids[2])]
+
+
+def test_upload_computes_the_hash(client, seed_photos, db_session, memory_bucket):
+    from database import Device
+
+    image = scene(3)
+    user_id, _ = seed_photos(0)
+    device = db_session.query(Device).filter(Device.user_id == user_id).first()
+
+    response = client.post(f"/users/{user_id}/photos", data={"photo_create": json.dumps({"device_id": str(device.device_id)})},
+                           files={"image": ("scene.jpg", image, "image/jpeg")})
+
+    assert response.json()["phash"] == dhash(io.BytesIO(image))
+    assert list(memory_bucket.objects.values()) == [image]
+
+
+def test_backfill_hashes(app, seed_photos, db_session, memory_bucket):
+    from database import engine, Photo
+    from scripts.backfill_photo_metadata import backfill
+
+    _, (photo_id, heic_id) = seed_photos(2)
+    memory_bucket.objects = {"scene.jpg": scene(4), "photo.heic": b"\x00\x00\x00\x18ftypheic"}
+    db_session.get(Photo, photo_id).url = "https://bucket.example.com/scene.jpg"
+    db_session.get(Photo, heic_id).url = "https://bucket.example.com/photo.heic"
+    db_session.query(Photo).filter(Photo.photo_id.notin_([photo_id, heic_id])).update({"phash": "0" * 16})
+    db_session.commit()
+
+    assert backfill(engine, memory_bucket, phash=True, log=None) == 1
+    db_session.expire_all()
+    assert db_session.get(Photo, photo_id).phash == dhash(io.BytesIO(scene(4)))
+    assert db_session.get(Photo, heic_id).phash is None
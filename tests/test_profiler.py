@@ -0,0 +1,73 @@
+import logging
+
+from sqlalchemy import text
+
+
+def test_statement_shape_collapses_literals_and_in_lists():
+    from api.profiler import statement_shape
+
+    a = statement_shape("SELECT * FROM photos WHERE photo_id IN (?, ?, ?) AND starred = 1")
+    b = statement_shape("SELECT *  FROM photos\n WHERE photo_id IN (?) AND starred = 0")
+    assert a == b == "SELECT * FROM photos WHERE photo_id IN (?) AND starred = ?"
+    assert statement_shape("SELECT name FROM users WHERE email = 'a@b.c'") == "SELECT name FROM users WHERE email = ?"
+
+
+def test_repeated_statements_are_reported_as_n_plus_one(db_session, seed_photos, caplog):
+    from api import profiler
+    from database import Photo
+
+    user_id, photo_ids = seed_photos(12)
+    with caplog.at_level(logging.WARNING, logger="api.profiler"):
+        with profiler.profile("test") as request_profile:
+            for photo_id in photo_ids:
+                db_session.get(Photo, photo_id)
+
+    assert len(request_profile.queries) == 12
+    (shape, count), = request_profile.repeated(threshold=10).items()
+    assert count == 12 and shape.startswith("SELECT")
+    assert "Possible N+1 query in test: 12 executions" in caplog.text
+    assert request_profile.repeated(threshold=12) == {}
+
+
+def test_slow_queries_are_logged(db_session, monkeypatch, caplog):
+    from api import profiler
+
+    monkeypatch.setattr(profiler, "SLOW_QUERY_MS", 0)
+    with caplog.at_level(logging.WARNING, logger="vmbook.slow_query"):
+        db_session.execute(text("SELECT 42, :api_key"), {"api_key": "secret-key"})
+    assert "Slow query" in caplog.text and "SELECT ?, ?" in caplog.text
+    assert "secret-key" not in caplog.text
+
+
+def test_row_counts_are_recorded_for_writes_only(db_session, seed_photos, monkeypatch, caplog):
+    from sqlalchemy import update
+    from api import profiler
+    from database import Photo
+
+    user_id, photo_ids = seed_photos(3)
+    monkeypatch.setattr(profiler, "SLOW_QUERY_MS", 0)
+    with caplog.at_level(logging.WARNING, logger="vmbook.slow_query"):
+        with profiler.profile("test") as request_profile:
+            db_session.execute(update(Photo).where(Photo.user_id == user_id).values(starred=True))
+            db_session.query(Photo).filter(Photo.user_id == user_id).all()
+    db_session.commit()
+
+    written, read = request_profile.queries
+    assert written.shape.startswith("UPDATE") and written.rowcount == 3
+    assert read.shape.startswith("SELECT") and read.rowcount is None
+    assert "3 rows): UPDATE" in caplog.text
+
+
+def test_debug_header_returns_server_timing(client, seed_photos, monkeypatch):
+    from api import profiler
+
+    user_id, _ = seed_photos(2)
+    url = f"/users/{user_id}/photos?include=device"
+    assert "Server-Timing" not in client.get(url, headers={"X-Debug-Profile": "1"}).headers
+
+    monkeypatch.setattr(profiler, "PROFILER_HEADER", True)
+    assert "Server-Timing" not in client.get(url).headers
+    timing = client.get(url, headers={"X-Debug-Profile": "1"}).headers["Server-Timing"]
+    names = [metric.split(";")[0] for metric in timing.split(", ")]
+    assert names[:3] == ["app", "db", "q1"]
+    assert 'queries"' in timing and "SELECT" in timing
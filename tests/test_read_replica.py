@@ -0,0 +1,117 @@
+import os
+import tempfile
+import uuid
+
+import pytest
+from sqlmodel import SQLModel, Session, create_engine
+
+
+@pytest.fixture
+def replica(app, monkeypatch):
+    """
+    A second SQLite file standing in for a read replica that has not caught up with anything
+    """
+    from database import database
+
+    engine = create_engine("sqlite:///" + os.path.join(tempfile.mkdtemp(), "vmbook-replica.db"))
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setenv("DB_READ_URL", str(engine.url))
+    monkeypatch.setitem(database._engines, "DB_READ_URL", engine)
+    yield engine
+    engine.dispose()
+
+
+def test_reads_go_to_the_replica(client, replica, seed_photos, monkeypatch):
+    from database import database
+
+    user_id, _ = seed_photos(1)
+    monkeypatch.setattr(database, "READ_AFTER_WRITE_SECONDS", 0)
+
+    assert client.get(f"/users/{user_id}").status_code == 404
+    assert all(user["user_id"] != str(user_id) for user in client.get("/users/").json())
+
+
+def test_recent_writers_read_their_own_writes(client, replica, seed_photos):
+    user_id, _ = seed_photos(1)
+
+    response = client.get(f"/users/{user_id}")
+    assert response.status_code == 200
+    assert response.json()["user_id"] == str(user_id)
+    # requests without a user in the path never need the primary
+    assert client.get("/users/").json() == []
+
+
+def test_writes_still_go_to_the_primary(client, replica, db_session):
+    from database import User
+
+    response = client.post("/users/", json={"username": "replica", "email": "replica@test.com", "password": "pw"})
+    assert response.status_code == 200
+    user_id = uuid.UUID(response.json()["user_id"])
+
+    assert db_session.get(User, user_id) is not None
+    with Session(replica) as session:
+        assert session.get(User, user_id) is None
+    assert client.get(f"/users/{user_id}").status_code == 200
+
+
+def test_without_a_replica_reads_use_the_primary(app, monkeypatch):
+    from database import database, get_engine, get_read_engine
+
+    monkeypatch.delenv("DB_READ_URL", raising=False)
+    assert "DB_READ_URL" not in database._engines
+    assert get_read_engine() is get_engine()
+
+
+def test_recent_writes_are_seen_by_every_worker(app, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    from database import database
+    from api.cache import RedisBackend
+
+    server = fakeredis.FakeServer()
+    user_id = uuid.uuid4()
+    monkeypatch.setattr(database, "_write_store", RedisBackend(fakeredis.FakeRedis(server=server)))
+    database._remember_writes([user_id])
+
+    # another worker, with its own connection to the same Redis
+    monkeypatch.setattr(database, "_write_store", RedisBackend(fakeredis.FakeRedis(server=server)))
+    assert database.wrote_recently(user_id)
+    assert not database.wrote_recently(uuid.uuid4())
+
+
+def test_replica_reads_of_recent_writers_are_not_cached(app):
+    from types import SimpleNamespace
+    from database import database
+    from api.cache import cached_response
+
+    user_id = uuid.uuid4()
+    database._remember_writes([user_id])
+    renders = []
+
+    def get(read_replica):
+        request = SimpleNamespace(headers={}, state=SimpleNamespace(read_replica=read_replica))
+        return cached_response(request, "journals", user_id, {}, lambda: renders.append(1) or b"[]")
+
+    # the write landed after the request picked the replica
+    assert get(True).headers["ETag"] == get(True).headers["ETag"]
+    assert len(renders) == 2
+    get(False), get(False)
+    assert len(renders) == 3
+
+
+def test_replica_totals_of_recent_writers_are_not_cached(app):
+    from types import SimpleNamespace
+    from database import database
+    from api.pagination import cached_total
+
+    user_id = uuid.uuid4()
+    database._remember_writes([user_id])
+    counts = []
+
+    def total(read_replica):
+        request = SimpleNamespace(state=SimpleNamespace(read_replica=read_replica))
+        return cached_total(request, "photos", user_id, {}, lambda: counts.append(1) or (3, True))
+
+    assert total(True) == total(True) == (3, True)
+    assert len(counts) == 2
+    total(False), total(False)
+    assert len(counts) == 3
@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+from api.search import HashingEmbedder, VectorIndex, quantize, set_embedder, get_embedder
+
+
+def test_hashing_embedder_matches_words_and_stems():
+    embedder = HashingEmbedder()
+    query, beach, car = embedder.embed(["beaches", "Kids playing on the beach", "A red car parked outside"])
+
+    assert np.allclose(embedder.embed(["beaches"])[0], query)
+    assert float(query @ beach) > 0.05 > abs(float(query @ car))
+    assert not embedder.embed([""])[0].any()
+
+
+def test_quantized_index_ranks_like_float_vectors():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, 64)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    query = vectors[7] + 0.1 * rng.normal(size=64).astype(np.float32)
+    query /= np.linalg.norm(query)
+    ids = list(range(500))
+
+    matrix, scales = quantize(vectors)
+    index = VectorIndex(64).with_rows(ids[:300], matrix[:300], scales[:300]).with_rows(ids[300:], matrix[300:], scales[300:])
+
+    hits = index.search(query, 5)
+    assert [photo_id for photo_id, _ in hits] == list(np.argsort(-(vectors @ query))[:5])
+    assert hits[0][1] == pytest.approx(float(vectors[7] @ query), abs=0.01)
+    # replacing a row keeps the others
+    moved = index.with_rows([7], quantize(-vectors[7:8])[0], scales[7:8])
+    assert len(moved) == 500 and moved.search(query, 1)[0][0] != 7
+    assert index.search(query, 1)[0][0] == 7
+
+
+class CountingEmbedder(HashingEmbedder):
+    def __init__(self):
+        super().__init__()
+        self.texts = []
+
+    def embed(self, texts):
+        self.texts.extend(texts)
+        return super().embed(texts)
+
+
+@pytest.fixture
+def embedder():
+    previous = get_embedder()
+    embedder = CountingEmbedder()
+    set_embedder(embedder)
+    yield embedder
+    set_embedder(previous)
+
+
+def test_search_endpoint_embeds_new_descriptions_only(client, seed_photos, db_session, embedder):
+    from database import Photo
+
+    user_id, photo_ids = seed_photos(4)
+    descriptions = ["Waves rolling onto a sandy beach", "A birthday cake with candles", "A dog asleep on the sofa", None]
+    for photo_id, description in zip(photo_ids, descriptions):
+        db_session.get(Photo, photo_id).description = description
+    db_session.commit()
+
+    hits = client.get(f"/users/{user_id}/photos/search?q=beaches").json()
+    assert [hit["photo_id"] for hit in hits] == [str(photo_ids[0])]
+    assert hits[0]["score"] > 0 and "description" not in hits[0]
+    assert len(embedder.texts) == 4  # three descriptions and the query
+
+    db_session.get(Photo, photo_ids[1]).starred = True
+    db_session.get(Photo, photo_ids[3]).description = "Our dog digging on the beach"
+    db_session.commit()
+    hits = client.get(f"/users/{user_id}/photos/search?q=dog%20beach").json()
+    assert hits[0]["photo_id"] == str(photo_ids[3])
+    assert {hit["photo_id"] for hit in hits[1:]} == {str(photo_ids[0]), str(photo_ids[2])}
+    assert embedder.texts[4:] == ["Our dog digging on the beach", "dog beach"]
+
+    assert client.get(f"/users/{user_id}/photos/search?q=").status_code == 422
+
+
+def test_descriptions_are_embedded_when_saved(client, seed_photos, db_session, embedder, stub_provider):
+    import asyncio
+    from database import PhotoEmbedding
+    from api.jobs import describe_photo
+
+    user_id, photo_ids = seed_photos(3)
+    response = client.put(f"/users/{user_id}/photos/{photo_ids[0]}",
+                          json={"photo_id": str(photo_ids[0]), "description": "Waves rolling onto a sandy beach"})
+    assert response.status_code == 200, response.text
+    description = asyncio.run(describe_photo(photo_ids[1], "https://example.com/a.jpg", stub_provider))
+    # starring a photo embeds nothing
+    client.put(f"/users/{user_id}/photos/{photo_ids[2]}", json={"photo_id": str(photo_ids[2]), "starred": True})
+    assert embedder.texts == ["Waves rolling onto a sandy beach", description]
+    assert db_session.query(PhotoEmbedding).filter(PhotoEmbedding.user_id == user_id).count() == 2
+
+    # the search only embeds the query
+    hits = client.get(f"/users/{user_id}/photos/search?q=beaches").json()
+    assert hits[0]["photo_id"] == str(photo_ids[0])
+    assert embedder.texts[2:] == ["beaches"]
+
+
+def test_index_picks_up_vectors_that_committed_late(seed_photos, db_session, embedder):
+    from datetime import timedelta
+    from sqlalchemy import update
+    from database import Photo, PhotoEmbedding
+    from api.search import load_index, sync_embeddings
+
+    user_id, photo_ids = seed_photos(2)
+    for photo_id, description in zip(photo_ids, ["A cat on the roof", "A red car"]):
+        db_session.get(Photo, photo_id).description = description
+    db_session.commit()
+    sync_embeddings(db_session, user_id, embedder)
+    index = load_index(db_session, user_id, embedder)
+    newest = max(row.time_embedded for row in db_session.query(PhotoEmbedding).filter(PhotoEmbedding.user_id == user_id))
+
+    # another sync replaces a vector, stamped just before the newest row the index has seen
+    matrix, scales = quantize(embedder.embed(["A dog in the garden"]))
+    db_session.execute(update(PhotoEmbedding).where(PhotoEmbedding.photo_id == photo_ids[0])
+                       .values(vector=matrix[0].tobytes(), scale=float(scales[0]),
+                               time_embedded=newest - timedelta(seconds=1)))
+    db_session.commit()
+
+    query = embedder.embed(["dog garden"])[0]
+    assert index.search(query, 1)[0][1] <= 0
+    assert load_index(db_session, user_id, embedder).search(query, 1)[0][0] == photo_ids[0]
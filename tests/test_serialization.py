@@ -0,0 +1,75 @@
+import json
+import pytest
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+from fastapi.encoders import jsonable_encoder
+
+from models import JournalResponse, PhotoResponse
+from api.serialization import journal_list, photo_list, FastJSONResponse
+
+
+def make_photo(**overrides):
+    now = datetime.utcnow()
+    fields = dict(photo_id=uuid.uuid4(), user_id=uuid.uuid4(), device_id=uuid.uuid4(), journal_id=None,
+                  time_created=now, time_modified=now, url="https://example.com/a.jpg",
+                  description="A squirrel on a branch", file_name="a.jpg", location="Park")
+    fields.update(overrides)
+    return SimpleNamespace(**fields)
+
+
+def test_fast_path_matches_validated_response():
+    """
+    Test case for the trusted-row path producing the same JSON as response_model validation
+    """
+    rows = [make_photo(), make_photo(journal_id=uuid.uuid4(), description=None)]
+    expected = jsonable_encoder([PhotoResponse.model_validate(row) for row in rows])
+
+    assert json.loads(photo_list.dump(rows)) == expected
+    assert json.loads(photo_list.dump(rows, validate=True)) == expected
+
+
+def test_fast_path_fills_fields_missing_on_the_row():
+    now = datetime.utcnow()
+    row = SimpleNamespace(journal_id=uuid.uuid4(), user_id=uuid.uuid4(), title="Day one", description="# Day one",
+                          time_created=now, time_modified=now, starred=False)
+
+    data = json.loads(journal_list.dump([row]))
+
+    assert data == jsonable_encoder([JournalResponse.model_validate(row)])
+    assert data[0]["tags"] is None
+
+
+def test_fast_json_response_encodes_uuid_and_datetime():
+    photo_id = uuid.uuid4()
+    response = FastJSONResponse({"photo_id": photo_id, "time_created": datetime(2024, 8, 1, 12, 30)})
+
+    assert json.loads(response.body) == {"photo_id": str(photo_id), "time_created": "2024-08-01T12:30:00"}
+
+
+def test_parse_fields():
+    """
+    Test case for resolving the fields= projection parameter
+    """
+    from models import PhotoSummary
+
+    assert photo_list.parse_fields(None, PhotoSummary, "photo_id") == list(PhotoResponse.model_fields)
+    assert photo_list.parse_fields("summary", PhotoSummary, "photo_id") == list(PhotoSummary.model_fields)
+    assert "description" not in photo_list.parse_fields("summary", PhotoSummary, "photo_id")
+    assert photo_list.parse_fields("url, file_name", PhotoSummary, "photo_id") == ["photo_id", "url", "file_name"]
+    with pytest.raises(ValueError):
+        photo_list.parse_fields("url,password_hash", PhotoSummary, "photo_id")
+
+
+def test_projection_only_reads_selected_fields():
+    class Row:
+        photo_id = uuid.uuid4()
+        url = "https://example.com/a.jpg"
+
+        @property
+        def description(self):
+            raise AssertionError("description must not be loaded")
+
+    assert json.loads(photo_list.dump([Row()], fields=["photo_id", "url"])) == \
+        [{"photo_id": str(Row.photo_id), "url": Row.url}]
@@ -0,0 +1,112 @@
+import asyncio
+import uuid
+
+from sqlmodel import Session
+
+from database import engine, Photo
+from api.providers import StubProvider
+from api.singleflight import DatabaseLease, SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        results = await asyncio.gather(*[flight.do("photo", work) for _ in range(5)], flight.do("other", work))
+        return results, flight.inflight("photo")
+
+    results, inflight = asyncio.run(run())
+    assert results == ["done"] * 6
+    assert len(calls) == 2
+    assert not inflight
+
+
+def test_failures_reach_every_caller_and_cancelled_callers_do_not_cancel_the_call():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.05)
+        raise ValueError("model unavailable")
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        failing = await asyncio.gather(flight.do("a", fail), flight.do("a", fail), return_exceptions=True)
+        leader = asyncio.ensure_future(flight.do("b", work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("b", work))
+        leader.cancel()
+        return failing, await follower
+
+    failing, result = asyncio.run(run())
+    assert all(isinstance(error, ValueError) for error in failing)
+    assert result == "done"
+
+
+def test_describe_photo_calls_the_model_once(app, seed_photos):
+    from api.jobs import describe_photo
+
+    _, (photo_id,) = seed_photos(1)
+    provider = StubProvider(latency=0.05)
+
+    async def run():
+        return await asyncio.gather(*[describe_photo(photo_id, "https://example.com/a.jpg", provider) for _ in range(3)])
+
+    descriptions = asyncio.run(run())
+    assert len(set(descriptions)) == 1
+    assert provider.calls == [("describe_image", "https://example.com/a.jpg")]
+    with Session(engine) as session:
+        assert session.get(Photo, photo_id).description == descriptions[0]
+
+
+def test_lease_is_exclusive_until_released_or_expired(app):
+    lease = DatabaseLease(lambda: Session(engine))
+    name = f"test:{uuid.uuid4()}"
+
+    assert lease.acquire(name, "worker-1")
+    assert not lease.acquire(name, "worker-2")
+    lease.release(name, "worker-2")  # not the owner: no effect
+    assert lease.held(name)
+    lease.release(name, "worker-1")
+    assert lease.acquire(name, "worker-2")
+
+    expired = DatabaseLease(lambda: Session(engine), ttl=-1)
+    assert expired.acquire(f"{name}:expired", "worker-1")
+    assert lease.acquire(f"{name}:expired", "worker-2")
+
+
+def test_describe_photo_waits_for_another_worker(app, seed_photos, monkeypatch):
+    """
+    Test case for the cross-worker lease: the photo being described elsewhere is not described again
+    """
+    import api.jobs
+    from api.jobs import describe_photo
+
+    monkeypatch.setattr(api.jobs, "DESCRIBE_LEASES", True)
+    _, (photo_id,) = seed_photos(1)
+    lease = DatabaseLease(lambda: Session(engine), poll=0.01)
+    assert lease.acquire(f"describe:{photo_id}", "other-worker")
+    provider = StubProvider()
+
+    async def other_worker():
+        await asyncio.sleep(0.1)
+        with Session(engine) as session:
+            session.get(Photo, photo_id).description = "Described by the other worker"
+            session.commit()
+        lease.release(f"describe:{photo_id}", "other-worker")
+
+    async def run():
+        description, _ = await asyncio.gather(describe_photo(photo_id, "https://example.com/a.jpg", provider),
+                                              other_worker())
+        return description
+
+    assert asyncio.run(run()) == "Described by the other worker"
+    assert provider.calls == []
@@ -0,0 +1,66 @@
+import pytest
+
+from api.tags import normalize_tags
+
+
+def test_normalize_tags():
+    assert normalize_tags(["  Road Trip ", "road   trip", "Food", "", None]) == ["road trip", "food"]
+    with pytest.raises(ValueError):
+        normalize_tags(["x" * 65])
+
+
+@pytest.fixture
+def journals(client, seed_photos):
+    user_id, _ = seed_photos(0)
+
+    def create(title, tags, is_public=False):
+        response = client.post(f"/users/{user_id}/journals", json={"title": title, "tags": tags, "is_public": is_public})
+        assert response.status_code == 200
+        return response.json()
+
+    return user_id, create
+
+
+def titles(client, url):
+    response = client.get(url)
+    assert response.status_code == 200, response.text
+    return sorted(journal["title"] for journal in response.json())
+
+
+def test_filter_journals_by_any_or_all_tags(client, journals, count_queries):
+    user_id, create = journals
+    create("Lisbon", ["Travel", "food"], is_public=True)
+    create("Porto", ["travel"])
+    create("Ramen", ["food"])
+    create("Untagged", [])
+
+    url = f"/users/{user_id}/journals"
+    assert titles(client, f"{url}?tags=travel,food") == ["Lisbon", "Porto", "Ramen"]
+    assert titles(client, f"{url}?tags=travel,FOOD&tags_match=all") == ["Lisbon"]
+    assert titles(client, f"{url}?tags=hiking") == []
+    assert titles(client, f"{url}?is_public=true") == ["Lisbon"]
+    assert client.get(f"{url}?tags=travel&tags_match=some").status_code == 422
+
+    with count_queries() as statements:
+        listed = client.get(f"{url}?fields=summary&limit=100").json()
+    assert {journal["title"]: journal["tags"] for journal in listed}["Lisbon"] == ["food", "travel"]
+    # user, then journals joined with their tags
+    assert len(statements) == 2
+
+
+def test_tag_counts_follow_updates_and_deletes(client, journals):
+    user_id, create = journals
+    lisbon = create("Lisbon", ["travel", "food"])
+    porto = create("Porto", ["travel"])
+
+    assert client.get(f"/users/{user_id}/tags").json() == [{"name": "travel", "journal_count": 2},
+                                                          {"name": "food", "journal_count": 1}]
+
+    updated = client.put(f"/users/{user_id}/journals/{lisbon['journal_id']}", json={"tags": ["wine", "travel"]}).json()
+    assert updated["tags"] == ["travel", "wine"]
+    assert client.get(f"/users/{user_id}/tags").json() == [{"name": "travel", "journal_count": 2},
+                                                          {"name": "wine", "journal_count": 1}]
+
+    assert client.delete(f"/users/{user_id}/journals/{lisbon['journal_id']}").status_code == 200
+    assert client.get(f"/users/{user_id}/tags").json() == [{"name": "travel", "journal_count": 1}]
+    assert client.put(f"/users/{user_id}/journals/{porto['journal_id']}", json={"tags": ["x" * 65]}).status_code == 400
@@ -0,0 +1,34 @@
+import uuid
+
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.schema import CreateTable
+
+
+def test_uuids_are_binary_on_mysql_and_hex_elsewhere(app):
+    from database import Photo
+    from database.database import BinaryUUID
+
+    value = uuid.uuid4()
+    key = BinaryUUID()
+    assert key.process_bind_param(value, mysql.dialect()) == value.bytes
+    assert key.process_bind_param(str(value), mysql.dialect()) == value.bytes
+    assert key.process_bind_param(value.bytes, mysql.dialect()) == value.bytes
+    assert key.process_bind_param(value, sqlite.dialect()) == value.hex
+    assert key.process_result_value(value.bytes, mysql.dialect()) == value
+    assert key.process_result_value(value.hex, sqlite.dialect()) == value
+
+    ddl = str(CreateTable(Photo.__table__).compile(dialect=mysql.dialect()))
+    assert "photo_id BINARY(16) NOT NULL" in ddl
+    assert "journal_id BINARY(16)," in ddl
+    assert "CHAR(32)" in str(CreateTable(Photo.__table__).compile(dialect=sqlite.dialect()))
+
+
+def test_uuid_keys_round_trip(db_session, seed_photos):
+    from database import Photo
+
+    user_id, photo_ids = seed_photos(2)
+    db_session.expire_all()
+
+    photos = db_session.query(Photo).filter(Photo.photo_id.in_(photo_ids), Photo.user_id == str(user_id)).all()
+    assert sorted(photo.photo_id for photo in photos) == sorted(photo_ids)
+    assert all(isinstance(photo.user_id, uuid.UUID) for photo in photos)